@@ -0,0 +1,205 @@
+# comment_filter.py
+# - コメント取り込み時の除外ルールをまとめて判定するエンジン
+# - 本文ルールは1本の正規表現（名前付きグループの選択）にコンパイルし、1回の走査で判定する
+# - ルールごとの除外件数と、フィールドごとの判定時間は呼び出しごとの FilterStats に記録する
+# - 追加ルールは JSON で指定できる:
+#     {"rules": [{"name": "bot_signature", "pattern": "I am a bot", "field": "body"},
+#                {"name": "known_bots", "pattern": "\\A(?:RemindMeBot|sneakpeekbot)\\Z", "field": "author", "ignore_case": false}]}
+from __future__ import annotations
+import json
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List
+
+from fetch_data import IMAGE_EXTENSIONS
+
+AD_KEYWORDS = [
+    r"\b(sponso?red?|affiliate)\b",
+    r"\b(discount|promo|coupon|deal)\b",
+    r"\b(ref(erral)?\s*code)\b",
+    r"\b(shop|store|merch)\b",
+]
+
+@dataclass
+class FilterRule:
+    name: str
+    pattern: str
+    field: str = "body"       # "body" または "author"
+    ignore_case: bool = True
+
+def default_rules() -> List[FilterRule]:
+    """fetch_all の従来の判定（AutoModerator / 削除済み / 画像リンク / 広告）と同じ内容"""
+    exts = "|".join(re.escape(e.lstrip(".")) for e in IMAGE_EXTENSIONS)
+    return [
+        FilterRule("automoderator", r"\AAutoModerator\Z", field="author", ignore_case=False),
+        FilterRule("deleted", r"\A\s*(?:\[(?:deleted|removed)\]\s*)?\Z", ignore_case=False),
+        # URL（http は大文字小文字を区別）のどこかに画像拡張子を含む
+        FilterRule("image_link", rf"(?-i:https?://)\S*?\.(?:{exts})"),
+        # 本文に http があり、かつ ref/coupon/promo を含む（語順・位置は問わない）
+        FilterRule("ad_link", r"\A(?=[\s\S]*http)(?=[\s\S]*(?:ref|coupon|promo))"),
+        FilterRule("ad_keyword", "|".join(AD_KEYWORDS)),
+    ]
+
+def load_rules(path: str) -> List[FilterRule]:
+    """JSON 設定ファイルから追加ルールを読む"""
+    with open(path, "r", encoding="utf-8") as f:
+        conf = json.load(f)
+    rules = []
+    for i, r in enumerate(conf.get("rules", [])):
+        if not r.get("pattern"):
+            raise ValueError(f"{path}: rules[{i}] に pattern がありません")
+        rules.append(FilterRule(
+            name=r.get("name") or f"custom_{i}",
+            pattern=r["pattern"],
+            field=r.get("field", "body"),
+            ignore_case=bool(r.get("ignore_case", True)),
+        ))
+    return rules
+
+_GLOBAL_FLAGS_RE = re.compile(r"\(\?[aiLmsux]+\)")
+
+def _unsupported_syntax(pattern: str) -> str | None:
+    """
+    1本にまとめると意味が変わる／コンパイルできなくなる書き方を探す。
+    - 番号付き後方参照（\\1 など）: まとめるとグループ番号がずれて別のグループを指す
+    - 全体フラグ（(?i) など）: 先頭以外に置けないので、まとめた正規表現がコンパイルできない
+      （範囲を限ったフラグ (?i:...) や、ルールの ignore_case を使う）
+    """
+    i, n, in_class = 0, len(pattern), False
+    while i < n:
+        c = pattern[i]
+        if c == "\\":
+            nxt = pattern[i + 1:i + 2]
+            # \1〜\99 は後方参照（\0 や3桁の \1nn は8進のエスケープ）
+            if not in_class and nxt in "123456789" and nxt and not re.match(r"[0-3][0-7]{2}", pattern[i + 1:i + 4]):
+                return f"番号付きの後方参照 \\{nxt} は使えません（名前付きグループ (?P<name>...) と (?P=name) を使う）"
+            i += 2
+            continue
+        if in_class:
+            if c == "]":
+                in_class = False
+        elif c == "[":
+            in_class = True
+            # 先頭の ^ と ] は文字クラスの中身
+            i += 1
+            if pattern[i:i + 1] == "^":
+                i += 1
+            if pattern[i:i + 1] == "]":
+                i += 1
+            continue
+        elif c == "(":
+            m = _GLOBAL_FLAGS_RE.match(pattern, i)
+            if m:
+                return f"全体フラグ {m.group(0)} は使えません（(?i:...) のように範囲を限るか ignore_case を使う）"
+        i += 1
+    return None
+
+def _combine(rules: List[FilterRule]) -> re.Pattern | None:
+    if not rules:
+        return None
+    alts = []
+    for i, r in enumerate(rules):
+        try:
+            re.compile(r.pattern)
+        except re.error as e:
+            raise ValueError(f"ルール '{r.name}' の正規表現が不正です: {e}") from e
+        problem = _unsupported_syntax(r.pattern)
+        if problem:
+            raise ValueError(f"ルール '{r.name}' の正規表現: {problem}")
+        flag = "(?i:" if r.ignore_case else "(?:"
+        alts.append(f"(?P<r{i}>{flag}{r.pattern}))")
+    try:
+        return re.compile("|".join(alts))
+    except re.error as e:
+        # 単体では通るのにまとめると失敗する（グループ名の重複など）: 最初に失敗するルールを探して名指しする
+        for k in range(len(alts)):
+            try:
+                re.compile("|".join(alts[:k + 1]))
+            except re.error:
+                raise ValueError(f"ルール '{rules[k].name}' の正規表現を他のルールとまとめられません: {e}") from e
+        raise ValueError(f"除外ルールをまとめた正規表現が不正です: {e}") from e
+
+class FilterStats:
+    """
+    1回の取り込み（fetch_post_threads など）ぶんの判定の集計。CommentFilter 自体は状態を持たないので、
+    呼び出しごとにこれを作って check / reject_reason に渡す（スレッド間で共有しない）。
+    """
+
+    def __init__(self, rule_names: Iterable[str] = ()):
+        self.checked = 0
+        self.rejects: Dict[str, int] = {n: 0 for n in rule_names}
+        self.seconds: Dict[str, float] = {"author": 0.0, "body": 0.0}
+
+    def summary(self) -> str:
+        """ログ用: "automoderator=3, deleted=1" のような文字列（除外なしなら "none"）"""
+        return ", ".join(f"{k}={v}" for k, v in self.rejects.items() if v) or "none"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"checked": self.checked, "rejects": dict(self.rejects), "seconds": dict(self.seconds)}
+
+class CommentFilter:
+    """
+    除外ルールをフィールドごとに1本の正規表現へまとめた判定器。
+    同じ位置で複数のルールが当たる場合は、先に登録したルールの除外として数える。
+    判定器は集計を持たない（共有してよい）。集計が必要なら new_stats() の FilterStats を渡す。
+    """
+
+    def __init__(self, rules: List[FilterRule]):
+        for r in rules:
+            if r.field not in ("body", "author"):
+                raise ValueError(f"ルール '{r.name}' の field は body/author のどちらかです: {r.field}")
+        self.rules = list(rules)
+        self._by_field: Dict[str, List[FilterRule]] = {
+            f: [r for r in rules if r.field == f] for f in ("author", "body")
+        }
+        self._compiled = {f: _combine(rs) for f, rs in self._by_field.items()}
+
+    @classmethod
+    def from_config(cls, path: str | None = None) -> "CommentFilter":
+        """既定ルール + （指定があれば）JSON の追加ルール"""
+        rules = default_rules()
+        if path:
+            rules += load_rules(path)
+        return cls(rules)
+
+    def new_stats(self) -> FilterStats:
+        return FilterStats(r.name for r in self.rules)
+
+    def _match(self, field: str, text: str, stats: FilterStats | None) -> str | None:
+        pat = self._compiled[field]
+        if pat is None:
+            return None
+        if stats is None:
+            m = pat.search(text)
+        else:
+            t0 = time.perf_counter()
+            m = pat.search(text)
+            stats.seconds[field] += time.perf_counter() - t0
+        if m is None:
+            return None
+        return self._by_field[field][int(m.lastgroup[1:])].name
+
+    def reject_reason(self, author: str | None, body: str | None, stats: FilterStats | None = None) -> str | None:
+        """除外するならルール名、残すなら None。stats を渡したときだけ集計する"""
+        reason = self._match("author", author or "", stats) if author else None
+        if reason is None:
+            reason = self._match("body", body or "", stats)
+        if stats is not None:
+            stats.checked += 1
+            if reason is not None:
+                stats.rejects[reason] = stats.rejects.get(reason, 0) + 1
+        return reason
+
+    def check(self, comment: Any, stats: FilterStats | None = None) -> bool:
+        """praw の Comment（.author.name / .body を持つもの）を残すなら True"""
+        if comment is None:
+            return False
+        author = comment.author.name if comment.author else None
+        return self.reject_reason(author, comment.body, stats) is None
+
+    def filter_batch(self, comments: Iterable[Any], stats: FilterStats | None = None) -> List[Any]:
+        """残すコメントだけをリストで返す"""
+        return [c for c in comments if self.check(c, stats)]
+
+__all__ = ["AD_KEYWORDS", "FilterRule", "default_rules", "load_rules", "FilterStats", "CommentFilter"]
@@ -0,0 +1,168 @@
+# comment_index.py
+# - これまでに取得した全コメントを SQLite（FTS5 全文検索）に貯めて検索する
+# - main_b.py が取得のたびに ingest する。キーはコメントID（再取得時は score 等を更新）
+# 実行例:
+#   python comment_index.py "zero retreat" --days 30
+#   python comment_index.py "Starmie EX" --term --days 30     # glossary の表記ゆれもまとめて検索
+from __future__ import annotations
+import argparse
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List
+
+from glossary import GlossaryMatcher, load_compiled_glossary
+
+INDEX_PATH = os.path.join("data", "comments.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions(
+    id TEXT PRIMARY KEY, title TEXT, permalink TEXT, fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS comments(
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    submission_id TEXT,
+    thread_id TEXT,
+    author TEXT,
+    score INTEGER,
+    created_utc REAL,
+    body TEXT,
+    permalink TEXT
+);
+CREATE INDEX IF NOT EXISTS comments_created ON comments(created_utc);
+CREATE INDEX IF NOT EXISTS comments_submission ON comments(submission_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+    body, content='comments', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS comments_ai AFTER INSERT ON comments BEGIN
+    INSERT INTO comments_fts(rowid, body) VALUES (new.rowid, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_ad AFTER DELETE ON comments BEGIN
+    INSERT INTO comments_fts(comments_fts, rowid, body) VALUES ('delete', old.rowid, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS comments_au AFTER UPDATE OF body ON comments BEGIN
+    INSERT INTO comments_fts(comments_fts, rowid, body) VALUES ('delete', old.rowid, old.body);
+    INSERT INTO comments_fts(rowid, body) VALUES (new.rowid, new.body);
+END;
+"""
+
+def _phrase(s: str) -> str:
+    """FTS5 のフレーズ（"..."）として安全に埋め込む"""
+    return '"' + s.replace('"', '""') + '"'
+
+class CommentIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def ingest(self, post: Dict[str, Any], submission_id: str | None = None) -> int:
+        """fetch_post_threads の戻り値を取り込み、取り込んだコメント数を返す"""
+        sid = submission_id or post.get("submission_id")
+        if not sid:
+            from fetch_all import submission_id_from
+            sid = submission_id_from(post.get("permalink", ""))
+        rows = []
+        for th in post.get("threads", []):
+            tid = th["top"]["id"]
+            for c in [th["top"], *th["replies"]]:
+                rows.append((c["id"], sid, tid, c.get("author"), c.get("score"),
+                             c.get("created_utc"), c.get("body", ""), c.get("permalink")))
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO submissions(id, title, permalink, fetched_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET title=excluded.title, permalink=excluded.permalink, "
+                "fetched_at=excluded.fetched_at",
+                (sid, post.get("title"), post.get("permalink"), post.get("fetched_at", time.time())),
+            )
+            self.conn.executemany(
+                "INSERT INTO comments(id, submission_id, thread_id, author, score, created_utc, body, permalink) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET score=excluded.score, body=excluded.body",
+                rows,
+            )
+        return len(rows)
+
+    def search(
+        self,
+        query: str | None = None,
+        since_days: float | None = None,
+        submission_id: str | None = None,
+        limit: int = 20,
+        order: str = "score",
+    ) -> List[Dict[str, Any]]:
+        """
+        query は FTS5 の検索式（例: 'zero retreat', '"starmie ex" OR starmieex'）。
+        order は "score"（高い順）/ "new"（新しい順）/ "rank"（全文検索の関連度順）。
+        """
+        where, args = [], []
+        if query:
+            where.append("c.rowid IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)")
+            args.append(query)
+        if since_days is not None:
+            where.append("c.created_utc >= ?")
+            args.append(time.time() - since_days * 86400)
+        if submission_id:
+            where.append("c.submission_id = ?")
+            args.append(submission_id)
+        order_sql = {
+            "score": "c.score DESC",
+            "new": "c.created_utc DESC",
+            "rank": "(SELECT rank FROM comments_fts WHERE comments_fts MATCH ? AND rowid = c.rowid)",
+        }.get(order)
+        if order_sql is None:
+            raise ValueError(f"order は score/new/rank のいずれかです: {order}")
+        if order == "rank":
+            if not query:
+                raise ValueError("order='rank' には query が必要です")
+            args.append(query)
+        sql = (
+            "SELECT c.id, c.submission_id, c.thread_id, c.author, c.score, c.created_utc, c.body, c.permalink, "
+            "s.title AS submission_title FROM comments c LEFT JOIN submissions s ON s.id = c.submission_id"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + f" ORDER BY {order_sql} LIMIT ?"
+        )
+        args.append(limit)
+        return [dict(r) for r in self.conn.execute(sql, args)]
+
+    def search_term(self, term: str, matcher: GlossaryMatcher | None = None, **kwargs) -> List[Dict[str, Any]]:
+        """
+        glossary の語（英語名か日本語名）で検索する。表記ゆれ（aliases）はすべて OR で含める。
+        glossary に無い語はそのままフレーズ検索。
+        """
+        matcher = matcher or load_compiled_glossary()
+        key = term.strip().casefold()
+        aliases = [term]
+        for i, (en, ja) in enumerate(zip(matcher.en, matcher.ja)):
+            if en.casefold() == key or ja == term.strip():
+                aliases = matcher.aliases[i]
+                break
+        return self.search(" OR ".join(_phrase(a) for a in aliases), **kwargs)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("query", help="検索語（FTS5 の検索式、--term なら glossary の語）")
+    ap.add_argument("--term", action="store_true", help="glossary の表記ゆれもまとめて検索する")
+    ap.add_argument("--days", type=float, help="直近 N 日のコメントに限る")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--order", default="score", choices=["score", "new", "rank"])
+    args = ap.parse_args()
+
+    idx = CommentIndex()
+    t0 = time.perf_counter()
+    if args.term:
+        hits = idx.search_term(args.query, since_days=args.days, limit=args.limit, order=args.order)
+    else:
+        hits = idx.search(args.query, since_days=args.days, limit=args.limit, order=args.order)
+    dt = (time.perf_counter() - t0) * 1000
+    for h in hits:
+        body = h["body"].replace("\n", " ")
+        print(f"▲{h['score']:>5}  [{h['author']}] {body[:90]}")
+        print(f"        {h['permalink']}")
+    print(f"[i] {len(hits)} hits ({dt:.1f} ms)")
@@ -0,0 +1,171 @@
+# comment_store.py
+# - 取得したスレッド群（fetch_post_threads の戻り値）を列指向でコンパクトに持つ
+# - 本文は UTF-8 の1本のバッファ＋オフセットで持ち、アクセスされたときだけ文字列に戻す
+# - permalink は投稿の permalink + コメントID から作れるので保存しない（作れないものだけ個別に保存）
+# - ディスク上は msgpack（数値列は array のバイト列のまま書く）
+# - パイプライン（main_b）はどの段も全コメントの本文を読むので、使うときは to_post() で dict に戻す。
+#   表のまま持つのは fetch_all の生データキャッシュの読み込み（取得条件・時刻の確認）まで
+from __future__ import annotations
+import math
+import os
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List
+
+import msgpack
+
+FORMAT_VERSION = 1
+
+class CommentTable:
+    """
+    1投稿ぶんのコメントを列ごとに持つ表。行 i は1コメント。
+    thread_starts[k] はスレッド k の先頭行（トップコメント）で、次のスレッドの先頭までがその返信。
+    """
+
+    def __init__(self):
+        self.meta: Dict[str, Any] = {}          # title / permalink などスレッド以外の値
+        self.ids: List[str] = []
+        self.author_names: List[str] = []       # 著者名の辞書（同じ著者は1回だけ持つ）
+        self.author_idx = array("I")
+        self.scores = array("q")
+        self.created = array("d")               # created_utc（無い場合は NaN）
+        self.body_offsets = array("Q", [0])
+        self.body_buf = b""
+        self.thread_starts = array("I")
+        self.thread_scores = array("d")
+        self.permalink_overrides: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def num_threads(self) -> int:
+        return len(self.thread_starts)
+
+    # ---- 変換 ----
+    @classmethod
+    def from_post(cls, post: Dict[str, Any]) -> "CommentTable":
+        t = cls()
+        t.meta = {k: v for k, v in post.items() if k != "threads"}
+        base = t.meta.get("permalink", "")
+        author_pos: Dict[str, int] = {}
+        chunks: List[bytes] = []
+        total = 0
+        for th in post.get("threads", []):
+            t.thread_starts.append(len(t.ids))
+            t.thread_scores.append(float(th.get("score", 0.0)))
+            for c in [th["top"], *th["replies"]]:
+                t.ids.append(c["id"])
+                author = c.get("author") or "[deleted]"
+                pos = author_pos.get(author)
+                if pos is None:
+                    pos = author_pos[author] = len(t.author_names)
+                    t.author_names.append(author)
+                t.author_idx.append(pos)
+                t.scores.append(int(c.get("score") or 0))
+                created = c.get("created_utc")
+                t.created.append(float(created) if created is not None else math.nan)
+                b = (c.get("body") or "").encode("utf-8")
+                chunks.append(b)
+                total += len(b)
+                t.body_offsets.append(total)
+                link = c.get("permalink")
+                if link and link != f"{base}{c['id']}/":
+                    t.permalink_overrides[c["id"]] = link
+        t.body_buf = b"".join(chunks)
+        return t
+
+    def body(self, i: int) -> str:
+        return self.body_buf[self.body_offsets[i]:self.body_offsets[i + 1]].decode("utf-8")
+
+    def permalink(self, i: int) -> str:
+        cid = self.ids[i]
+        return self.permalink_overrides.get(cid) or f"{self.meta.get('permalink', '')}{cid}/"
+
+    def row(self, i: int) -> Dict[str, Any]:
+        created = self.created[i]
+        return {
+            "id": self.ids[i],
+            "author": self.author_names[self.author_idx[i]],
+            "body": self.body(i),
+            "score": self.scores[i],
+            "created_utc": None if math.isnan(created) else created,
+            "permalink": self.permalink(i),
+        }
+
+    def iter_threads(self) -> Iterator[Dict[str, Any]]:
+        ends = list(self.thread_starts[1:]) + [len(self.ids)]
+        for start, end, score in zip(self.thread_starts, ends, self.thread_scores):
+            yield {
+                "top": self.row(start),
+                "replies": [self.row(i) for i in range(start + 1, end)],
+                "score": score,
+            }
+
+    def to_post(self) -> Dict[str, Any]:
+        """fetch_post_threads と同じ形の dict に戻す"""
+        return {**self.meta, "threads": list(self.iter_threads())}
+
+    def find(self, cid: str) -> int:
+        """コメントIDの行番号（無ければ -1）"""
+        try:
+            return self.ids.index(cid)
+        except ValueError:
+            return -1
+
+    # ---- msgpack ----
+    def to_bytes(self) -> bytes:
+        return msgpack.packb({
+            "v": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "meta": self.meta,
+            "ids": self.ids,
+            "author_names": self.author_names,
+            "author_idx": self.author_idx.tobytes(),
+            "scores": self.scores.tobytes(),
+            "created": self.created.tobytes(),
+            "body_offsets": self.body_offsets.tobytes(),
+            "body_buf": self.body_buf,
+            "thread_starts": self.thread_starts.tobytes(),
+            "thread_scores": self.thread_scores.tobytes(),
+            "permalink_overrides": self.permalink_overrides,
+        }, use_bin_type=True)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CommentTable":
+        d = msgpack.unpackb(data, raw=False)
+        if d.get("v") != FORMAT_VERSION:
+            raise ValueError(f"未対応の形式です: v={d.get('v')}")
+        swap = d.get("byteorder") != sys.byteorder
+        t = cls()
+        t.meta = d["meta"]
+        t.ids = d["ids"]
+        t.author_names = d["author_names"]
+        t.body_buf = d["body_buf"]
+        t.permalink_overrides = d.get("permalink_overrides") or {}
+        for name, code in (("author_idx", "I"), ("scores", "q"), ("created", "d"), ("body_offsets", "Q"),
+                           ("thread_starts", "I"), ("thread_scores", "d")):
+            arr = array(code)
+            arr.frombytes(d[name])
+            if swap:
+                arr.byteswap()
+            setattr(t, name, arr)
+        return t
+
+def save_post(post: Dict[str, Any], path: str) -> None:
+    """fetch_post_threads の戻り値を msgpack で保存（途中で落ちても壊れたファイルを残さない）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(CommentTable.from_post(post).to_bytes())
+    os.replace(tmp, path)
+
+def load_table(path: str) -> CommentTable:
+    with open(path, "rb") as f:
+        return CommentTable.from_bytes(f.read())
+
+def load_post(path: str) -> Dict[str, Any]:
+    """save_post の逆。fetch_post_threads と同じ形の dict を返す"""
+    return load_table(path).to_post()
+
+__all__ = ["CommentTable", "save_post", "load_table", "load_post"]
@@ -0,0 +1,130 @@
+# dedup.py
+# - 「this」「same」や言い換えただけのジョークなど、ほぼ同じ内容のコメントを1件にまとめる
+# - 本文を正規化して 64bit SimHash を取り、ハミング距離が近いものを同一グループにする
+#   （16bit×4 のバンドで候補を絞るので、全ペア比較はしない。そのため距離は MAX_DISTANCE=3 まで）
+# - 短すぎる本文（3語以下）は SimHash が不安定なので、正規化後の完全一致で判定
+# - 正規化すると空になる本文（URLだけ・記号だけ）はまとめない
+# - グループの代表は score が最も高いコメント。代表に dup_count / dup_ids を付ける
+from __future__ import annotations
+import hashlib
+import re
+from typing import Any, Dict, List
+
+_URL_RE = re.compile(r"https?://\S+")
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+
+BANDS = 4                   # 64bit を 16bit ずつに分けたバンド数
+MAX_DISTANCE = BANDS - 1    # 鳩の巣原理で「どれか1バンドは一致する」と言える最大の距離
+
+def normalize_body(text: str) -> str:
+    t = _URL_RE.sub(" ", (text or "").lower())
+    t = _NON_WORD_RE.sub(" ", t)
+    return " ".join(t.split())
+
+def _hash64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(tokens: List[str]) -> int:
+    """単語 unigram + bigram を特徴量にした 64bit SimHash"""
+    feats = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    v = [0] * 64
+    for f in feats:
+        h = _hash64(f)
+        for i in range(64):
+            v[i] += 1 if (h >> i) & 1 else -1
+    out = 0
+    for i in range(64):
+        if v[i] > 0:
+            out |= 1 << i
+    return out
+
+def _check_distance(max_distance: int) -> None:
+    if not 0 <= max_distance <= MAX_DISTANCE:
+        raise ValueError(f"max_distance は 0〜{MAX_DISTANCE} で指定してください（{BANDS} バンドで取りこぼさない範囲）: {max_distance}")
+
+def _group(comments: List[Dict[str, Any]], max_distance: int) -> List[List[int]]:
+    """近い本文同士を union-find でまとめ、グループ（添字のリスト）を返す"""
+    _check_distance(max_distance)
+    parent = list(range(len(comments)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int) -> None:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[rj] = ri
+
+    exact: Dict[str, int] = {}
+    bands: Dict[tuple, List[int]] = {}
+    hashes: Dict[int, int] = {}
+    for i, c in enumerate(comments):
+        norm = normalize_body(c.get("body", ""))
+        if not norm:
+            continue  # 空の本文同士は同じ内容とはみなさない
+        tokens = norm.split()
+        if len(tokens) <= 3:
+            if norm in exact:
+                union(exact[norm], i)
+            else:
+                exact[norm] = i
+            continue
+        h = simhash(tokens)
+        hashes[i] = h
+        # 距離 max_distance(<=MAX_DISTANCE) 以内なら BANDS 個のバンドのどれかは必ず一致する
+        for b in range(BANDS):
+            key = (b, (h >> (16 * b)) & 0xFFFF)
+            for j in bands.get(key, []):
+                if bin(h ^ hashes[j]).count("1") <= max_distance:
+                    union(j, i)
+            bands.setdefault(key, []).append(i)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(comments)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+def collapse_comments(comments: List[Dict[str, Any]], max_distance: int = 3) -> List[Dict[str, Any]]:
+    """
+    ほぼ同じコメントを代表1件にまとめる（入力の順序は代表の位置で保つ）。
+    代表には dup_count（まとめた件数、自分を含む）と dup_ids（まとめた他のID）を付ける。
+    max_distance が 0〜MAX_DISTANCE の外なら ValueError。
+    """
+    _check_distance(max_distance)
+    if len(comments) < 2:
+        return list(comments)
+    keep: Dict[int, Dict[str, Any]] = {}
+    for members in _group(comments, max_distance):
+        rep = max(members, key=lambda i: (comments[i].get("score") or 0, -i))
+        if len(members) == 1:
+            keep[rep] = comments[rep]
+            continue
+        keep[rep] = {
+            **comments[rep],
+            "dup_count": sum(comments[i].get("dup_count", 1) for i in members),
+            "dup_ids": [comments[i]["id"] for i in members if i != rep],
+        }
+    return [keep[i] for i in sorted(keep)]
+
+def collapse_near_duplicates(threads: List[Dict[str, Any]], max_distance: int = 3) -> List[Dict[str, Any]]:
+    """
+    fetch_post_threads の threads に対して
+    - スレッドをまたいだトップコメント同士（代表以外のスレッドの返信は代表のスレッドに移す）
+    - 各スレッド内の返信同士
+    をまとめる。スレッドの並び順は変えない。移した返信を含め、返信は score 降順に並べ直す。
+    """
+    tops = collapse_comments([th["top"] for th in threads], max_distance)
+    by_id = {th["top"]["id"]: th for th in threads}
+    out = []
+    for top in tops:
+        merged = [by_id[tid] for tid in [top["id"], *top.get("dup_ids", [])]]
+        replies = [r for th in merged for r in th["replies"]]
+        if len(merged) > 1:
+            replies.sort(key=lambda r: r.get("score") or 0, reverse=True)
+        out.append({**by_id[top["id"]], "top": top, "replies": collapse_comments(replies, max_distance)})
+    return out
+
+__all__ = ["MAX_DISTANCE", "normalize_body", "simhash", "collapse_comments", "collapse_near_duplicates"]
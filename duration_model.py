@@ -0,0 +1,325 @@
+# duration_model.py
+# - 読み上げ時間（秒）を TTS 前に見積もるモデル
+# - 既存の (text_ja, voice, mp3 の長さ) の組（render_plan.json と data/tts/line_*.mp3）から、
+#   文字種ごとの文字数の線形回帰を声ごとに当てはめる（サンプルが少ない声は全体のモデルで代用）
+# - 翻訳前でも見積もれるよう、英語原文の長さ → 秒 のモデルも同時に当てはめる
+# - trim_plan: 見積もりが目標尺を超えるプランを、TTS（と翻訳）の前に低スコアの返信から削る
+# - 学習データは実行をまたいで data/cache/duration_samples.jsonl に貯める（同じ行は1回だけ）。
+#   直近の実行（render_plan.json と mp3）が前回から変わっていたら、load_duration_model がそれを取り込んで
+#   貯めた全サンプルから当てはめ直す（変わったかどうかはファイルのサイズ・更新時刻の指紋で判断）
+# 実行例:
+#   python duration_model.py            # 直近の実行を取り込み、貯めたサンプルから当てはめて保存、誤差を表示
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+RENDER_PLAN_PATH = os.path.join("data", "render_plan.json")
+TTS_DIR = os.path.join("data", "tts")
+MODEL_PATH = os.path.join("data", "cache", "duration_model.json")
+SAMPLES_PATH = os.path.join("data", "cache", "duration_samples.jsonl")
+MAX_SAMPLES = 5000      # 当てはめに使うのは新しい順にこの件数まで（声や話速の変化に追従する）
+MODEL_VERSION = 1
+
+# render_video.py のタイムラインと同じ間（タイトル後 0.2 秒、シーン末 SCENE_TAIL）
+TITLE_GAP_SEC = 0.2
+SCENE_TAIL_SEC = 0.30
+
+POOLED = "*"            # 声が不明／サンプル不足のときに使う全体モデル
+MIN_SAMPLES_PER_VOICE = 8
+_RIDGE = 1e-2
+
+# ---- MP3 の長さ（フレームヘッダを順にたどる。外部ライブラリ不要） ----
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def _frame_info(h: bytes) -> Tuple[int, int, int] | None:
+    """4バイトのフレームヘッダ → (フレーム長, サンプル数, サンプルレート)。ヘッダでなければ None"""
+    if h[0] != 0xFF or (h[1] & 0xE0) != 0xE0:
+        return None
+    version = (h[1] >> 3) & 3        # 3=MPEG1, 2=MPEG2, 0=MPEG2.5
+    layer = 4 - ((h[1] >> 1) & 3)    # 1, 2, 3
+    br_idx, sr_idx, pad = h[2] >> 4, (h[2] >> 2) & 3, (h[2] >> 1) & 1
+    if version == 1 or layer == 4 or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    bitrate = _BITRATES[(1 if version == 3 else 2, layer)][br_idx] * 1000
+    sr = _SAMPLE_RATES[version][sr_idx]
+    if layer == 1:
+        return (12 * bitrate // sr + pad) * 4, 384, sr
+    samples = 1152 if (layer == 2 or version == 3) else 576
+    return samples // 8 * bitrate // sr + pad, samples, sr
+
+def mp3_duration(path: str) -> float:
+    """MP3 の再生時間（秒）。ID3v2 タグと Xing/Info（VBR ヘッダ）フレームは数えない"""
+    with open(path, "rb") as f:
+        data = f.read()
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size + (10 if data[5] & 0x10 else 0)
+    seconds = 0.0
+    first = True
+    while pos + 4 <= len(data):
+        info = _frame_info(data[pos:pos + 4])
+        if info is None or info[0] <= 4:
+            pos += 1  # 同期が外れたら1バイトずつ探す
+            continue
+        length, samples, sr = info
+        if not (first and (b"Xing" in data[pos:pos + 64] or b"Info" in data[pos:pos + 64])):
+            seconds += samples / sr
+        first = False
+        pos += length
+    return seconds
+
+# ---- 特徴量 ----
+_KANA_RE = re.compile(r"[぀-ヿー]")
+_KANJI_RE = re.compile(r"[㐀-鿿]")
+_ALNUM_RE = re.compile(r"[A-Za-z0-9Ａ-Ｚａ-ｚ０-９]")
+_PAUSE_RE = re.compile(r"[、。，．,.!?！？…「」『』（）()\n]")
+
+JA_FEATURES = ("kana", "kanji", "alnum", "pause")
+
+def ja_features(text: str) -> List[float]:
+    """[1, かな数, 漢字数, 英数字数, 区切り記号数]（漢字は読みが長く、記号は間になる）"""
+    text = text or ""
+    return [1.0, len(_KANA_RE.findall(text)), len(_KANJI_RE.findall(text)),
+            len(_ALNUM_RE.findall(text)), len(_PAUSE_RE.findall(text))]
+
+def en_features(text: str) -> List[float]:
+    """[1, 英語原文の文字数]（翻訳前の見積もり用）"""
+    return [1.0, len((text or "").strip())]
+
+def _fit(X: List[List[float]], y: List[float]) -> List[float]:
+    """リッジ付き最小二乗（定数項は正則化しない）"""
+    A = np.asarray(X, dtype=np.float64)
+    b = np.asarray(y, dtype=np.float64)
+    reg = _RIDGE * np.eye(A.shape[1])
+    reg[0, 0] = 0.0
+    return np.linalg.solve(A.T @ A + reg, A.T @ b).tolist()
+
+class DurationModel:
+    """
+    読み上げ時間の見積もり。coef は声ごとの係数（POOLED は全体）、en_coef は英語原文からの係数。
+    学習データが無いときは reading_chars_per_sec（既定 5 文字/秒）相当の既定値を使う。
+    """
+
+    def __init__(self, coef: Dict[str, List[float]] | None = None, en_coef: List[float] | None = None,
+                 reading_chars_per_sec: float = 5.0, samples: int = 0):
+        per_char = 1.0 / reading_chars_per_sec
+        self.coef = coef or {POOLED: [0.3, per_char, per_char, per_char, 0.0]}
+        # 英語 → 日本語は文字数がおよそ 0.6 倍（editor.EN_TO_JA_CHAR_RATIO と同じ目安）
+        self.en_coef = en_coef or [0.3, 0.6 * per_char]
+        self.samples = samples
+
+    def predict(self, text_ja: str, voice: str | None = None) -> float:
+        """日本語テキスト1行の読み上げ秒数"""
+        c = self.coef.get(voice or POOLED) or self.coef[POOLED]
+        return max(0.0, float(np.dot(c, ja_features(text_ja))))
+
+    def predict_en(self, text_en: str) -> float:
+        """英語原文1件の（翻訳後の）読み上げ秒数"""
+        return max(0.0, float(np.dot(self.en_coef, en_features(text_en))))
+
+    def ja_chars_per_sec(self) -> float:
+        """全体モデルの1文字あたりの秒数から逆算した読み上げ速度（editor の reading_chars_per_sec 用）"""
+        c = self.coef[POOLED]
+        per_char = (c[1] + c[2]) / 2
+        return 1.0 / per_char if per_char > 0 else 5.0
+
+    @classmethod
+    def fit(cls, samples: List[Dict[str, Any]]) -> "DurationModel":
+        """
+        samples: [{"text_ja": str, "voice": str | None, "seconds": float, "text_en": str | None}, ...]
+        text_en は切り詰められていない原文のものだけ英語モデルの学習に使う。
+        """
+        if not samples:
+            return cls()
+        coef = {POOLED: _fit([ja_features(s["text_ja"]) for s in samples], [s["seconds"] for s in samples])}
+        by_voice: Dict[str, List[Dict[str, Any]]] = {}
+        for s in samples:
+            if s.get("voice"):
+                by_voice.setdefault(s["voice"], []).append(s)
+        for voice, rows in by_voice.items():
+            if len(rows) >= MIN_SAMPLES_PER_VOICE:
+                coef[voice] = _fit([ja_features(s["text_ja"]) for s in rows], [s["seconds"] for s in rows])
+        en_rows = [s for s in samples if s.get("text_en")]
+        en_coef = _fit([en_features(s["text_en"]) for s in en_rows], [s["seconds"] for s in en_rows]) if len(en_rows) >= 3 else None
+        return cls(coef=coef, en_coef=en_coef, samples=len(samples))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": MODEL_VERSION, "coef": self.coef, "en_coef": self.en_coef, "samples": self.samples}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DurationModel":
+        return cls(coef=d["coef"], en_coef=d["en_coef"], samples=d.get("samples", 0))
+
+def collect_samples(render_plan_path: str = RENDER_PLAN_PATH, tts_dir: str = TTS_DIR) -> List[Dict[str, Any]]:
+    """
+    render_plan.json の行と line_NNN.mp3 を並び順で対応させて学習データにする。
+    行数と mp3 の数が合わない（古い mp3 が混ざっている）ときは空を返す。
+    quote_en は 120 文字で切られているので、それより短いものだけ英語の学習に使う。
+    """
+    if not os.path.exists(render_plan_path):
+        return []
+    with open(render_plan_path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    items = [it for sc in plan.get("scenes", []) for it in sc.get("items", [])]
+    mp3s = sorted(p for p in os.listdir(tts_dir) if re.fullmatch(r"line_\d{3}\.mp3", p)) if os.path.isdir(tts_dir) else []
+    if not items or len(items) != len(mp3s):
+        print(f"[!] 学習データの行数が合いません: render_plan={len(items)}, mp3={len(mp3s)}")
+        return []
+    samples = []
+    for it, name in zip(items, mp3s):
+        en = it.get("quote_en") or ""
+        samples.append({
+            "text_ja": it.get("text_ja", ""),
+            "voice": it.get("voice"),
+            "seconds": mp3_duration(os.path.join(tts_dir, name)),
+            "text_en": en if len(en) < 120 else None,
+        })
+    title_mp3 = os.path.join(tts_dir, "title.mp3")
+    if plan.get("title_ja") and os.path.exists(title_mp3):
+        samples.append({"text_ja": plan["title_ja"], "voice": plan.get("title_voice"),
+                        "seconds": mp3_duration(title_mp3), "text_en": None})
+    return samples
+
+def samples_fingerprint(render_plan_path: str = RENDER_PLAN_PATH, tts_dir: str = TTS_DIR) -> str:
+    """学習データの指紋（ファイル名・サイズ・更新時刻のハッシュ）。中身は読まない"""
+    files = [render_plan_path]
+    if os.path.isdir(tts_dir):
+        files += sorted(os.path.join(tts_dir, p) for p in os.listdir(tts_dir)
+                        if re.fullmatch(r"line_\d{3}\.mp3|title\.mp3", p))
+    h = hashlib.sha256()
+    for p in files:
+        if os.path.exists(p):
+            st = os.stat(p)
+            h.update(f"{os.path.basename(p)}:{st.st_size}:{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def _sample_key(s: Dict[str, Any]) -> str:
+    return f"{s.get('voice')}\t{round(float(s['seconds']), 3)}\t{s.get('text_ja', '')}"
+
+def load_samples(path: str = SAMPLES_PATH) -> List[Dict[str, Any]]:
+    """貯めたサンプル（古い順）"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(ln) for ln in f if ln.strip()]
+
+def append_samples(samples: List[Dict[str, Any]], path: str = SAMPLES_PATH) -> int:
+    """まだ貯めていないサンプルだけを追記し、追記した件数を返す"""
+    known = {_sample_key(s) for s in load_samples(path)}
+    new = []
+    for s in samples:
+        key = _sample_key(s)
+        if key not in known:
+            known.add(key)
+            new.append(s)
+    if new:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for s in new:
+                f.write(json.dumps(s, ensure_ascii=False) + "\n")
+    return len(new)
+
+def save_duration_model(model: DurationModel, path: str = MODEL_PATH, source: str | None = None) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**model.to_dict(), "source": source}, f, ensure_ascii=False, indent=2)
+
+def load_duration_model(
+    path: str = MODEL_PATH,
+    render_plan_path: str = RENDER_PLAN_PATH,
+    tts_dir: str = TTS_DIR,
+    samples_path: str = SAMPLES_PATH,
+) -> DurationModel:
+    """
+    保存済みのモデルを読む。直近の実行の指紋が保存時と違えば、その実行のサンプルを samples_path に追記し、
+    貯めた全サンプル（新しい方から MAX_SAMPLES 件）で当てはめ直して保存する。
+    サンプルが1件も無いときは保存済みのモデル、それも無ければ既定値。
+    """
+    saved = None
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        if d.get("version") == MODEL_VERSION:
+            saved = d
+    source = samples_fingerprint(render_plan_path, tts_dir)
+    if saved is not None and saved.get("source") == source:
+        return DurationModel.from_dict(saved)
+    added = append_samples(collect_samples(render_plan_path, tts_dir), samples_path)
+    samples = load_samples(samples_path)[-MAX_SAMPLES:]
+    if not samples:
+        return DurationModel.from_dict(saved) if saved is not None else DurationModel()
+    if saved is not None and not added and saved.get("samples") == len(samples):
+        model = DurationModel.from_dict(saved)  # 新しいサンプルが無い（行数が合わない実行など）: 指紋だけ更新
+    else:
+        model = DurationModel.fit(samples)
+        print(f"[i] duration model refit: {len(samples)} samples (+{added})")
+    save_duration_model(model, path, source)
+    return model
+
+# ---- プランの尺の見積もりと事前トリム ----
+def plan_seconds(plan: Dict[str, Any], line_seconds: Dict[str, float], title_sec: float = 0.0) -> float:
+    """render_video.py と同じ組み方（タイトル + 間、各行、シーン末の間）での合計秒数"""
+    total = title_sec + (TITLE_GAP_SEC if title_sec else 0.0)
+    for sc in plan["scenes"]:
+        total += sum(line_seconds.get(cid, 0.0) for cid in sc.get("comment_order", [])) + SCENE_TAIL_SEC
+    return total
+
+def trim_plan(
+    plan: Dict[str, Any],
+    line_seconds: Dict[str, float],
+    scores: Dict[str, float],
+    target_sec: float,
+    title_sec: float = 0.0,
+    tolerance: float = 0.05,
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    見積もりが target_sec * (1 + tolerance) を超える間、score の低い返信から外す。
+    返信が尽きたら score の低いシーンごと外す（最低1シーンは残す）。
+    戻り値: (削ったプラン, 外したコメントID)
+    """
+    scenes = [{**sc, "comment_order": list(sc.get("comment_order", []))} for sc in plan["scenes"]]
+    trimmed = {**plan, "scenes": scenes}
+    dropped: List[str] = []
+    limit = target_sec * (1.0 + tolerance)
+    while plan_seconds(trimmed, line_seconds, title_sec) > limit:
+        replies = [(scores.get(cid, 0), si, cid) for si, sc in enumerate(scenes) for cid in sc["comment_order"][1:]]
+        if replies:
+            _, si, cid = min(replies)
+            scenes[si]["comment_order"].remove(cid)
+            dropped.append(cid)
+            continue
+        if len(scenes) <= 1:
+            break
+        si = min(range(len(scenes)), key=lambda i: scores.get(scenes[i]["comment_order"][0], 0))
+        dropped.extend(scenes.pop(si)["comment_order"])
+    return trimmed, dropped
+
+if __name__ == "__main__":
+    append_samples(collect_samples())
+    samples = load_samples()[-MAX_SAMPLES:]
+    if not samples:
+        raise SystemExit("[!] 学習データがありません（data/render_plan.json と data/tts/line_*.mp3）")
+    model = DurationModel.fit(samples)
+    save_duration_model(model, source=samples_fingerprint())
+    err = [abs(model.predict(s["text_ja"], s.get("voice")) - s["seconds"]) for s in samples]
+    en = [s for s in samples if s.get("text_en")]
+    err_en = [abs(model.predict_en(s["text_en"]) - s["seconds"]) for s in en]
+    total = sum(s["seconds"] for s in samples)
+    print(f"[i] samples: {len(samples)} ({total:.1f}s), voices: {', '.join(model.coef)}")
+    print(f"[i] ja model MAE: {np.mean(err):.2f}s / line, en model MAE: {np.mean(err_en):.2f}s / line ({len(en)} lines)")
+    print(f"[i] reading speed: {model.ja_chars_per_sec():.2f} chars/sec")
+    print(f"[i] saved: {MODEL_PATH}")
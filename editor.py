@@ -7,9 +7,20 @@
 # - Strict JSON only. If the LLM doesn't return the required top-level "scenes", this function raises ValueError.
 # - The OpenAI client is created INSIDE the function to ensure .env is loaded and OPENAI_API_KEY is available.
 # - Model is configurable via env OPENAI_MODEL_EDITOR (default: gpt-4o-mini).
+# - Plans are cached in data/cache/plans/<sha256>.json keyed by the compacted payload, model, system prompt
+#   (PROMPT_VERSION) and target_duration_sec, so re-running on unchanged input returns the identical plan.
+# - Posts with more threads than one prompt can hold are planned map-reduce style: parallel shortlist calls over
+#   thread shards, then one reduce call (with the usual ID validation) over the shortlisted threads.
+# - plan_script_locally() builds the same shape without any network call (score/diversity/length knapsack).
+#   plan_script(mode="llm") falls back to it when the LLM call or its validation fails; mode="fast" uses it directly.
 
 from __future__ import annotations
+import hashlib
 import json
+import math
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
 import os
 from dotenv import load_dotenv
@@ -37,55 +48,189 @@ def _compact_text(t: str, limit: int = 360) -> str:
         return t
     return t[:limit] + "…"
 
+# ---- Token-aware payload packing ----
+# Per-comment text limits: the best comment in the post gets PACK_MAX_CHARS, weak ones shrink towards PACK_MIN_CHARS.
+PACK_MIN_CHARS = 80
+PACK_MAX_CHARS = 600
+PACK_MAX_REPLIES = 6
+
+_ENCODINGS: Dict[str, Any] = {}
+
+def _tiktoken_encoding(model: str):
+    """
+    tiktoken encoding for the model, or None when it is unavailable. tiktoken downloads its BPE file on
+    first use, so an offline run or a proxy error also lands here and falls back to the estimate.
+    """
+    if model not in _ENCODINGS:
+        try:
+            import tiktoken
+            try:
+                _ENCODINGS[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _ENCODINGS[model] = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _ENCODINGS[model] = None
+        except Exception as e:
+            print(f"[!] tiktoken encoding unavailable, estimating tokens instead: {e}")
+            _ENCODINGS[model] = None
+    return _ENCODINGS[model]
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Token count with tiktoken if available; otherwise ~4 ASCII chars per token and 1 token per other char."""
+    enc = _tiktoken_encoding(model or _default_model_name())
+    if enc is not None:
+        return len(enc.encode(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def _char_limit(score: int, top_score: int) -> int:
+    if top_score <= 0:
+        return PACK_MIN_CHARS
+    w = math.log1p(max(0, score)) / math.log1p(top_score)
+    return int(PACK_MIN_CHARS + (PACK_MAX_CHARS - PACK_MIN_CHARS) * min(1.0, w))
+
+def _pack_comment(c: Dict[str, Any], top_score: int) -> Dict[str, Any]:
+    row = {"id": c["id"], "score": c["score"], "text": _compact_text(c["body"], _char_limit(c["score"], top_score))}
+    if c.get("dup_count", 1) > 1:
+        row["dups"] = c["dup_count"]
+    return row
+
+def pack_threads(
+    threads: List[Dict[str, Any]],
+    token_budget: int,
+    model: str | None = None,
+    max_replies: int = PACK_MAX_REPLIES,
+) -> tuple:
+    """
+    Greedily fill token_budget with threads in the given (score) order.
+    - Each comment's text is trimmed to a score-dependent length (PACK_MIN_CHARS..PACK_MAX_CHARS).
+    - A thread that does not fit loses its lowest replies first; packing stops at the first thread whose
+      top comment alone does not fit.
+    - Only id / score / text (and dups, and a thread's shortlist summary) are sent; thread_id and author
+      are not needed for planning.
+    Returns (payload, allowed_ids, tokens_used).
+    """
+    top_score = max((c["score"] for th in threads for c in [th["top"], *th["replies"][:max_replies]]), default=0)
+    payload: List[Dict[str, Any]] = []
+    allowed_ids: set[str] = set()
+    used = 0
+    for th in threads:
+        row = {"top": _pack_comment(th["top"], top_score),
+               "replies": [_pack_comment(r, top_score) for r in th["replies"][:max_replies]]}
+        if th.get("summary"):
+            row["summary"] = th["summary"]
+        cost = count_tokens(json.dumps(row, ensure_ascii=False), model) + 1
+        while used + cost > token_budget and row["replies"]:
+            row["replies"].pop()
+            cost = count_tokens(json.dumps(row, ensure_ascii=False), model) + 1
+        if used + cost > token_budget:
+            break
+        payload.append(row)
+        used += cost
+        allowed_ids.add(row["top"]["id"])
+        allowed_ids.update(r["id"] for r in row["replies"])
+    return payload, allowed_ids, used
+
+class PlanConfigError(ValueError):
+    """The planner cannot work with the given settings (cache mode, token budget). Never falls back to a local plan."""
+
+# Reading speeds are snapped to this step before they become budget_chars. A calibrated rate drifts a little
+# after every TTS run; without the snap each drift would change the prompt and miss the plan cache.
+PLAN_RATE_STEP = 0.5
+
+def _budget_chars(target_duration_sec: int, reading_chars_per_sec: float) -> int:
+    """Japanese narration budget for the planners (sane bounds, rate snapped to PLAN_RATE_STEP)."""
+    rate = round(max(3.0, reading_chars_per_sec) / PLAN_RATE_STEP) * PLAN_RATE_STEP
+    return int(max(60, target_duration_sec * rate))
+
 def _default_model_name() -> str:
     return os.getenv("OPENAI_MODEL_EDITOR", "gpt-4o-mini")
 
+# Reply budget (max_tokens) of the planning call.
+PLAN_REPLY_TOKENS = 1200
+# Context window per model family (longest matching prefix wins). Unknown models are not checked.
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+
+def _model_context_tokens(model: str) -> int | None:
+    match = max((p for p in MODEL_CONTEXT_TOKENS if model.startswith(p)), key=len, default=None)
+    return MODEL_CONTEXT_TOKENS[match] if match else None
+
+# Bump when the prompt or the cleaning rules change in a way the system prompt text does not capture.
+PROMPT_VERSION = 1
+PLAN_CACHE_DIR = os.path.join("data", "cache", "plans")
+PLAN_CACHE_MODES = ("use", "only", "refresh", "off")
+
+def _plan_cache_key(model: str, system: str, user: Dict[str, Any], target_duration_sec: int) -> str:
+    blob = json.dumps(
+        {"v": PROMPT_VERSION, "model": model, "system": system, "user": user, "target": target_duration_sec},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _load_cached_plan(path: str) -> Dict[str, Any] | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["plan"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _save_cached_plan(path: str, key: str, model: str, plan: Dict[str, Any]) -> None:
+    # A unique temp file per writer, so concurrent runs never write into each other's file.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path),
+                                     prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False) as f:
+        json.dump({"key": key, "model": model, "prompt_version": PROMPT_VERSION, "plan": plan},
+                  f, ensure_ascii=False, indent=2)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
 def plan_script_with_llm(
     title: str,
     threads: List[Dict[str, Any]],
     target_duration_sec: int = 180,
     reading_chars_per_sec: float = 5.0,
-    max_threads_for_prompt: int = 28,
+    max_threads_for_prompt: int | None = None,
     model: str | None = None,
+    input_token_budget: int = 8000,
+    cache: str = "use",
+    cache_dir: str = PLAN_CACHE_DIR,
+    map_reduce: bool | None = None,
+    max_workers: int = 16,
 ) -> Dict[str, Any]:
     """
     Build a 3-minute scene plan.
     - Each scene corresponds to one thread (top-level + selected replies).
     - Within a scene, comments are rendered top-to-bottom in the returned 'comment_order'.
     - If the LLM fails to return the strict 'scenes' schema, this function raises ValueError.
+    - The thread payload is packed into input_token_budget (system prompt included) by pack_threads;
+      max_threads_for_prompt optionally caps the number of threads considered.
+    - cache: "use" (return a cached plan for identical input, else call and store), "only" (never call the
+      model; FileNotFoundError on a miss), "refresh" (always call and overwrite), "off" (no cache).
+    - map_reduce: None switches to the two-stage planner automatically when not every thread fits the budget;
+      True forces it, False always truncates to what fits. Shortlist calls run on up to max_workers threads.
     """
-    client = _get_openai_client()
+    if cache not in PLAN_CACHE_MODES:
+        raise PlanConfigError(f"Unknown plan cache mode: {cache} (expected one of {', '.join(PLAN_CACHE_MODES)})")
     model = model or _default_model_name()
+    context = _model_context_tokens(model)
+    if context is not None and input_token_budget + PLAN_REPLY_TOKENS > context:
+        raise PlanConfigError(f"input_token_budget {input_token_budget} + reply {PLAN_REPLY_TOKENS} tokens exceeds "
+                         f"the {context}-token context of {model}")
 
     # Budget for narration length in Japanese (approximate)
-    budget_chars = int(max(60, target_duration_sec * max(3.0, reading_chars_per_sec)))  # keep sane bounds
-
-    # Reduce payload to control token usage
-    pick = threads[:max_threads_for_prompt]
-    payload: List[Dict[str, Any]] = []
-    allowed_ids: set[str] = set()
-    for th in pick:
-        allowed_ids.add(th["top"]["id"])
-        row = {
-            "thread_id": th["top"]["id"],
-            "top": {
-                "id": th["top"]["id"],
-                "score": th["top"]["score"],
-                "author": th["top"]["author"],
-                "text": _compact_text(th["top"]["body"]),
-            },
-            "replies": []
-        }
-        # Take up to 6 high-score replies (already sorted by fetcher)
-        for r in th["replies"][:6]:
-            row["replies"].append({
-                "id": r["id"],
-                "score": r["score"],
-                "author": r["author"],
-                "text": _compact_text(r["body"]),
-            })
-            allowed_ids.add(r["id"])
-        payload.append(row)
+    budget_chars = _budget_chars(target_duration_sec, reading_chars_per_sec)
 
     system = (
         "You are a senior YouTube script editor for a Japanese news-style channel covering Pokémon TCG.\n"
@@ -98,6 +243,8 @@ def plan_script_with_llm(
         "4) Design a 3-minute arc: intro -> key angles (pro/cons/tips) -> closing. Favor higher-score threads but keep diversity.\n"
         "5) No invented IDs, no new text. Use ONLY the IDs provided in the input JSON.\n"
         "6) Keep total narration budget around the provided 'budget_chars' (the caller will compose the narration later).\n"
+        "7) A comment's optional 'dups' is how many near-identical comments were merged into it; treat it as extra agreement.\n"
+        "8) A thread's optional 'summary' is a shortlisting note on why it was picked; use it to plan the arc.\n"
     )
 
     # Give the model an explicit JSON schema to reduce drift
@@ -113,10 +260,36 @@ def plan_script_with_llm(
     user = {
         "title": title,
         "budget_chars": budget_chars,
-        "threads": payload,
+        "threads": [],
         "expected_schema_example": schema_hint,
     }
 
+    # Fill the remaining input-token budget with threads (score order), most text for the best comments
+    base_tokens = count_tokens(system, model) + count_tokens(json.dumps(user, ensure_ascii=False), model)
+    thread_budget = input_token_budget - base_tokens
+    if thread_budget <= 0:
+        raise PlanConfigError(f"input_token_budget {input_token_budget} leaves no room for threads "
+                         f"(the prompt alone is ~{base_tokens} tokens)")
+    pick = threads[:max_threads_for_prompt] if max_threads_for_prompt else threads
+    payload, allowed_ids, used = pack_threads(pick, thread_budget, model)
+    if map_reduce or (map_reduce is None and len(payload) < len(pick)):
+        return _plan_map_reduce(title, pick, system, user, target_duration_sec, reading_chars_per_sec, model,
+                                input_token_budget, cache, cache_dir, max_workers)
+    user["threads"] = payload
+    print(f"[i] editor prompt: {len(payload)}/{len(pick)} threads, ~{base_tokens + used} tokens "
+          f"(budget {input_token_budget}, {'tiktoken' if _tiktoken_encoding(model) else 'estimate'})")
+
+    key = _plan_cache_key(model, system, user, target_duration_sec)
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    if cache in ("use", "only"):
+        cached = _load_cached_plan(cache_path)
+        if cached is not None:
+            print(f"[i] plan cache hit: {key[:12]}")
+            return cached
+        if cache == "only":
+            raise FileNotFoundError(f"No cached plan for this input (cache-only mode): {cache_path}")
+
+    client = _get_openai_client()
     resp = client.chat.completions.create(
         model=model,
         messages=[
@@ -125,7 +298,7 @@ def plan_script_with_llm(
         ],
         temperature=0.2,
         response_format={"type": "json_object"},
-        max_tokens=1200,
+        max_tokens=PLAN_REPLY_TOKENS,
     )
 
     raw = resp.choices[0].message.content
@@ -155,4 +328,296 @@ def plan_script_with_llm(
     if not cleaned_scenes:
         raise ValueError("No valid scenes after cleaning. The model likely used unknown IDs or empty orders.")
 
-    return {"scenes": cleaned_scenes}
+    plan = {"scenes": cleaned_scenes}
+    if cache != "off":
+        _save_cached_plan(cache_path, key, model, plan)
+    return plan
+
+# ---- Map-reduce planning for large posts ----
+# Shortlist calls only read and rank, so each shard may be larger than the final prompt.
+MAP_SHARD_BUDGET_FACTOR = 2.0
+MAP_MIN_SHORTLIST = 3
+
+MAP_SYSTEM_PROMPT = (
+    "You are shortlisting Reddit threads for a 3-minute Japanese YouTube video about Pokémon TCG.\n"
+    "From the provided threads, pick at most 'pick' threads that would make the best scenes for the post 'title'.\n"
+    "Output ONLY JSON: {\"shortlist\": [{\"id\": <top comment id>, \"score\": <0-10 video value>, "
+    "\"summary\": <one-line English note on the thread's angle, <=80 chars>}]}.\n"
+    "Use ONLY top comment IDs from the input. Prefer high scores, but cover different angles (pro/cons/tips/humor).\n"
+)
+
+def _shard_threads(threads: List[Dict[str, Any]], token_budget: int, model: str) -> List[tuple]:
+    """
+    Split threads (in score order) into consecutive shards that each fit token_budget: [(threads, payload), ...].
+    A thread whose top comment alone does not fit is skipped; the threads after it are still sharded.
+    """
+    shards = []
+    rest = threads
+    while rest:
+        payload, _, _ = pack_threads(rest, token_budget, model)
+        if not payload:
+            print(f"[!] thread {rest[0]['top']['id']} does not fit a {token_budget}-token shard, skipping it")
+            rest = rest[1:]
+            continue
+        shards.append((rest[:len(payload)], payload))
+        rest = rest[len(payload):]
+    return shards
+
+def _shortlist_shard(client, model: str, title: str, payload: List[Dict[str, Any]], pick: int) -> List[Dict[str, Any]]:
+    """One map call. Returns [{"id", "score", "summary"}] restricted to the shard's top IDs."""
+    valid = {row["top"]["id"] for row in payload}
+    user = {"title": title, "pick": pick, "threads": payload}
+    try:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": MAP_SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(user, ensure_ascii=False)},
+            ],
+            temperature=0.2,
+            response_format={"type": "json_object"},
+            max_tokens=800,
+        )
+        items = json.loads(resp.choices[0].message.content).get("shortlist")
+        if not isinstance(items, list):
+            raise ValueError("missing 'shortlist' list")
+        out = []
+        for it in items:
+            if isinstance(it, dict) and it.get("id") in valid and all(o["id"] != it["id"] for o in out):
+                score = it.get("score")
+                out.append({
+                    "id": it["id"],
+                    "score": float(score) if isinstance(score, (int, float)) else 0.0,
+                    "summary": str(it.get("summary") or "")[:120],
+                })
+        if not out:
+            raise ValueError("no valid IDs in shortlist")
+        return out[:pick]
+    except Exception as e:
+        # A bad shard should not sink the whole plan: keep its best threads by Reddit score.
+        print(f"[!] shortlist call failed, keeping the top {pick} threads of the shard: {e}")
+        return [{"id": row["top"]["id"], "score": 0.0, "summary": ""} for row in payload[:pick]]
+
+def _plan_map_reduce(
+    title: str,
+    threads: List[Dict[str, Any]],
+    system: str,
+    user: Dict[str, Any],
+    target_duration_sec: int,
+    reading_chars_per_sec: float,
+    model: str,
+    input_token_budget: int,
+    cache: str,
+    cache_dir: str,
+    max_workers: int,
+) -> Dict[str, Any]:
+    """
+    Two-stage planning: shortlist every shard in parallel, then run the normal planner (same validation)
+    over the shortlisted threads. The final plan is cached under the full sharded input.
+    """
+    shard_budget = int(input_token_budget * MAP_SHARD_BUDGET_FACTOR) - count_tokens(MAP_SYSTEM_PROMPT, model)
+    shards = _shard_threads(threads, shard_budget, model)
+    if not shards:
+        raise PlanConfigError("No thread fits the shortlist budget (input_token_budget is too small).")
+
+    key = _plan_cache_key(model, system + MAP_SYSTEM_PROMPT,
+                          {**user, "threads": [payload for _, payload in shards]}, target_duration_sec)
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    if cache in ("use", "only"):
+        cached = _load_cached_plan(cache_path)
+        if cached is not None:
+            print(f"[i] plan cache hit: {key[:12]}")
+            return cached
+        if cache == "only":
+            raise FileNotFoundError(f"No cached plan for this input (cache-only mode): {cache_path}")
+
+    # Aim the combined shortlist at roughly what one reduce prompt can hold.
+    reduce_payload, _, _ = pack_threads([th for sh, _ in shards for th in sh], input_token_budget, model)
+    capacity = max(1, len(reduce_payload))
+    pick = max(MAP_MIN_SHORTLIST, math.ceil(capacity / len(shards)))
+    print(f"[i] map-reduce planning: {len(threads)} threads in {len(shards)} shards, shortlisting {pick} per shard")
+
+    client = _get_openai_client()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(shards)))) as ex:
+        results = list(ex.map(lambda sh: _shortlist_shard(client, model, title, sh[1], pick), shards))
+
+    by_id = {th["top"]["id"]: (i, th) for i, th in enumerate(threads)}
+    chosen = sorted((it for res in results for it in res), key=lambda it: (-it["score"], by_id[it["id"]][0]))
+    shortlisted = [{**by_id[it["id"]][1], "summary": it["summary"]} if it["summary"] else by_id[it["id"]][1]
+                   for it in chosen]
+
+    plan = plan_script_with_llm(title, shortlisted, target_duration_sec=target_duration_sec,
+                                reading_chars_per_sec=reading_chars_per_sec, model=model,
+                                input_token_budget=input_token_budget, cache="off", map_reduce=False)
+    if cache != "off":
+        _save_cached_plan(cache_path, key, model, plan)
+    return plan
+
+# ---- Local (no-network) planner ----
+# Rough Japanese narration length per English character (casual translation is shorter than the source).
+EN_TO_JA_CHAR_RATIO = 0.6
+# Cost of a scene beyond its comments (title card / transition), in narration chars.
+SCENE_OVERHEAD_CHARS = 12
+# Knapsack resolution: budgets are bucketed into units of this many chars.
+_KNAPSACK_UNIT = 5
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def _estimate_ja_chars(body: str) -> int:
+    return max(1, int(math.ceil(len((body or "").strip()) * EN_TO_JA_CHAR_RATIO)))
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower()))
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _comment_value(c: Dict[str, Any]) -> float:
+    # Diminishing returns on score; merged near-duplicates count as extra agreement.
+    return math.log1p(max(0, c.get("score") or 0)) * (1.0 + 0.25 * math.log(c.get("dup_count", 1) or 1))
+
+def _scene_title(th: Dict[str, Any], matcher) -> str:
+    """Short Japanese title from glossary terms mentioned in the thread (<= 20 chars)."""
+    names: List[str] = []
+    if matcher is not None:
+        for c in [th["top"], *th["replies"][:3]]:
+            for _, _, idx in matcher.finditer(c.get("body") or ""):
+                ja = matcher.ja[idx]
+                if ja not in names:
+                    names.append(ja)
+            if len(names) >= 2:
+                break
+    if not names:
+        return "みんなの声"
+    title = "と".join(names[:2])
+    if len(title) > 20:
+        title = names[0][:20]
+    return title
+
+def _thread_options(th: Dict[str, Any], max_replies: int, min_words_novelty: float) -> List[tuple]:
+    """
+    Candidate scenes for one thread: top alone, then top + the next best non-redundant reply, ...
+    Returns [(cost_chars, value, comment_ids), ...] (each option extends the previous one).
+    """
+    top = th["top"]
+    seen = [_words(top.get("body"))]
+    ids = [top["id"]]
+    cost = SCENE_OVERHEAD_CHARS + _estimate_ja_chars(top.get("body"))
+    value = _comment_value(top)
+    options = [(cost, value, list(ids))]
+    for r in th["replies"]:
+        if len(ids) - 1 >= max_replies:
+            break
+        w = _words(r.get("body"))
+        # Skip replies that mostly repeat what is already on screen.
+        if any(_jaccard(w, s_) > 1.0 - min_words_novelty for s_ in seen):
+            continue
+        seen.append(w)
+        ids.append(r["id"])
+        cost += _estimate_ja_chars(r.get("body"))
+        value += 0.8 * _comment_value(r)
+        options.append((cost, value, list(ids)))
+    return options
+
+def plan_script_locally(
+    title: str,
+    threads: List[Dict[str, Any]],
+    target_duration_sec: int = 180,
+    reading_chars_per_sec: float = 5.0,
+    max_threads: int | None = 40,
+    max_replies_per_scene: int = 4,
+    min_words_novelty: float = 0.4,
+    matcher=None,
+) -> Dict[str, Any]:
+    """
+    Build a scene plan deterministically, without calling any model.
+    - Value: log-scaled comment scores; a thread that mostly repeats an earlier (higher-ranked) thread is discounted.
+    - Cost: estimated Japanese narration chars (EN_TO_JA_CHAR_RATIO) + per-scene overhead.
+    - Each thread is a knapsack group (skip, top only, top + 1 reply, ...); the DP maximizes value within budget_chars.
+    - Scenes keep the input (score) order. Titles come from glossary terms when a matcher is available.
+    Returns the same {"scenes": [...]} shape as plan_script_with_llm.
+    """
+    budget_chars = _budget_chars(target_duration_sec, reading_chars_per_sec)
+    capacity = budget_chars // _KNAPSACK_UNIT
+    pick = threads[:max_threads] if max_threads else threads
+    if not pick:
+        raise ValueError("No threads to plan.")
+
+    # Diversity: discount threads whose top comment overlaps an earlier one.
+    tops_words = [_words(th["top"].get("body")) for th in pick]
+    groups: List[List[tuple]] = []
+    for i, th in enumerate(pick):
+        overlap = max((_jaccard(tops_words[i], tops_words[j]) for j in range(i)), default=0.0)
+        factor = 1.0 - overlap
+        groups.append([
+            (min(capacity + 1, int(math.ceil(cost / _KNAPSACK_UNIT))), value * factor, ids)
+            for cost, value, ids in _thread_options(th, max_replies_per_scene, min_words_novelty)
+        ])
+
+    # Group knapsack: best[c] = best value using capacity c; choice[g][c] = option index taken for group g (-1 = skip).
+    best = [0.0] * (capacity + 1)
+    choice: List[List[int]] = []
+    for opts in groups:
+        new_best = list(best)
+        ch = [-1] * (capacity + 1)
+        for c in range(capacity + 1):
+            for k, (w, v, _) in enumerate(opts):
+                if w <= c and best[c - w] + v > new_best[c]:
+                    new_best[c] = best[c - w] + v
+                    ch[c] = k
+        best = new_best
+        choice.append(ch)
+
+    # Backtrack.
+    c = max(range(capacity + 1), key=lambda x: best[x])
+    chosen: Dict[int, List[str]] = {}
+    for g in range(len(groups) - 1, -1, -1):
+        k = choice[g][c]
+        if k >= 0:
+            w, _, ids = groups[g][k]
+            chosen[g] = ids
+            c -= w
+    if not chosen:
+        # Budget smaller than any single scene: still return the best top comment.
+        chosen[0] = [pick[0]["top"]["id"]]
+
+    if matcher is None:
+        try:
+            from glossary import load_compiled_glossary
+            matcher = load_compiled_glossary()
+        except Exception:
+            matcher = None
+    scenes = [
+        {"scene_title": _scene_title(pick[g], matcher), "comment_order": chosen[g]}
+        for g in sorted(chosen)
+    ]
+    return {"scenes": scenes}
+
+def plan_script(
+    title: str,
+    threads: List[Dict[str, Any]],
+    target_duration_sec: int = 180,
+    mode: str = "llm",
+    **kwargs,
+) -> Dict[str, Any]:
+    """
+    Plan scenes with the LLM (mode="llm") or locally (mode="fast").
+    In "llm" mode, any failure (API error, invalid JSON, unknown IDs) falls back to plan_script_locally,
+    so a flaky model never blocks a run. Settings problems are not model failures and are re-raised:
+    PlanConfigError (unknown cache mode, a token budget that cannot hold the prompt) and the
+    FileNotFoundError of a cache miss with cache="only", so a misconfigured run never silently ships a local plan.
+    """
+    rate = kwargs.get("reading_chars_per_sec", 5.0)
+    if mode == "fast":
+        return plan_script_locally(title, threads, target_duration_sec=target_duration_sec, reading_chars_per_sec=rate)
+    if mode != "llm":
+        raise ValueError(f"Unknown planning mode: {mode} (expected 'llm' or 'fast')")
+    try:
+        return plan_script_with_llm(title, threads, target_duration_sec=target_duration_sec, **kwargs)
+    except (PlanConfigError, FileNotFoundError):
+        raise
+    except Exception as e:
+        print(f"[!] LLM planning failed, using the local planner instead: {e}")
+        return plan_script_locally(title, threads, target_duration_sec=target_duration_sec, reading_chars_per_sec=rate)
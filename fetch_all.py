@@ -1,35 +1,264 @@
 
 # fetch_all.py
+import json
 import os
 import re
-from typing import List, Dict, Any
+import heapq
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
 from dotenv import load_dotenv
 import praw
+import requests
+from prawcore import Requestor
 
-from fetch_data import has_image_link_in_body  # reuse existing helper
+from comment_filter import CommentFilter, FilterStats
+from reddit_replay import session_from_env, replay_credentials
+from comment_store import CommentTable, load_table, save_post
+from ranking import ThreadRanker
 
-AD_KEYWORDS = [
-    r"\b(sponso?red?|affiliate)\b",
-    r"\b(discount|promo|coupon|deal)\b",
-    r"\b(ref(erral)?\s*code)\b",
-    r"\b(shop|store|merch)\b",
-]
+# ---- クライアント（HTTP接続プール＋リクエスト予算を共有） ----
+class TokenBucket:
+    """
+    スレッド間で共有するリクエスト予算。毎分 rate_per_minute 回まで、最大 burst 回ぶん貯められる。
+    Reddit の OAuth クライアントは毎分100回程度が上限なので、既定は少し余裕を見て90回。
+    """
+
+    def __init__(self, rate_per_minute: float = 90, burst: int | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(rate_per_minute // 6)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class _BudgetedRequestor(Requestor):
+    """prawcore の Requestor に TokenBucket を挟む（praw の全リクエストがここを通る）"""
+
+    def __init__(self, *args, bucket: TokenBucket | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._bucket = bucket
+
+    def request(self, *args, **kwargs):
+        if self._bucket is not None:
+            self._bucket.acquire()
+        return super().request(*args, **kwargs)
+
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+def _shared_session(pool_size: int = 16) -> requests.Session:
+    """
+    全 praw.Reddit で使い回す keep-alive の HTTP セッション。
+    REDDIT_RECORD / REDDIT_REPLAY が設定されていれば記録／再生用のセッション（reddit_replay）。
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = session_from_env() or requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            _SESSION = session
+        return _SESSION
+
+def make_reddit(bucket: TokenBucket | None = None) -> praw.Reddit:
+    """
+    共有 HTTP セッションを使う praw.Reddit を作る。
+    praw.Reddit はスレッドセーフではないので、並列取得ではスレッドごとに1つ作り、
+    接続プールと bucket（リクエスト予算）だけを共有する。
+    """
+    load_dotenv()
+    creds = replay_credentials()
+    return praw.Reddit(
+        client_id=creds.get("client_id") or os.getenv("REDDIT_CLIENT_ID"),
+        client_secret=creds.get("client_secret") or os.getenv("REDDIT_CLIENT_SECRET"),
+        user_agent=os.getenv("REDDIT_USER_AGENT", "PokePokeScraper/2.0"),
+        requestor_class=_BudgetedRequestor,
+        requestor_kwargs={"session": _shared_session(), "bucket": bucket},
+    )
+
+def _get_submission(reddit: praw.Reddit, post: str):
+    """投稿URLでも submission ID（例: 1orpru1）でも受け付ける"""
+    post = post.strip()
+    if post.startswith("http"):
+        return reddit.submission(url=post)
+    return reddit.submission(id=post)
+
+_COMMENT_FILTER: CommentFilter | None = None
+
+def get_comment_filter() -> CommentFilter:
+    """
+    取り込み用の除外フィルタ（AutoModerator / 削除済み / 画像リンク / 広告 + 追加ルール）。
+    追加ルールは環境変数 COMMENT_FILTER_RULES に JSON のパスを指定する。
+    """
+    global _COMMENT_FILTER
+    if _COMMENT_FILTER is None:
+        load_dotenv()
+        _COMMENT_FILTER = CommentFilter.from_config(os.getenv("COMMENT_FILTER_RULES") or None)
+    return _COMMENT_FILTER
+
+_THREAD_RANKER: ThreadRanker | None = None
 
-def looks_like_ad(text: str) -> bool:
+def get_thread_ranker() -> ThreadRanker:
     """
-    ごく簡易な広告/アフィ判定（誤検知を避けるため弱め）
+    スレッドの並べ替え（代表スコア）。既定は従来の式と同じ重み。
+    重みを変えるときは環境変数 THREAD_RANKING に JSON のパスを指定する（ranking.py 参照）。
     """
-    t = text.lower()
-    if "http" in t and ("ref" in t or "coupon" in t or "promo" in t):
-        return True
-    for pat in AD_KEYWORDS:
-        if re.search(pat, t, flags=re.IGNORECASE):
-            return True
-    return False
+    global _THREAD_RANKER
+    if _THREAD_RANKER is None:
+        load_dotenv()
+        _THREAD_RANKER = ThreadRanker.from_config(os.getenv("THREAD_RANKING") or None)
+    return _THREAD_RANKER
 
-def fetch_post_threads(post_url: str, max_threads: int = 50, max_replies_per_thread: int = 50) -> Dict[str, Any]:
+def _valid_comment(c) -> bool:
+    """集計しない判定（展開の優先度づけ・差分更新の再判定など、内部での確認用）"""
+    return get_comment_filter().check(c)
+
+def _to_obj(c) -> Dict[str, Any]:
+    author_name = c.author.name if c.author else "[deleted]"
+    return {
+        "id": c.id,
+        "author": author_name,
+        "body": (c.body or "").strip(),
+        "score": getattr(c, "score", 0),
+        "created_utc": getattr(c, "created_utc", None),
+        "permalink": f"https://www.reddit.com{getattr(c, 'permalink', '')}"
+    }
+
+def _thread_score(top_obj: Dict[str, Any], replies_obj: List[Dict[str, Any]]) -> float:
+    # 代表スコア: トップのscore + 返信上位5件の合計 * 0.5 + 返信数 * 0.3
+    # 並び順には頼らず上位5件を取る（全件ソートはしない）
+    replies_top5 = heapq.nlargest(5, replies_obj, key=lambda r: r["score"])
+    return top_obj["score"] + 0.5 * sum(r["score"] for r in replies_top5) + 0.3 * len(replies_obj)
+
+# ---- 予算付きの "load more" 展開 ----
+def expand_more_comments(
+    submission,
+    max_threads: int,
+    max_requests: int | None = None,
+    time_budget_sec: float | None = None,
+) -> Dict[str, Any]:
+    """
+    replace_more(limit=None) の予算付き版。MoreComments（"load more" の塊）を優先度順に展開し、
+    リクエスト数か時間の予算を使い切るか、上位 max_threads スレッドが変わり得なくなったら止める。
+    - 優先度: トップレベルの塊 → 親コメントの score が高い → 浅い → 子の件数が多い
+    - comment_sort="top" なので、トップレベルの塊の中身は表示済みのものより低スコア。
+      有効なトップレベルが max_threads 件そろえば、残りのトップレベルの塊は読まない
+    - 上位 max_threads 件に入らないスレッドの中の塊も読まない
+    展開しなかった塊はツリーから取り除く（replace_more と同じ扱い）。
+    ※ praw 7.x の CommentForest 内部（_gather_more_comments/_insert_comment）を replace_more と同様に使う
+    """
+    forest = submission.comments
+    by_id = submission._comments_by_id
+    started = time.monotonic()
+    stats = {"requests": 0, "skipped": 0, "skipped_comments": 0, "elapsed_sec": 0.0}
+
+    heap: List[Tuple[Any, ...]] = []
+    seq = 0
+
+    def root_of(more) -> Any:
+        c = by_id.get(more.parent_id)
+        while c is not None and not c.is_root:
+            c = by_id.get(c.parent_id)
+        return c
+
+    def push(more) -> None:
+        nonlocal seq
+        seq += 1
+        if more.parent_id.startswith("t3_"):
+            key = (0, 0.0)
+        else:
+            parent = by_id.get(more.parent_id)
+            key = (1, -float(getattr(parent, "score", 0) or 0))
+        heapq.heappush(heap, (*key, getattr(more, "depth", 0) or 0, -(more.count or 0), seq, more))
+
+    def skip(more) -> None:
+        stats["skipped"] += 1
+        stats["skipped_comments"] += more.count or 0
+        more._remove_from.remove(more)
+
+    for more in forest._gather_more_comments(forest._comments):
+        push(more)
+
+    valid: Dict[str, bool] = {}  # コメントID → 除外ルールを通るか（同じコメントを何度も判定しない）
+
+    def is_valid(c) -> bool:
+        ok = valid.get(c.id)
+        if ok is None:
+            ok = valid[c.id] = _valid_comment(c)
+        return ok
+
+    # 現時点の有効なトップレベルと上位 max_threads スレッド（トップレベルを展開したら作り直す）
+    valid_tops: List[Any] | None = None
+    top_ids: set | None = None
+    while heap:
+        *_, more = heapq.heappop(heap)
+        over_budget = (
+            (max_requests is not None and stats["requests"] >= max_requests)
+            or (time_budget_sec is not None and time.monotonic() - started >= time_budget_sec)
+        )
+        if over_budget:
+            skip(more)
+            continue
+
+        if valid_tops is None:
+            valid_tops = [c for c in forest._comments
+                          if not isinstance(c, praw.models.MoreComments) and is_valid(c)]
+        if more.parent_id.startswith("t3_"):
+            if len(valid_tops) >= max_threads:
+                skip(more)
+                continue
+            valid_tops = top_ids = None
+        else:
+            if top_ids is None:
+                top_ids = {c.id for c in heapq.nlargest(max_threads, valid_tops, key=lambda x: getattr(x, "score", 0))}
+            root = root_of(more)
+            if root is None or root.id not in top_ids:
+                skip(more)
+                continue
+
+        new_comments = more.comments(update=False)
+        stats["requests"] += 1
+        for nested in forest._gather_more_comments(new_comments, parent_tree=forest._comments):
+            nested.submission = submission
+            push(nested)
+        for comment in new_comments:
+            forest._insert_comment(comment)
+        more._remove_from.remove(more)
+
+    stats["elapsed_sec"] = time.monotonic() - started
+    return stats
+
+def fetch_post_threads(
+    post_url: str,
+    max_threads: int = 50,
+    max_replies_per_thread: int = 50,
+    reddit: praw.Reddit | None = None,
+    more_budget: int | None = None,
+    more_time_budget_sec: float | None = None,
+    backend: str | None = None,
+) -> Dict[str, Any]:
     """
     指定Reddit投稿の「トップレベルコメント＋その返信」をスレッド単位で取得する。
+    - post_url は投稿URLか submission ID
+    - reddit を渡すとそのクライアントを使う（省略時は make_reddit()）
+    - backend="json" なら praw を使わず JSON API から一括取得する（reddit_json。"load more" を
+      最大100件ずつまとめて展開するので大きい投稿ほど速い）。省略時は環境変数 REDDIT_BACKEND（既定 "praw"）
+    - more_budget / more_time_budget_sec を指定すると "load more" の展開を予算内に抑える
+      （expand_more_comments。展開状況は戻り値の "expansion" に入る）。省略時は完全展開
     - AutoModerator、[removed]/[deleted]は除外
     - 画像リンクを含むコメントを除外
     - 広告っぽい文面を除外（簡易）
@@ -48,66 +277,284 @@ def fetch_post_threads(post_url: str, max_threads: int = 50, max_replies_per_thr
         ]
       }
     """
-    load_dotenv()
-    reddit = praw.Reddit(
-        client_id=os.getenv("REDDIT_CLIENT_ID"),
-        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-        user_agent=os.getenv("REDDIT_USER_AGENT", "PokePokeScraper/2.0")
-    )
-    submission = reddit.submission(url=post_url)
-    submission.comment_sort = "top"
-    submission.comments.replace_more(limit=None)  # 返信まで完全展開
-
-    def valid_comment(c) -> bool:
-        if c is None: return False
-        if c.author and c.author.name == "AutoModerator": return False
-        body = (c.body or "").strip()
-        if not body or body in ("[deleted]", "[removed]"): return False
-        if has_image_link_in_body(body): return False
-        if looks_like_ad(body): return False
-        return True
-
-    # トップレベルコメントを収集（score順）
-    top_level = [c for c in submission.comments if valid_comment(c)]
-    top_level.sort(key=lambda x: getattr(x, "score", 0), reverse=True)
-    top_level = top_level[:max_threads]
-
-    threads = []
-    for top in top_level:
-        # 返信を平坦化してスコア順に切り出す
-        replies = [r for r in top.replies.list() if valid_comment(r)]
-        replies.sort(key=lambda x: getattr(x, "score", 0), reverse=True)
-        replies = replies[:max_replies_per_thread]
-
-        def to_obj(c):
-            author_name = c.author.name if c.author else "[deleted]"
-            return {
-                "id": c.id,
-                "author": author_name,
-                "body": (c.body or "").strip(),
-                "score": getattr(c, "score", 0),
-                "created_utc": getattr(c, "created_utc", None),
-                "permalink": f"https://www.reddit.com{getattr(c, 'permalink', '')}"
-            }
-
-        top_obj = to_obj(top)
-        replies_obj = [to_obj(r) for r in replies]
-
-        # 代表スコア: トップのscore + 返信上位5件の合計 * 0.5 + 返信数 * 0.3
-        replies_top5 = sorted(replies_obj, key=lambda x: x["score"], reverse=True)[:5]
-        score = top_obj["score"] + 0.5 * sum(r["score"] for r in replies_top5) + 0.3 * len(replies_obj)
-
-        threads.append({
-            "top": top_obj,
-            "replies": replies_obj,
-            "score": score
-        })
+    backend = backend or os.getenv("REDDIT_BACKEND", "praw")
+    if backend == "json":
+        from reddit_json import fetch_post_threads_json
+        return fetch_post_threads_json(post_url, max_threads=max_threads,
+                                       max_replies_per_thread=max_replies_per_thread, more_budget=more_budget)
+    if backend != "praw":
+        raise ValueError(f"backend は praw / json のいずれかです: {backend}")
 
-    # 返信のない高スコア単発も活かせるようスコア順に並べる
-    threads.sort(key=lambda x: x["score"], reverse=True)
+    submission, expansion = load_submission(post_url, max_threads, reddit=reddit, more_budget=more_budget,
+                                            more_time_budget_sec=more_time_budget_sec)
+    filter_stats = get_comment_filter().new_stats()
+    threads = list(iter_post_threads(submission, max_threads=max_threads,
+                                     max_replies_per_thread=max_replies_per_thread, filter_stats=filter_stats))
 
-    return {
+    # 返信のない高スコア単発も活かせるよう代表スコア順に並べる（ranking で一括採点）
+    threads = get_thread_ranker().rank(threads)
+    print("[i] filter rejects:", filter_stats.summary())
+
+    result = {
         "title": submission.title,
         "permalink": f"https://www.reddit.com{submission.permalink}",
-        "threads": threads
+        "threads": threads,
+        "filter_stats": filter_stats.to_dict(),
     }
+    if expansion is not None:
+        result["expansion"] = expansion
+    return result
+
+def load_submission(
+    post_url: str,
+    max_threads: int = 50,
+    reddit: praw.Reddit | None = None,
+    more_budget: int | None = None,
+    more_time_budget_sec: float | None = None,
+) -> Tuple[Any, Dict[str, Any] | None]:
+    """
+    投稿を読み込み、"load more" を展開した submission と展開状況（予算指定時のみ）を返す。
+    展開（replace_more / expand_more_comments）はこの関数の中で終わらせる。iter_post_threads に渡すと
+    選別と dict への変換だけをスレッドごとに受け取れるが、取得そのものは逐次にならない。
+    """
+    reddit = reddit or make_reddit()
+    submission = _get_submission(reddit, post_url)
+    submission.comment_sort = "top"
+    expansion = None
+    if more_budget is not None or more_time_budget_sec is not None:
+        expansion = expand_more_comments(submission, max_threads, max_requests=more_budget,
+                                         time_budget_sec=more_time_budget_sec)
+        print(f"[i] load more: requests={expansion['requests']}, skipped={expansion['skipped']} "
+              f"(~{expansion['skipped_comments']} comments)")
+    else:
+        submission.comments.replace_more(limit=None)  # 返信まで完全展開
+    return submission, expansion
+
+def _iter_replies(top) -> Iterator[Any]:
+    """top の返信をツリーのまま幅優先でたどる（CommentForest.list() と同じ順、リストは作らない）"""
+    queue = deque(top.replies)
+    while queue:
+        c = queue.popleft()
+        if isinstance(c, praw.models.MoreComments):
+            continue
+        yield c
+        queue.extend(c.replies)
+
+def iter_post_threads(submission, max_threads: int = 50, max_replies_per_thread: int = 50,
+                      filter_stats: FilterStats | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    fetch_post_threads のスレッドを1つずつ返すジェネレータ。
+    - submission は load_submission で展開済みのもの。ここで逐次になるのは選別と dict への変換だけで、
+      Reddit への問い合わせは始まる前に済んでいる
+    - トップレベル・返信とも件数上限つきのヒープで上位だけを残し（全件ソートしない）、
+      dict に変換するのは残ったコメントだけ
+    - トップコメントの score 順に返す。代表スコア順が必要なら受け取った側で並べ替える
+      （get_thread_ranker().rank。"score" は既定の式の値で、rank で付け直される）
+    - filter_stats（CommentFilter.new_stats()）を渡すと除外の集計をそこに記録する
+    """
+    comment_filter = get_comment_filter()
+    score = lambda x: getattr(x, "score", 0)
+    tops = (c for c in submission.comments
+            if not isinstance(c, praw.models.MoreComments) and comment_filter.check(c, filter_stats))
+    for top in heapq.nlargest(max_threads, tops, key=score):
+        replies = heapq.nlargest(max_replies_per_thread,
+                                 (r for r in _iter_replies(top) if comment_filter.check(r, filter_stats)), key=score)
+        top_obj = _to_obj(top)
+        replies_obj = [_to_obj(r) for r in replies]
+        yield {
+            "top": top_obj,
+            "replies": replies_obj,
+            "score": _thread_score(top_obj, replies_obj)
+        }
+
+def fetch_many_post_threads(
+    posts: Iterable[str],
+    max_threads: int = 50,
+    max_replies_per_thread: int = 50,
+    max_workers: int = 4,
+    requests_per_minute: float = 90,
+) -> Iterator[Tuple[str, Dict[str, Any] | Exception]]:
+    """
+    複数の投稿（URL または submission ID）を並列に取得し、終わった順に (post, 結果) を返す。
+    - 全スレッドで HTTP 接続プールと1つの TokenBucket（毎分 requests_per_minute 回）を共有
+    - 1件の失敗で全体を止めないよう、失敗した投稿は結果の代わりに例外オブジェクトを返す
+    """
+    bucket = TokenBucket(requests_per_minute)
+    local = threading.local()
+
+    def work(post: str) -> Dict[str, Any]:
+        if getattr(local, "reddit", None) is None:
+            local.reddit = make_reddit(bucket)
+        return fetch_post_threads(post, max_threads=max_threads,
+                                  max_replies_per_thread=max_replies_per_thread, reddit=local.reddit)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = {ex.submit(work, p): p for p in posts}
+        for fut in as_completed(futures):
+            post = futures[fut]
+            try:
+                yield post, fut.result()
+            except Exception as e:
+                print(f"[!] 取得に失敗: {post} ({e})")
+                yield post, e
+
+# ---- data/raw/ の生データキャッシュ（差分更新） ----
+RAW_DIR = os.path.join("data", "raw")
+
+def submission_id_from(post: str) -> str:
+    """投稿URL（.../comments/<id>/...）または submission ID から ID を取り出す"""
+    m = re.search(r"/comments/([a-z0-9]+)", post)
+    return m.group(1) if m else post.strip()
+
+def _raw_cache_path(submission_id: str, raw_dir: str) -> str:
+    return os.path.join(raw_dir, f"{submission_id}.msgpack")
+
+def _load_raw(submission_id: str, raw_dir: str) -> CommentTable | None:
+    """
+    列指向の msgpack（comment_store）を CommentTable のまま読む。旧形式の <id>.json もあれば読む。
+    params / fetched_at は table.meta で見られるので、使わないキャッシュのコメントは dict に戻さない
+    """
+    path = _raw_cache_path(submission_id, raw_dir)
+    if os.path.exists(path):
+        return load_table(path)
+    legacy = os.path.join(raw_dir, f"{submission_id}.json")
+    if os.path.exists(legacy):
+        with open(legacy, "r", encoding="utf-8") as f:
+            return CommentTable.from_post(json.load(f))
+    return None
+
+def _iter_new_comments(submission, since: float) -> Iterator[Tuple[Any, Any]]:
+    """
+    読み込み済みのコメントツリーから created_utc > since のものを (root, comment) で返す。
+    root はそのコメントが属するトップレベルコメント（トップレベル自身なら自分）。
+    """
+    for top in submission.comments:
+        if isinstance(top, praw.models.MoreComments):
+            continue
+        stack = [top]
+        while stack:
+            c = stack.pop()
+            if getattr(c, "created_utc", 0) > since:
+                yield top, c
+            stack.extend(r for r in c.replies if not isinstance(r, praw.models.MoreComments))
+
+def _refresh_comments(reddit: praw.Reddit, ids: List[str]) -> Dict[str, Any]:
+    """info API（100件/リクエスト）で既存コメントの最新状態をまとめて取り直す"""
+    fresh: Dict[str, Any] = {}
+    for c in reddit.info(fullnames=[f"t1_{cid}" for cid in ids]):
+        fresh[c.id] = c
+    return fresh
+
+def _merge_delta(cached: Dict[str, Any], reddit: praw.Reddit, max_threads: int, max_replies_per_thread: int,
+                 refresh_top_n: int, more_limit: int) -> Dict[str, Any]:
+    threads = cached["threads"]
+    since = max(
+        (c.get("created_utc") or 0 for th in threads for c in [th["top"], *th["replies"]]),
+        default=0,
+    )
+
+    # 1) 既存コメントのうち上位 refresh_top_n 件の score/本文を更新（削除されたものは落とす）
+    ordered_ids = [th["top"]["id"] for th in threads] + [r["id"] for th in threads for r in th["replies"]]
+    fresh = _refresh_comments(reddit, ordered_ids[:refresh_top_n])
+
+    comment_filter = get_comment_filter()
+    filter_stats = comment_filter.new_stats()  # この差分更新で新しく判定したぶんだけ数える
+
+    def updated(obj: Dict[str, Any]) -> Dict[str, Any] | None:
+        c = fresh.get(obj["id"])
+        if c is None:
+            return obj
+        return _to_obj(c) if comment_filter.check(c, filter_stats) else None
+
+    by_top: Dict[str, Dict[str, Any]] = {}
+    for th in threads:
+        top = updated(th["top"])
+        if top is None:
+            continue
+        replies = [r for r in (updated(r) for r in th["replies"]) if r is not None]
+        by_top[top["id"]] = {"top": top, "replies": replies}
+
+    # 2) 新着順で読み、since より新しいコメントだけを拾う（"load more" は more_limit 回まで）
+    submission = reddit.submission(id=cached["submission_id"])
+    submission.comment_sort = "new"
+    submission.comments.replace_more(limit=more_limit)
+    added = 0
+    orphan_roots: Dict[str, Any] = {}  # 新着返信の親スレッドがキャッシュの上位に無いもの
+    for root, c in _iter_new_comments(submission, since):
+        if not comment_filter.check(c, filter_stats):
+            continue
+        if c is root:
+            if c.id not in by_top:
+                by_top[c.id] = {"top": _to_obj(c), "replies": []}
+                added += 1
+        elif root.id in by_top:
+            th = by_top[root.id]
+            if all(r["id"] != c.id for r in th["replies"]):
+                th["replies"].append(_to_obj(c))
+                added += 1
+        else:
+            orphan_roots[root.id] = root
+
+    # 新着返信がついた圏外のスレッドは、読み込んだツリーにあるトップと返信で組み直して選び直しの候補にする
+    # （トップの score が上がって上位に入ることがある。除外ルールに当たるトップは候補にしない）
+    for root in orphan_roots.values():
+        if root.id in by_top or not comment_filter.check(root, filter_stats):
+            continue
+        replies = [_to_obj(r) for r in _iter_replies(root) if comment_filter.check(r, filter_stats)]
+        by_top[root.id] = {"top": _to_obj(root), "replies": replies}
+        added += 1 + len(replies)
+
+    # 3) fetch_post_threads と同じ基準で選び直す
+    tops = sorted(by_top.values(), key=lambda th: th["top"]["score"], reverse=True)[:max_threads]
+    merged = []
+    for th in tops:
+        replies = sorted(th["replies"], key=lambda r: r["score"], reverse=True)[:max_replies_per_thread]
+        merged.append({"top": th["top"], "replies": replies})
+    merged = get_thread_ranker().rank(merged)
+    print(f"[i] raw cache delta: +{added} comments, refreshed={len(fresh)}, filter rejects: {filter_stats.summary()}")
+    return {**cached, "title": submission.title, "threads": merged, "filter_stats": filter_stats.to_dict()}
+
+def fetch_post_threads_cached(
+    post_url: str,
+    max_threads: int = 50,
+    max_replies_per_thread: int = 50,
+    raw_dir: str = RAW_DIR,
+    max_age_sec: float | None = None,
+    refresh_top_n: int = 200,
+    more_limit: int = 8,
+    reddit: praw.Reddit | None = None,
+) -> Dict[str, Any]:
+    """
+    fetch_post_threads のキャッシュ付き版。data/raw/<submission_id>.msgpack に結果と取得時刻を
+    列指向の形式（comment_store）で保存する。
+    - キャッシュが無い／取得条件が違う → 全件取得して保存
+    - キャッシュが max_age_sec 以内 → そのまま返す（None なら常に差分更新）
+    - それ以外 → 差分更新: 既存上位 refresh_top_n 件の score を取り直し、
+      キャッシュ内の最新 created_utc より新しいコメントだけを新着順で拾ってマージ。
+      キャッシュの上位に無いスレッドに新着返信がついていたら、そのスレッドも候補に加えて選び直す
+    戻り値の形は fetch_post_threads と同じ（submission_id / fetched_at が増える）。
+    """
+    sid = submission_id_from(post_url)
+    path = _raw_cache_path(sid, raw_dir)
+    params = {"max_threads": max_threads, "max_replies_per_thread": max_replies_per_thread}
+
+    table = _load_raw(sid, raw_dir)
+    if table is not None and table.meta.get("params") != params:
+        table = None
+
+    if table is not None and max_age_sec is not None and time.time() - table.meta.get("fetched_at", 0) <= max_age_sec:
+        return table.to_post()
+    # 後段（索引・重複まとめ・構成・翻訳）はどれも全コメントの本文を読むので、ここで dict に戻す
+    cached = table.to_post() if table is not None else None
+
+    reddit = reddit or make_reddit()
+    fetched_at = time.time()
+    if cached is None:
+        data = fetch_post_threads(post_url, max_threads=max_threads,
+                                  max_replies_per_thread=max_replies_per_thread, reddit=reddit)
+        data = {"submission_id": sid, "params": params, **data}
+    else:
+        data = _merge_delta(cached, reddit, max_threads, max_replies_per_thread, refresh_top_n, more_limit)
+    data["fetched_at"] = fetched_at
+    save_post(data, path)
+    return data
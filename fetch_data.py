@@ -3,6 +3,8 @@ import re
 from dotenv import load_dotenv
 import praw
 
+from reddit_replay import session_from_env, replay_credentials
+
 IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
 
 def contains_image_extension(url: str) -> bool:
@@ -51,15 +53,18 @@ def fetch_post_and_top_comments(post_url: str, comment_limit=10):
     # 1) .env読み込み
     load_dotenv()
 
-    client_id = os.getenv("REDDIT_CLIENT_ID")
-    client_secret = os.getenv("REDDIT_CLIENT_SECRET")
+    creds = replay_credentials()  # 再生モードではダミーの認証情報
+    client_id = creds.get("client_id") or os.getenv("REDDIT_CLIENT_ID")
+    client_secret = creds.get("client_secret") or os.getenv("REDDIT_CLIENT_SECRET")
     user_agent = os.getenv("REDDIT_USER_AGENT", "PokePokeScraper/1.0")
 
-    # 2) praw設定
+    # 2) praw設定（REDDIT_RECORD / REDDIT_REPLAY があれば記録／再生用の通信を使う）
+    session = session_from_env()
     reddit = praw.Reddit(
         client_id=client_id,
         client_secret=client_secret,
-        user_agent=user_agent
+        user_agent=user_agent,
+        requestor_kwargs={"session": session} if session else None,
     )
 
     # 3) Submissionオブジェクト取得
@@ -1,10 +1,13 @@
 # glossary.py
 # - CSV(en,ja,type,aliases) を読み込んで Term に変換
 # - 表記ゆれ(aliases)は CSV が空でも自動で補完
+# - コンパイル済み照合器は data/cache/glossary.<sha>.bin にキャッシュ
+# - 常駐ワーカー向けに CSV の変更を検知して差し替える GlossaryHandle
 from __future__ import annotations
-import csv, re
+import csv, hashlib, os, pickle, re, threading, time
+from collections import deque
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
 @dataclass
 class Term:
@@ -77,6 +80,11 @@ def _derive_aliases(s: str) -> List[str]:
         v.add(s1.replace(t_low+" ", token))
     return [x for x in v if x and x != s]
 
+def term_aliases(t: Term) -> List[str]:
+    """英語名+aliases+自動派生aliases を重複なし・長い順で返す"""
+    alts = [t.en] + (t.aliases or []) + _derive_aliases(t.en)
+    return sorted(set(a for a in alts if a), key=len, reverse=True)
+
 def compile_glossary_patterns(terms: List[Term]) -> List[Tuple[re.Pattern, str]]:
     """
     各Termについて、英語名+aliases+自動派生aliasesを1本のregexにまとめ、
@@ -84,8 +92,7 @@ def compile_glossary_patterns(terms: List[Term]) -> List[Tuple[re.Pattern, str]]
     """
     patterns: List[Tuple[re.Pattern, str]] = []
     for t in terms:
-        alts = [t.en] + (t.aliases or []) + _derive_aliases(t.en)
-        alts = sorted(set(a for a in alts if a), key=len, reverse=True)
+        alts = term_aliases(t)
         if not alts:
             continue
         alt_pat = "|".join(_escape_for_alt(a) for a in alts)
@@ -95,4 +102,313 @@ def compile_glossary_patterns(terms: List[Term]) -> List[Tuple[re.Pattern, str]]
     patterns.sort(key=lambda pj: pj[0].pattern.count("|"), reverse=True)
     return patterns
 
-__all__ = ["Term", "load_glossary", "compile_glossary_patterns"]
+# ---- 1パス照合（Aho-Corasick） ----
+# compile_glossary_patterns は Term ごとに regex を作るため、本文を Term 数だけ走査する。
+# GlossaryMatcher は全 alias を1つのオートマトンにまとめ、本文を1回なめるだけで全ヒットを拾う。
+# 一致規則は regex 版と同じ:
+#   - 大文字小文字を無視
+#   - alias 中の空白は本文の任意長の空白に一致（\s+ 相当）
+#   - 前後が [A-Za-z0-9_] でないこと（(?<![A-Za-z0-9_]) / (?![A-Za-z0-9_]) 相当）
+#   - 重なる候補は「左から・長いもの優先」
+
+_WORD_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+
+def _normalize_for_match(text: str) -> Tuple[str, List[int]]:
+    """
+    小文字化＋空白の連続を半角スペース1つに畳んだ文字列と、
+    その各文字が元の text の何文字目に対応するかのリストを返す。
+    """
+    out: List[str] = []
+    offsets: List[int] = []
+    prev_space = False
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            if not prev_space:
+                out.append(" ")
+                offsets.append(i)
+            prev_space = True
+            continue
+        prev_space = False
+        low = ch.lower()
+        out.append(low)
+        # 'İ'.lower() のように長さが変わる文字は全て同じ位置に対応させる
+        offsets.extend([i] * len(low))
+    return "".join(out), offsets
+
+def _normalize_alias(alias: str) -> str:
+    return " ".join(alias.lower().split())
+
+class GlossaryMatcher:
+    """
+    glossary 全体を1つの Aho-Corasick オートマトンにまとめた照合器。
+    term の番号 i に対して en[i] / ja[i] を持ち、
+    finditer() は (start, end, i) を左から重ならない順で返す。
+    """
+
+    def __init__(self, en: List[str], ja: List[str], aliases: List[List[str]]):
+        self.en = list(en)
+        self.ja = list(ja)
+        self.aliases = [list(a) for a in aliases]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 各ノードで終わる alias の (正規化後の長さ, term番号)。長い順
+        self._out: List[Tuple[Tuple[int, int], ...]] = [()]
+        for idx, alts in enumerate(aliases):
+            for a in alts:
+                self._insert(_normalize_alias(a), idx)
+        self._build_fail_links()
+
+    def __len__(self) -> int:
+        return len(self.ja)
+
+    def _insert(self, key: str, idx: int) -> None:
+        if not key:
+            return
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        # 同じ alias を複数の Term が持つ場合は先に登録した方を優先
+        if not self._out[node]:
+            self._out[node] = ((len(key), idx),)
+
+    def _build_fail_links(self) -> None:
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())  # ルート直下の fail は 0 のまま
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                # 接尾辞で終わる alias も出力に含める（長い順を保つ）
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+                queue.append(nxt)
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """text 中のヒットを (start, end, term番号) で返す（左から・長い順優先・重なりなし）"""
+        if not text:
+            return
+        norm, offsets = _normalize_for_match(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        n_text = len(text)
+        cands: List[Tuple[int, int, int]] = []  # (正規化後の開始位置, -長さ, term番号)
+        node = 0
+        for i, ch in enumerate(norm):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            end = offsets[i] + 1
+            if end < n_text and text[end] in _WORD_CHARS:
+                continue
+            for length, idx in out[node]:
+                s = i - length + 1
+                start = offsets[s]
+                if start > 0 and text[start - 1] in _WORD_CHARS:
+                    continue
+                cands.append((s, -length, idx))
+        if not cands:
+            return
+        cands.sort()
+        pos = 0
+        for s, neg_len, idx in cands:
+            if s < pos:
+                continue
+            e = s - neg_len
+            pos = e
+            yield offsets[s], offsets[e - 1] + 1, idx
+
+    def subn(self, text: str, repl: Callable[[int], str] | None = None) -> Tuple[str, int]:
+        """ヒット箇所を repl(term番号)（省略時は ja）に置き換えた文字列と置換数を返す"""
+        parts: List[str] = []
+        last = 0
+        count = 0
+        for start, end, idx in self.finditer(text):
+            parts.append(text[last:start])
+            parts.append(repl(idx) if repl else self.ja[idx])
+            last = end
+            count += 1
+        if not count:
+            return text, 0
+        parts.append(text[last:])
+        return "".join(parts), count
+
+    def sub(self, text: str, repl: Callable[[int], str] | None = None) -> str:
+        return self.subn(text, repl)[0]
+
+    def subset(self, ids: Iterable[int]) -> "GlossaryMatcher":
+        """指定した term 番号だけを持つ小さな照合器を返す（部分的なやり直し用）"""
+        ids = sorted(set(ids))
+        return GlossaryMatcher(
+            en=[self.en[i] for i in ids],
+            ja=[self.ja[i] for i in ids],
+            aliases=[self.aliases[i] for i in ids],
+        )
+
+def compile_glossary_matcher(terms: List[Term]) -> GlossaryMatcher:
+    """
+    compile_glossary_patterns の1パス版。
+    translate_to_casual_japanese_glossary には patterns の代わりにそのまま渡せる。
+    """
+    return GlossaryMatcher(
+        en=[t.en for t in terms],
+        ja=[t.ja for t in terms],
+        aliases=[term_aliases(t) for t in terms],
+    )
+
+# ---- コンパイル済み照合器のキャッシュ ----
+GLOSSARY_CACHE_DIR = os.path.join("data", "cache")
+# _derive_aliases / GlossaryMatcher の仕様を変えたら上げる（古いキャッシュを無効化する）
+GLOSSARY_CACHE_VERSION = 2
+
+_MATCHER_MEMO: Dict[str, GlossaryMatcher] = {}
+
+def default_glossary_path() -> str:
+    """正規化済みがあればそちらを優先"""
+    return "glossary_normalized.csv" if os.path.exists("glossary_normalized.csv") else "glossary.csv"
+
+def glossary_digest(path: str) -> str:
+    """CSVの中身 + キャッシュ版数 から求めるキー"""
+    h = hashlib.sha256(f"v{GLOSSARY_CACHE_VERSION}\n".encode("utf-8"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def glossary_cache_path(digest: str, cache_dir: str = GLOSSARY_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"glossary.{digest[:16]}.bin")
+
+def save_compiled_glossary(matcher: GlossaryMatcher, digest: str, cache_dir: str = GLOSSARY_CACHE_DIR) -> str:
+    """照合器を書き出す（途中で落ちても壊れたファイルが残らないよう一時ファイル経由）"""
+    os.makedirs(cache_dir, exist_ok=True)
+    out_path = glossary_cache_path(digest, cache_dir)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(matcher, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def load_compiled_glossary(path: str | None = None, cache_dir: str = GLOSSARY_CACHE_DIR) -> GlossaryMatcher:
+    """
+    CSV に対応するコンパイル済み GlossaryMatcher を返す。
+    - 同一プロセス内では digest ごとにメモ化
+    - ディスクに glossary.<sha>.bin があれば読むだけ、無ければコンパイルして保存
+    CSV を編集すると digest が変わるので、コンパイルし直すのは編集後の初回だけ。
+    """
+    path = path or default_glossary_path()
+    digest = glossary_digest(path)
+    matcher = _MATCHER_MEMO.get(digest)
+    if matcher is not None:
+        return matcher
+
+    cache_path = glossary_cache_path(digest, cache_dir)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                matcher = pickle.load(f)
+        except Exception as e:
+            print(f"[!] glossary キャッシュを読めないため再コンパイルします: {cache_path} ({e})")
+            matcher = None
+    if not isinstance(matcher, GlossaryMatcher):
+        matcher = compile_glossary_matcher(load_glossary(path))
+        try:
+            save_compiled_glossary(matcher, digest, cache_dir)
+        except OSError as e:
+            print(f"[!] glossary キャッシュを書き込めませんでした: {e}")
+    _MATCHER_MEMO[digest] = matcher
+    return matcher
+
+# ---- 常駐ワーカー向けのホットリロード ----
+class GlossaryHandle:
+    """
+    CSV の更新を検知して照合器を差し替えるハンドル。
+    - snapshot() は現在の GlossaryMatcher を返す。照合器は不変なので、
+      1件の翻訳の間は同じ snapshot を使い続ければ途中で辞書が変わることはない
+    - mtime/サイズが変わったときだけ中身のハッシュを取り、実際に変わっていれば再構築
+    - 再構築では追加・変更された Term だけ alias を作り直し、他は前回の結果を使い回す
+      （オートマトン自体は fail リンクが全体に依存するため組み直す）
+    """
+
+    def __init__(self, path: str | None = None, check_interval: float = 2.0):
+        self.path = path or default_glossary_path()
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stat_key: Tuple[float, int] | None = None
+        self._digest: str | None = None
+        self._last_check = 0.0
+        self._alias_cache: Dict[Tuple[str, Tuple[str, ...]], List[str]] = {}
+        self._matcher: GlossaryMatcher | None = None
+        self.reload_count = 0
+        self.refresh(force=True)
+
+    def snapshot(self) -> GlossaryMatcher:
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+        return self._matcher
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        CSV が変わっていれば照合器を差し替えて True を返す。
+        読み込みに失敗したとき（ファイルが無い・書き込み途中など）は前回の照合器を使い続け、
+        次回の確認で読み直す（初回の読み込みだけは例外をそのまま投げる）。
+        """
+        with self._lock:
+            self._last_check = time.monotonic()
+            try:
+                st = os.stat(self.path)
+                stat_key = (st.st_mtime, st.st_size)
+                if not force and stat_key == self._stat_key:
+                    return False
+                digest = glossary_digest(self.path)
+                if not force and digest == self._digest:
+                    self._stat_key = stat_key
+                    return False
+                terms = load_glossary(self.path)
+                cache: Dict[Tuple[str, Tuple[str, ...]], List[str]] = {}
+                aliases: List[List[str]] = []
+                changed = 0
+                for t in terms:
+                    key = (t.en, tuple(t.aliases or []))
+                    alts = cache.get(key) or self._alias_cache.get(key)
+                    if alts is None:
+                        alts = term_aliases(t)
+                        changed += 1
+                    cache[key] = alts
+                    aliases.append(alts)
+                matcher = GlossaryMatcher(
+                    en=[t.en for t in terms],
+                    ja=[t.ja for t in terms],
+                    aliases=aliases,
+                )
+            except Exception as e:
+                if self._matcher is None:
+                    raise
+                print(f"[!] glossary の再読み込みに失敗（前回の辞書を使い続けます）: {self.path} ({e})")
+                return False
+            # 参照の付け替えだけなので、読み手は旧/新どちらか一方の照合器を見る
+            # stat_key は構築に成功してから記録する（失敗したら次回また読み直す）
+            self._matcher = matcher
+            self._alias_cache = cache
+            self._digest = digest
+            self._stat_key = stat_key
+            if self.reload_count:
+                print(f"[i] glossary を再読み込み: {self.path} (terms={len(terms)}, changed={changed})")
+            self.reload_count += 1
+            return True
+
+__all__ = [
+    "Term", "load_glossary", "compile_glossary_patterns", "term_aliases",
+    "GlossaryMatcher", "compile_glossary_matcher",
+    "default_glossary_path", "glossary_digest", "save_compiled_glossary", "load_compiled_glossary",
+    "GlossaryHandle",
+]
@@ -1,42 +1,271 @@
 # glossary_translator.py
 from __future__ import annotations
+import json
 import re
-from typing import List, Tuple, Dict
+import time
+from collections import Counter
+from typing import Any, List, Tuple, Dict
 
-from translate import translate_to_casual_japanese as _base_translate
+from glossary import GlossaryMatcher
+
+def _base_translate(text: str) -> str:
+    # translate は import 時に OpenAI クライアントを作るため、実際に翻訳するまで読み込まない
+    # （マスク処理だけを使うベンチマーク等はAPIキー無しで動く）
+    from translate import translate_to_casual_japanese
+    return translate_to_casual_japanese(text)
 
 PLACEHOLDER_PREFIX = "⟦P"
 PLACEHOLDER_SUFFIX = "⟧"
+_PLACEHOLDER_RE = re.compile(re.escape(PLACEHOLDER_PREFIX) + r"\d+" + re.escape(PLACEHOLDER_SUFFIX))
+
+# ---- 計測 ----
+def new_verify_counts() -> Dict[str, int]:
+    """
+    翻訳結果のプレースホルダ検査の集計（呼び出し側が持つ dict）。
+    translate_to_casual_japanese_glossary(_batch) の verify= に渡すと加算される。
+    """
+    return {"ok": 0, "retried": 0, "repaired": 0, "dropped": 0, "duplicated": 0}
+
+# ---- 計測（オプトイン） ----
+class GlossaryStats:
+    """
+    glossary 照合の計測値。enable_instrumentation() で有効化したときだけ記録する。
+    - term_hits: Term ごとのヒット数（一度も当たらない alias を削る判断材料）。
+      キーは照合器・regex リストどちらのモードでも日本語名（regex リストには英語名が残らないため）
+    - mask_sec / postfix_sec: テキスト1件あたりの走査時間
+    - placeholders: LLM から戻ってきた/消えたプレースホルダの数と、消えやすい語
+    """
+
+    def __init__(self):
+        self.term_hits: Dict[str, int] = {}
+        self.mask_sec: List[float] = []
+        self.postfix_sec: List[float] = []
+        self.placeholders_sent = 0
+        self.placeholders_returned = 0
+        self.dropped_terms: Dict[str, int] = {}
+        self.verify: Dict[str, int] = new_verify_counts()
+
+    def record_hit(self, label: str, count: int = 1) -> None:
+        self.term_hits[label] = self.term_hits.get(label, 0) + count
+
+    def record_survival(self, labels: Dict[str, str], translated: str) -> None:
+        for ph, label in labels.items():
+            self.placeholders_sent += 1
+            if ph in translated:
+                self.placeholders_returned += 1
+            else:
+                self.dropped_terms[label] = self.dropped_terms.get(label, 0) + 1
+
+    @staticmethod
+    def _summary(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {"count": 0, "total": 0.0, "mean": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(values)
+        return {
+            "count": len(ordered),
+            "total": sum(ordered),
+            "mean": sum(ordered) / len(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        sent = self.placeholders_sent
+        return {
+            "term_hits": dict(sorted(self.term_hits.items(), key=lambda kv: kv[1], reverse=True)),
+            "mask_sec": self._summary(self.mask_sec),
+            "postfix_sec": self._summary(self.postfix_sec),
+            "verify": dict(self.verify),
+            "placeholders": {
+                "sent": sent,
+                "returned": self.placeholders_returned,
+                "dropped": sent - self.placeholders_returned,
+                "survival_rate": (self.placeholders_returned / sent) if sent else 1.0,
+                "dropped_terms": dict(sorted(self.dropped_terms.items(), key=lambda kv: kv[1], reverse=True)),
+            },
+        }
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+_stats: GlossaryStats | None = None
+
+def enable_instrumentation() -> GlossaryStats:
+    """計測を有効化し、記録先の GlossaryStats を返す（既に有効ならそれを返す）"""
+    global _stats
+    if _stats is None:
+        _stats = GlossaryStats()
+    return _stats
+
+def disable_instrumentation() -> GlossaryStats | None:
+    """計測を止め、それまでの GlossaryStats を返す"""
+    global _stats
+    stats, _stats = _stats, None
+    return stats
+
+def _term_label(patterns: List[Tuple[re.Pattern, str]] | GlossaryMatcher, idx: int) -> str:
+    """計測用の語のキー。モードをまたいで比べられるよう、どちらも日本語名"""
+    if isinstance(patterns, GlossaryMatcher):
+        return patterns.ja[idx]
+    return patterns[idx][1]
 
-def _mask_terms(text: str, patterns: List[Tuple[re.Pattern, str]]):
+def _placeholder_labels(placeholder_map: Dict[str, str], patterns) -> Dict[str, str]:
+    n = len(PLACEHOLDER_PREFIX)
+    return {ph: _term_label(patterns, int(ph[n:-len(PLACEHOLDER_SUFFIX)])) for ph in placeholder_map}
+
+def _mask_terms(text: str, patterns: List[Tuple[re.Pattern, str]] | GlossaryMatcher):
+    t0 = time.perf_counter() if _stats else 0.0
     placeholder_map: Dict[str, str] = {}
-    masked = text
-    for idx, (pat, ja) in enumerate(patterns):
-        placeholder = f"{PLACEHOLDER_PREFIX}{idx}{PLACEHOLDER_SUFFIX}"
-        if placeholder in masked:
-            continue
-        masked, count = pat.subn(placeholder, masked)
-        if count > 0:
-            placeholder_map[placeholder] = ja
+    if isinstance(patterns, GlossaryMatcher):
+        # 1パス照合: 元テキストに同じプレースホルダ文字列が既にある語はマスクしない
+        parts: List[str] = []
+        last = 0
+        for start, end, idx in patterns.finditer(text):
+            placeholder = f"{PLACEHOLDER_PREFIX}{idx}{PLACEHOLDER_SUFFIX}"
+            if placeholder in text:
+                continue
+            placeholder_map[placeholder] = patterns.ja[idx]
+            parts.append(text[last:start])
+            parts.append(placeholder)
+            last = end
+            if _stats:
+                _stats.record_hit(_term_label(patterns, idx))
+        parts.append(text[last:])
+        masked = "".join(parts)
+    else:
+        masked = text
+        for idx, (pat, ja) in enumerate(patterns):
+            placeholder = f"{PLACEHOLDER_PREFIX}{idx}{PLACEHOLDER_SUFFIX}"
+            if placeholder in masked:
+                continue
+            masked, count = pat.subn(placeholder, masked)
+            if count > 0:
+                placeholder_map[placeholder] = ja
+                if _stats:
+                    _stats.record_hit(_term_label(patterns, idx), count)
+    if _stats:
+        _stats.mask_sec.append(time.perf_counter() - t0)
     return masked, placeholder_map
 
 def _unmask(text: str, placeholder_map: Dict[str, str]) -> str:
-    out = text
-    for ph, ja in placeholder_map.items():
-        out = out.replace(ph, ja)
+    # ⟦Pn⟧ を1回の regex 走査でまとめて戻す（未知のプレースホルダはそのまま）
+    if not placeholder_map:
+        return text
+    return _PLACEHOLDER_RE.sub(lambda m: placeholder_map.get(m.group(0), m.group(0)), text)
+
+def mask_terms_batch(texts: List[str], patterns: List[Tuple[re.Pattern, str]] | GlossaryMatcher) -> Tuple[List[str], List[Dict[str, str]]]:
+    """
+    複数テキストをまとめてマスクし、(マスク後テキストのリスト, テキストごとのプレースホルダ表) を返す。
+    プレースホルダ番号は Term 単位で共通なので、表はテキスト間で同じ語なら同じキーになる。
+    """
+    masked: List[str] = []
+    maps: List[Dict[str, str]] = []
+    for text in texts:
+        m, ph_map = _mask_terms(text, patterns)
+        masked.append(m)
+        maps.append(ph_map)
+    return masked, maps
+
+def unmask_batch(texts: List[str], placeholder_maps: List[Dict[str, str]]) -> List[str]:
+    """mask_terms_batch の対。テキストごとに1パスで ⟦Pn⟧ を日本語へ戻す"""
+    if len(texts) != len(placeholder_maps):
+        raise ValueError(f"texts と placeholder_maps の件数が一致しません: {len(texts)} != {len(placeholder_maps)}")
+    return [_unmask(t, m) for t, m in zip(texts, placeholder_maps)]
+
+def _post_fix_english_terms(text: str, patterns: List[Tuple[re.Pattern, str]] | GlossaryMatcher) -> str:
+    t0 = time.perf_counter() if _stats else 0.0
+    if isinstance(patterns, GlossaryMatcher):
+        out = patterns.sub(text)
+    else:
+        out = text
+        for pat, ja in patterns:
+            out = pat.sub(ja, out)
+    if _stats:
+        _stats.postfix_sec.append(time.perf_counter() - t0)
     return out
 
-def _post_fix_english_terms(text: str, patterns: List[Tuple[re.Pattern, str]]) -> str:
-    out = text
-    for pat, ja in patterns:
-        out = pat.sub(ja, out)
+def _translate_masked(masked: str, placeholder_map: Dict[str, str], patterns) -> str:
+    """マスク済みテキストを翻訳する（計測有効時はプレースホルダの生存も記録）"""
+    ja = _base_translate(masked)
+    if _stats and placeholder_map:
+        _stats.record_survival(_placeholder_labels(placeholder_map, patterns), ja)
+    return ja
+
+
+def _check_placeholders(masked: str, translated: str, placeholder_map: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """
+    翻訳結果のプレースホルダを元と突き合わせ、(消えたもの, 増えた/知らないもの) を返す。
+    同じ語が何度か出てくる文で LLM がまとめてしまうのは許容し、1つも残っていない場合だけ「消えた」とみなす。
+    """
+    found = Counter(_PLACEHOLDER_RE.findall(translated))
+    dropped = [ph for ph in placeholder_map if not found.get(ph)]
+    duplicated = [ph for ph, n in found.items() if n > masked.count(ph)]
+    return dropped, duplicated
+
+def _subset_patterns(patterns, placeholders: List[str]):
+    n = len(PLACEHOLDER_PREFIX)
+    ids = [int(ph[n:-len(PLACEHOLDER_SUFFIX)]) for ph in placeholders]
+    if isinstance(patterns, GlossaryMatcher):
+        return patterns.subset(ids)
+    return [patterns[i] for i in sorted(set(ids))]
+
+def _translate_verified(masked: str, placeholder_map: Dict[str, str], patterns, retries: int = 1,
+                        verify: Dict[str, int] | None = None) -> str:
+    """
+    翻訳→プレースホルダ検査→復元。
+    - 全部そろっていれば復元するだけ（後段の全語置換はしない）
+    - 消えた/増えた場合はそのコメントだけ retries 回まで翻訳し直す（再翻訳も生存率の計測に含める）
+    - それでも消えたままの語は、その語だけで英語表記の置換をかける
+    - 検査結果は verify（new_verify_counts の dict。省略可）と、計測有効時は GlossaryStats.verify に加算
+    """
+    ja = _translate_masked(masked, placeholder_map, patterns)
+    if not placeholder_map:
+        return ja
+    counts = new_verify_counts()
+    dropped, duplicated = _check_placeholders(masked, ja, placeholder_map)
+    attempt = 0
+    while (dropped or duplicated) and attempt < retries:
+        attempt += 1
+        counts["retried"] += 1
+        ja = _translate_masked(masked, placeholder_map, patterns)
+        dropped, duplicated = _check_placeholders(masked, ja, placeholder_map)
+
+    out = _unmask(ja, placeholder_map)
+    if not dropped and not duplicated:
+        counts["ok"] += 1
+    else:
+        counts["dropped"] += len(dropped)
+        counts["duplicated"] += len(duplicated)
+        if dropped:
+            counts["repaired"] += 1
+            out = _post_fix_english_terms(out, _subset_patterns(patterns, dropped))
+    for target in (verify, _stats.verify if _stats else None):
+        if target is not None:
+            for k, v in counts.items():
+                target[k] = target.get(k, 0) + v
     return out
 
-def translate_to_casual_japanese_glossary(en_text: str, patterns: List[Tuple] | None = None) -> str:
+def translate_to_casual_japanese_glossary(en_text: str, patterns: List[Tuple] | GlossaryMatcher | None = None,
+                                          verify: Dict[str, int] | None = None) -> str:
+    """
+    patterns は compile_glossary_patterns の (pattern, ja) リスト、
+    または compile_glossary_matcher の GlossaryMatcher（1パス照合・推奨）。
+    verify に new_verify_counts() の dict を渡すと、プレースホルダ検査の結果を加算する。
+    """
     if not patterns:
         return _base_translate(en_text)
     masked, ph_map = _mask_terms(en_text, patterns)
-    ja = _base_translate(masked)      # ★既存の翻訳関数をそのまま再利用
-    ja = _unmask(ja, ph_map)          # プレースホルダを日本語へ戻す
-    ja = _post_fix_english_terms(ja, patterns)  # 念のため最終置換
-    return ja
+    # ★既存の翻訳関数をそのまま再利用し、プレースホルダを検査してから日本語へ戻す
+    return _translate_verified(masked, ph_map, patterns, verify=verify)
+
+def translate_to_casual_japanese_glossary_batch(en_texts: List[str], patterns: List[Tuple] | GlossaryMatcher | None = None,
+                                                verify: Dict[str, int] | None = None) -> List[str]:
+    """
+    translate_to_casual_japanese_glossary の複数件版。
+    マスクはまとめて行い、翻訳APIと検査・復元は1件ずつ。
+    """
+    if not patterns:
+        return [_base_translate(t) for t in en_texts]
+    masked, ph_maps = mask_terms_batch(en_texts, patterns)
+    return [_translate_verified(m, pm, patterns, verify=verify) for m, pm in zip(masked, ph_maps)]
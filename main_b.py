@@ -5,33 +5,35 @@ import json
 import random
 from typing import List, Dict, Any
 
-from fetch_all import fetch_post_threads
-from editor import plan_script_with_llm
-from glossary import load_glossary, compile_glossary_patterns
+from fetch_all import fetch_post_threads_cached
+from editor import plan_script
+from dedup import collapse_near_duplicates
+from comment_index import CommentIndex
+from glossary import load_compiled_glossary
 from glossary_translator import translate_to_casual_japanese_glossary as translate_to_casual_japanese
+from glossary_translator import translate_to_casual_japanese_glossary_batch, enable_instrumentation, new_verify_counts
 from tts import generate_tts, POSTER_VOICE, COMMENT_VOICES
+from watch_subreddit import pop_next_candidate
+from duration_model import load_duration_model, trim_plan, plan_seconds
 
 OUT_DIR = "data"
 TTS_DIR = os.path.join(OUT_DIR, "tts")
 os.makedirs(TTS_DIR, exist_ok=True)
 
-def translate_selection(selection_ids: List[str], index: Dict[str, Dict[str, Any]], patterns) -> Dict[str, Dict[str, str]]:
+def translate_selection(selection_ids: List[str], index: Dict[str, Dict[str, Any]], patterns=None,
+                        verify: Dict[str, int] | None = None) -> Dict[str, Dict[str, str]]:
     """
     選ばれたコメント（ID）のみ翻訳してキャッシュ辞書を返す: {id: {"en":..., "ja":...}}
+    patterns を省略した場合はコンパイル済み glossary（キャッシュ）を使う。
+    verify（new_verify_counts の dict）を渡すとプレースホルダ検査の結果を加算する。
     """
-    # 事前に辞書をロード＆コンパイル（毎回ロードが嫌なら外に出してキャッシュでもOK）
-    # 正規化済みがあればそちらを優先
-    gl_path = "glossary_normalized.csv" if os.path.exists("glossary_normalized.csv") else "glossary.csv"
-    gl_terms = load_glossary(gl_path)
-    patterns = compile_glossary_patterns(gl_terms)
-
-    result = {}
-    for cid in selection_ids:
-        item = index[cid]
-        en = item["body"]
-        ja = translate_to_casual_japanese(en, patterns)  # ← glossary対応ラッパーを使う
-        result[cid] = {"en": en, "ja": ja}
-    return result
+    if patterns is None:
+        patterns = load_compiled_glossary()
+
+    # マスク／復元はまとめて1回で（翻訳APIは1件ずつ）
+    en_texts = [index[cid]["body"] for cid in selection_ids]
+    ja_texts = translate_to_casual_japanese_glossary_batch(en_texts, patterns, verify=verify)  # ← glossary対応ラッパーを使う
+    return {cid: {"en": en, "ja": ja} for cid, en, ja in zip(selection_ids, en_texts, ja_texts)}
 
 def build_index(threads: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     """
@@ -57,19 +59,28 @@ def flatten_scene_ids(plan: Dict[str, Any]) -> List[str]:
             dedup.append(x)
     return dedup
 
-def make_tts_files(title_ja: str, plan: Dict[str, Any], translations: Dict[str, Dict[str, str]]):
+def make_tts_files(title_ja: str, plan: Dict[str, Any], translations: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+    """TTS を作り、コメントID -> 使った voice を返す（render_plan に残して尺モデルの学習に使う）"""
+    # 前回の line_*.mp3 を消す（短い実行のあとに古い行が残ると、render_plan と mp3 の対応が取れなくなる）
+    for name in os.listdir(TTS_DIR):
+        if name.startswith("line_") and name.endswith(".mp3"):
+            os.remove(os.path.join(TTS_DIR, name))
     # タイトル読み上げ
     generate_tts(title_ja, POSTER_VOICE, os.path.join(TTS_DIR, "title.mp3"))
     # 各コメント読み上げ（ランダムボイス）
+    voices = {}
     count = 1
     for sc in plan["scenes"]:
         for cid in sc.get("comment_order", []):
             ja = translations[cid]["ja"]
             voice = random.choice(COMMENT_VOICES)
             generate_tts(ja, voice, os.path.join(TTS_DIR, f"line_{count:03d}.mp3"))
+            voices[cid] = voice
             count += 1
+    return voices
 
-def assemble_render_plan(plan: Dict[str, Any], translations: Dict[str, Dict[str, str]], index: Dict[str, Dict[str, Any]], title_ja: str) -> Dict[str, Any]:
+def assemble_render_plan(plan: Dict[str, Any], translations: Dict[str, Dict[str, str]], index: Dict[str, Dict[str, Any]], title_ja: str,
+                         voices: Dict[str, str] | None = None) -> Dict[str, Any]:
     """
     動画編集ツール向けのレンダリング・キュー（画面描画順）
     - シーン切替で 'clear': true を入れる
@@ -86,7 +97,8 @@ def assemble_render_plan(plan: Dict[str, Any], translations: Dict[str, Dict[str,
                 "quote_en": tr["en"][:120],
                 "author": meta.get("author"),
                 "score": meta.get("score"),
-                "permalink": meta.get("permalink")
+                "permalink": meta.get("permalink"),
+                "voice": (voices or {}).get(cid)
             })
         scenes_out.append({
             "clear": True,
@@ -95,47 +107,100 @@ def assemble_render_plan(plan: Dict[str, Any], translations: Dict[str, Dict[str,
         })
     return {
         "title_ja": title_ja,
+        "title_voice": POSTER_VOICE,
         "scenes": scenes_out
     }
 
 def main():
+    # 0) 計測（GLOSSARY_STATS_PATH を指定したときだけ）
+    stats_path = os.environ.get("GLOSSARY_STATS_PATH", "").strip()
+    gl_stats = enable_instrumentation() if stats_path else None
+
     # 1) 入力URL
     url = os.environ.get("REDDIT_POST_URL", "").strip()
+    if not url:
+        # watch_subreddit.py の候補キューがあれば順位が最も高いものを使う
+        cand = pop_next_candidate()
+        if cand:
+            url = cand["url"]
+            print(f"[i] 候補キューから投稿を選択: {cand['title']} ({url})")
     if not url:
         # デフォルト例（差し替えてください）
         url = "https://www.reddit.com/r/PTCGP/comments/1orpru1/favorite_oldest_meta/"
         print(f"[i] REDDIT_POST_URL が未設定のためデフォルトURLを使用: {url}")
 
     # 2) 全スレッド取得（広告・画像リンク除外、返信含む）
-    data = fetch_post_threads(url, max_threads=50, max_replies_per_thread=50)
+    #    data/raw/ にキャッシュがあれば差分だけ取り直す（RAW_CACHE_MAX_AGE_SEC 秒以内ならそのまま使う）
+    #    FETCH_MAX_THREADS: 取得するスレッド数の上限。1回のプロンプトに収まらない分は editor が
+    #    シャードごとの候補出し（並列）→ まとめの2段で構成する
+    max_age_sec = float(os.environ.get("RAW_CACHE_MAX_AGE_SEC", "600") or 600)
+    max_threads = int(os.environ.get("FETCH_MAX_THREADS", "150") or 150)
+    data = fetch_post_threads_cached(url, max_threads=max_threads, max_replies_per_thread=50, max_age_sec=max_age_sec)
     title_en = data["title"]
     print("[i] title:", title_en)
     print("[i] threads:", len(data["threads"]))
 
-    # ★ glossary の読み込みと patterns の生成（1回だけ）
-    gl_path = "glossary_normalized.csv" if os.path.exists("glossary_normalized.csv") else "glossary.csv"
-    gl_terms = load_glossary(gl_path)
-    patterns = compile_glossary_patterns(gl_terms)
+    # 取得した全コメントを全文検索インデックスへ（過去の投稿も含めて後から探せるように）
+    comment_index = CommentIndex()
+    comment_index.ingest(data)
+    comment_index.close()
+
+    # 2.5) ほぼ同じコメントを代表1件にまとめる（プロンプト・翻訳・TTS の無駄を減らす）
+    n_before = sum(1 + len(th["replies"]) for th in data["threads"])
+    data["threads"] = collapse_near_duplicates(data["threads"])
+    n_after = sum(1 + len(th["replies"]) for th in data["threads"])
+    print(f"[i] near-duplicate collapse: {n_before} -> {n_after} comments")
+
+    # 読み上げ時間の見積もりモデル（過去の TTS 結果から当てはめたもの。無ければ既定値）
+    target_sec = 180
+    duration = load_duration_model()
+    index = build_index(data["threads"])
+    scores = {cid: c["score"] for cid, c in index.items()}
 
     # 3) LLMで「3分構成」の選抜・順序化
-    plan = plan_script_with_llm(data["title"], data["threads"], target_duration_sec=180)
+    #    EDITOR_MODE=fast ならLLMを使わずローカルで即決（下書き用）。LLMが失敗した場合も自動でローカルに切り替え
+    #    同じ入力なら data/cache/plans/ の結果を再利用（EDITOR_CACHE=only / refresh / off で切り替え）
+    editor_mode = os.environ.get("EDITOR_MODE", "llm").strip() or "llm"
+    editor_kwargs = {"cache": os.environ.get("EDITOR_CACHE", "use").strip() or "use"} if editor_mode == "llm" else {}
+    plan = plan_script(data["title"], data["threads"], target_duration_sec=target_sec, mode=editor_mode,
+                       reading_chars_per_sec=duration.ja_chars_per_sec(), **editor_kwargs)
     # 例: {"scenes":[{"scene_title":"…","thread_top_id":"abc","comment_order":["abc","r1","r3"]}, ...]}
+
+    # 3.5) 事前チェック: 英語原文から尺を見積もり、目標を超える分は翻訳前に低スコアの返信から削る
+    #      （翻訳の量を減らすための粗い見積もり。最終的な尺は 4.5 の日本語での見積もりで決まる）
+    en_secs = {cid: duration.predict_en(index[cid]["body"]) for cid in flatten_scene_ids(plan)}
+    est = plan_seconds(plan, en_secs, duration.predict_en(title_en))
+    plan, dropped = trim_plan(plan, en_secs, scores, target_sec, duration.predict_en(title_en))
+    print(f"[i] estimated duration: {est:.1f}s (target {target_sec}s), trimmed {len(dropped)} comments before translation")
     with open(os.path.join(OUT_DIR, "plan.json"), "w", encoding="utf-8") as f:
         json.dump(plan, f, ensure_ascii=False, indent=2)
 
     # 4) 選ばれたコメントだけ翻訳
-    index = build_index(data["threads"])
+    # ★ glossary は翻訳直前に読む（コンパイル済みキャッシュがあれば読むだけ）
+    patterns = load_compiled_glossary()
     selection_ids = flatten_scene_ids(plan)
-    translations = translate_selection(selection_ids, index, patterns)
+    verify = new_verify_counts()
+    translations = translate_selection(selection_ids, index, patterns, verify)
 
     # タイトルも翻訳
-    title_ja = translate_to_casual_japanese(title_en, patterns)
+    title_ja = translate_to_casual_japanese(title_en, patterns, verify=verify)
+    print("[i] glossary placeholders:", ", ".join(f"{k}={v}" for k, v in verify.items()))
+
+    # 4.5) 翻訳後の日本語で見積もり直し、まだ長ければ TTS の前に削る
+    #      こちらが最終判断。3.5 で削ったものは戻さないので、英語の見積もりが長めに外れた分は短くなり得る
+    ja_secs = {cid: duration.predict(tr["ja"]) for cid, tr in translations.items()}
+    title_sec = duration.predict(title_ja, POSTER_VOICE)
+    plan, dropped = trim_plan(plan, ja_secs, scores, target_sec, title_sec)
+    print(f"[i] estimated duration (ja): {plan_seconds(plan, ja_secs, title_sec):.1f}s, trimmed {len(dropped)} more")
+    if dropped:
+        with open(os.path.join(OUT_DIR, "plan.json"), "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
 
     # 5) TTS音声を生成
-    make_tts_files(title_ja, plan, translations)
+    voices = make_tts_files(title_ja, plan, translations)
 
     # 6) レンダープランを保存（編集ツールへの入力）
-    render_plan = assemble_render_plan(plan, translations, index, title_ja)
+    render_plan = assemble_render_plan(plan, translations, index, title_ja, voices)
     os.makedirs(OUT_DIR, exist_ok=True)
     with open(os.path.join(OUT_DIR, "render_plan.json"), "w", encoding="utf-8") as f:
         json.dump(render_plan, f, ensure_ascii=False, indent=2)
@@ -149,12 +214,17 @@ def main():
                 f.write(f" - {translations[cid]['ja']}\n")
             f.write("\n")
 
+    if gl_stats:
+        gl_stats.dump(stats_path)
+
     print("\n=== Done (B-plan pipeline) ===")
     print("Outputs:")
     print(" - data/plan.json            … LLMが選んだシーン構成")
     print(" - data/render_plan.json     … 画面描画用のキュー（シーン単位でクリア→新規描画）")
     print(" - data/script_preview.txt   … 台本ざっくり確認用")
     print(" - data/tts/title.mp3, line_*.mp3  … 音声ファイル")
+    if gl_stats:
+        print(f" - {stats_path}  … glossary 照合の計測結果")
 
 if __name__ == "__main__":
     main()
@@ -2,8 +2,16 @@
 # 入力: カンマ区切りの CSV（ヘッダ有り/無しどちらでもOK）
 #       想定列: No, 日本語名, 英語名（順不同OK）
 # 出力: en,ja,type,aliases（カンマ区切り/UTF-8）
+# 複数ソース（ポケモン名/カード/ワザ/特性/トレーナー）をまとめる場合:
+#   python normalize_glossary.py --src pokemon=glossary.csv --src card=cards.csv --out glossary_normalized.csv
 import csv
 import argparse
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+from glossary import (
+    GLOSSARY_CACHE_DIR, Term, compile_glossary_matcher, glossary_digest, save_compiled_glossary,
+)
 
 def guess_header(tokens):
     joined = " ".join(tokens).lower()
@@ -38,25 +46,26 @@ def gen_aliases(en: str) -> str:
     variants = [v for v in variants if v]
     return ";".join(sorted(variants, key=len, reverse=True))
 
-def normalize(in_path: str, out_path: str):
+def _iter_rows(in_path: str) -> Iterator[List[str]]:
+    """CSVを1行ずつ読む（空行は除外）。ファイル全体はメモリに載せない"""
     # UTF-8 BOM 付きも吸収
     with open(in_path, "r", encoding="utf-8-sig", newline="") as fi:
-        # まず生で全部読み込む（空行は除外）
-        raw_lines = [ln.rstrip("\r\n") for ln in fi if ln.strip() != ""]
-    if not raw_lines:
-        raise ValueError("入力CSVが空です。")
+        for r in csv.reader(fi, delimiter=","):
+            if any(c.strip() for c in r):
+                yield r
 
-    # カンマ区切り前提で分解（ExcelのCSVならOK）
-    def split(line):
-        return next(csv.reader([line], delimiter=","))
+def detect_columns(in_path: str, sample_size: int = 50) -> Tuple[bool, int, int]:
+    """
+    先頭 sample_size 行だけを見て (ヘッダ有無, 英語名の列, 日本語名の列) を推定する。
+    """
+    rows = list(islice(_iter_rows(in_path), sample_size + 1))
+    if not rows:
+        raise ValueError(f"入力CSVが空です: {in_path}")
 
-    first = split(raw_lines[0])
+    first = rows[0]
     has_header = guess_header(first)
-
-    rows = []
     headers = first if has_header else None
-    for ln in (raw_lines[1:] if has_header else raw_lines):
-        rows.append(split(ln))
+    sample = rows[1:] if has_header else rows[:sample_size]
 
     # 列インデックスを決める
     def find_col_index_by_name(headers, candidates):
@@ -73,10 +82,10 @@ def normalize(in_path: str, out_path: str):
 
     # ヘッダから見つからなければ中身の特徴で推定
     if idx_ja is None or idx_en is None:
-        num_cols = max(len(r) for r in rows) if rows else 0
+        num_cols = max(len(r) for r in sample) if sample else len(first)
         scores_ja = [0.0]*num_cols
         scores_en = [0.0]*num_cols
-        for r in rows[:50]:
+        for r in sample:
             for i in range(num_cols):
                 val = r[i] if i < len(r) else ""
                 scores_ja[i] += metric_ja(val)
@@ -87,22 +96,101 @@ def normalize(in_path: str, out_path: str):
             cands = [i for i in range(num_cols) if i != idx_ja]
             idx_en = max(cands, key=lambda i: scores_en[i]) if cands else 0
 
-    # 出力
-    with open(out_path, "w", encoding="utf-8", newline="") as fo:
-        w = csv.writer(fo)
-        w.writerow(["en","ja","type","aliases"])
-        for r in rows:
-            en = (r[idx_en] if idx_en is not None and idx_en < len(r) else "").strip()
-            ja = (r[idx_ja] if idx_ja is not None and idx_ja < len(r) else "").strip()
-            if not en and not ja:
-                continue
-            w.writerow([en, ja, "pokemon", gen_aliases(en)])
+    return has_header, idx_en, idx_ja
+
+def _dedupe_key(en: str) -> str:
+    return " ".join(en.casefold().split())
+
+def build(sources: List[Tuple[str, str]], out_path: str, conflicts_path: str | None = None,
+          cache_dir: str | None = GLOSSARY_CACHE_DIR) -> Dict[str, int]:
+    """
+    複数の入力CSV（(type, path) のリスト。例: pokemon / card / attack / ability / trainer）を
+    ストリームで読み、en,ja,type,aliases の正規化CSVを書き出す。
+    - 同じ en（大文字小文字・空白の違いは同一視）は先に出てきたソースを採用
+    - 同じ en で ja が食い違うものは conflicts_path に書き出す（指定時）
+    - en か ja の片方だけの行も（従来どおり）書き出す。両方空の行だけ捨てる。
+      片方だけの行は重複判定に使わず、照合器にも入れない（load_glossary と同じ扱い）
+    - cache_dir を指定すると、照合器（glossary.<sha>.bin）も同時に作る
+    入力は1行ずつ読むので元のCSV全体はメモリに載らないが、重複判定用の辞書と照合器用の
+    Term 一覧は語数に比例してメモリに残る（定数メモリではない）。
+    """
+    seen: Dict[str, Tuple[str, str, str]] = {}  # key -> (en, ja, type)
+    terms: List[Term] = []
+    stats = {"rows": 0, "written": 0, "duplicates": 0, "conflicts": 0, "partial": 0, "skipped": 0}
+
+    fc = open(conflicts_path, "w", encoding="utf-8", newline="") if conflicts_path else None
+    try:
+        wc = csv.writer(fc) if fc else None
+        if wc:
+            wc.writerow(["en", "ja_kept", "type_kept", "ja_other", "type_other", "source_other"])
+        with open(out_path, "w", encoding="utf-8", newline="") as fo:
+            w = csv.writer(fo)
+            w.writerow(["en","ja","type","aliases"])
+            for typ, in_path in sources:
+                has_header, idx_en, idx_ja = detect_columns(in_path)
+                rows = _iter_rows(in_path)
+                if has_header:
+                    next(rows, None)
+                for r in rows:
+                    stats["rows"] += 1
+                    en = (r[idx_en] if idx_en < len(r) else "").strip()
+                    ja = (r[idx_ja] if idx_ja < len(r) else "").strip()
+                    if not en and not ja:
+                        stats["skipped"] += 1
+                        continue
+                    if not en or not ja:
+                        # 片方だけの行: 書き出すが、照合器には入れない
+                        w.writerow([en, ja, typ, gen_aliases(en)])
+                        stats["partial"] += 1
+                        stats["written"] += 1
+                        continue
+                    key = _dedupe_key(en)
+                    prev = seen.get(key)
+                    if prev is not None:
+                        stats["duplicates"] += 1
+                        if prev[1] != ja:
+                            stats["conflicts"] += 1
+                            if wc:
+                                wc.writerow([prev[0], prev[1], prev[2], ja, typ, in_path])
+                        continue
+                    seen[key] = (en, ja, typ)
+                    aliases = gen_aliases(en)
+                    w.writerow([en, ja, typ, aliases])
+                    terms.append(Term(en=en, ja=ja, aliases=[a for a in aliases.split(";") if a], typ=typ))
+                    stats["written"] += 1
+    finally:
+        if fc:
+            fc.close()
+
+    if cache_dir:
+        idx_path = save_compiled_glossary(compile_glossary_matcher(terms), glossary_digest(out_path), cache_dir)
+        print(f"[OK] index -> {idx_path}")
+    print(f"[OK] -> {out_path} (rows={stats['rows']}, written={stats['written']}, "
+          f"duplicates={stats['duplicates']}, conflicts={stats['conflicts']}, partial={stats['partial']}, "
+          f"skipped={stats['skipped']})")
+    return stats
+
+def normalize(in_path: str, out_path: str):
+    """単一のポケモン名CSVを正規化する（build の1ソース版）"""
+    build([("pokemon", in_path)], out_path, cache_dir=None)
 
-    print(f"[OK] -> {out_path}")
+def _parse_source(spec: str) -> Tuple[str, str]:
+    typ, sep, path = spec.partition("=")
+    if not sep or not typ or not path:
+        raise argparse.ArgumentTypeError(f"TYPE=PATH の形式で指定してください: {spec}")
+    return typ.strip(), path.strip()
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
-    ap.add_argument("--in", dest="in_path", required=True, help="入力CSV（No/日本語名/英語名）")
+    ap.add_argument("--in", dest="in_path", help="入力CSV（No/日本語名/英語名）。type は pokemon")
+    ap.add_argument("--src", dest="sources", action="append", type=_parse_source, default=[],
+                    metavar="TYPE=PATH", help="追加の入力CSV（複数指定可）例: --src card=cards.csv")
     ap.add_argument("--out", dest="out_path", required=True, help="出力CSV（en,ja,type,aliases）")
+    ap.add_argument("--conflicts", dest="conflicts_path", help="ja が食い違う重複の書き出し先CSV")
+    ap.add_argument("--no-index", action="store_true", help="照合器キャッシュを作らない")
     args = ap.parse_args()
-    normalize(args.in_path, args.out_path)
+    sources = ([("pokemon", args.in_path)] if args.in_path else []) + args.sources
+    if not sources:
+        ap.error("--in か --src を1つ以上指定してください")
+    build(sources, args.out_path, conflicts_path=args.conflicts_path,
+          cache_dir=None if args.no_index else GLOSSARY_CACHE_DIR)
@@ -0,0 +1,143 @@
+# ranking.py
+# - スレッドの並べ替え（代表スコア）を NumPy でまとめて計算する
+# - 特徴量を全スレッド分の配列として一度に作り、重み付き和（または任意の関数）で採点 → 一括で上位K件
+# - 既定の重みは従来の式（トップのscore + 返信上位5件の合計 * 0.5 + 返信数 * 0.3）と同じ
+# 重みの設定ファイル（環境変数 THREAD_RANKING に JSON のパス）:
+#   {"weights": {"top_score": 1.0, "reply_top5": 0.5, "reply_count": 0.3, "recency": 20.0}, "intercept": 0.0}
+#   学習した線形モデルの係数もこの形で渡せる
+from __future__ import annotations
+import json
+import time
+from itertools import chain
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# 使える特徴量（すべてスレッド単位の float 配列）
+FEATURES = (
+    "top_score",      # トップコメントの score
+    "reply_top5",     # 返信上位5件の score 合計（返信は score 降順で並んでいる前提）
+    "reply_count",    # 返信数
+    "body_len",       # トップコメントの文字数
+    "recency",        # 新しさ 1 / (1 + 経過時間[h] / 24)。created_utc が無ければ 0
+    "glossary_hits",  # トップ＋返信に出てくる用語集の語の数（matcher を渡したときだけ）
+)
+
+DEFAULT_WEIGHTS: Dict[str, float] = {"top_score": 1.0, "reply_top5": 0.5, "reply_count": 0.3}
+
+def extract_features(
+    threads: List[Dict[str, Any]],
+    matcher=None,
+    now: float | None = None,
+    names: tuple = FEATURES,
+) -> Dict[str, np.ndarray]:
+    """
+    threads（fetch_post_threads の "threads"）から特徴量を配列で作る。
+    返信は全スレッド分を1本の配列に並べ、スレッド番号ごとに bincount で集計する（スレッドごとのループをしない）。
+    names に無い特徴量は計算しない。
+    """
+    n = len(threads)
+    tops = [th["top"] for th in threads]
+    counts = np.fromiter((len(th["replies"]) for th in threads), dtype=np.int64, count=n)
+    feats: Dict[str, np.ndarray] = {}
+
+    if "top_score" in names:
+        feats["top_score"] = np.fromiter((t["score"] or 0 for t in tops), dtype=np.float64, count=n)
+    if "reply_count" in names:
+        feats["reply_count"] = counts.astype(np.float64)
+    if "reply_top5" in names:
+        total = int(counts.sum())
+        reply_scores = np.fromiter((r["score"] or 0 for th in threads for r in th["replies"]),
+                                   dtype=np.float64, count=total)
+        owner = np.repeat(np.arange(n), counts)
+        starts = np.cumsum(counts) - counts
+        rank_in_thread = np.arange(total) - starts[owner]
+        keep = rank_in_thread < 5
+        feats["reply_top5"] = np.bincount(owner[keep], weights=reply_scores[keep], minlength=n)
+    if "body_len" in names:
+        feats["body_len"] = np.fromiter((len(t.get("body") or "") for t in tops), dtype=np.float64, count=n)
+    if "recency" in names:
+        created = np.fromiter((t.get("created_utc") or np.nan for t in tops), dtype=np.float64, count=n)
+        age_h = np.maximum((now if now is not None else time.time()) - created, 0.0) / 3600.0
+        feats["recency"] = np.nan_to_num(1.0 / (1.0 + age_h / 24.0), nan=0.0)
+    if "glossary_hits" in names:
+        if matcher is None:
+            feats["glossary_hits"] = np.zeros(n)
+        else:
+            feats["glossary_hits"] = np.fromiter(
+                (sum(1 for c in chain([th["top"]], th["replies"]) for _ in matcher.finditer(c.get("body") or ""))
+                 for th in threads),
+                dtype=np.float64, count=n,
+            )
+    return feats
+
+class ThreadRanker:
+    """
+    スレッドの採点と並べ替え。
+    - weights: 特徴量名 → 重み（既定は DEFAULT_WEIGHTS）。intercept は定数項
+    - score_fn を渡すと重み付き和の代わりに score_fn(features) -> ndarray を使う（学習済みモデルなど）
+    - matcher: glossary_hits を使うときの GlossaryMatcher（省略時は必要になった時点で読み込む）
+    """
+
+    def __init__(
+        self,
+        weights: Dict[str, float] | None = None,
+        intercept: float = 0.0,
+        score_fn: Callable[[Dict[str, np.ndarray]], np.ndarray] | None = None,
+        matcher=None,
+    ):
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        unknown = set(self.weights) - set(FEATURES)
+        if unknown:
+            raise ValueError(f"未知の特徴量: {sorted(unknown)}（使えるもの: {', '.join(FEATURES)}）")
+        self.intercept = intercept
+        self.score_fn = score_fn
+        self.matcher = matcher
+
+    @classmethod
+    def from_config(cls, path: str | None = None) -> "ThreadRanker":
+        """JSON（{"weights": {...}, "intercept": 0.0}）から作る。path が無ければ既定の重み"""
+        if not path:
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        return cls(weights=cfg.get("weights"), intercept=float(cfg.get("intercept", 0.0)))
+
+    def _needed(self) -> tuple:
+        if self.score_fn is not None:
+            return FEATURES
+        return tuple(k for k, w in self.weights.items() if w)
+
+    def score(self, threads: List[Dict[str, Any]], now: float | None = None) -> np.ndarray:
+        names = self._needed()
+        matcher = self.matcher
+        if "glossary_hits" in names and matcher is None:
+            from glossary import load_compiled_glossary
+            matcher = self.matcher = load_compiled_glossary()
+        feats = extract_features(threads, matcher=matcher, now=now, names=names)
+        if self.score_fn is not None:
+            return np.asarray(self.score_fn(feats), dtype=np.float64)
+        scores = np.full(len(threads), self.intercept, dtype=np.float64)
+        for k in names:
+            scores += self.weights[k] * feats[k]
+        return scores
+
+    def rank(self, threads: List[Dict[str, Any]], k: int | None = None, now: float | None = None) -> List[Dict[str, Any]]:
+        """
+        代表スコアの高い順に上位 k 件（None なら全件）を返す。
+        戻り値は "score" を付け直した新しい dict で、渡した threads は書き換えない（"top" / "replies" は共有）。
+        同点は元の並び順を保つ（従来の安定ソートと同じ結果）。
+        """
+        n = len(threads)
+        if n == 0 or (k is not None and k <= 0):
+            return []
+        scores = self.score(threads, now=now)
+        if k is not None and k < n:
+            thr = np.partition(scores, n - k)[n - k]  # k 番目に大きい値
+            above = np.flatnonzero(scores > thr)
+            ties = np.flatnonzero(scores == thr)[: k - len(above)]
+            sel = np.sort(np.concatenate([above, ties]))
+        else:
+            sel = np.arange(n)
+        order = sel[np.argsort(-scores[sel], kind="stable")]
+        return [{**threads[i], "score": float(scores[i])} for i in order.tolist()]
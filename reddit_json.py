@@ -0,0 +1,280 @@
+# reddit_json.py
+# - praw を使わずに Reddit の JSON API から投稿のコメントをまとめて取得する（fetch_post_threads の backend="json"）
+# - httpx の keep-alive 接続プール＋gzip で、投稿本体を1回、"load more" は /api/morechildren に
+#   最大100件ずつまとめて問い合わせる（praw は MoreComments を1つずつ展開する）
+# - 結果は fetch_post_threads と同じ {"title", "permalink", "threads"} の形
+# 認証は praw と同じ REDDIT_CLIENT_ID / REDDIT_CLIENT_SECRET（application-only OAuth）。
+# 注意: reddit_replay の記録／再生は requests.Session 用なので、この backend には効かない。
+from __future__ import annotations
+import heapq
+import os
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+API_BASE = "https://oauth.reddit.com"
+TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+MORECHILDREN_MAX = 100  # /api/morechildren に1回で渡せる ID 数の上限
+
+class RedditJSONClient:
+    """
+    Reddit JSON API の薄いクライアント。
+    - 1つの httpx.Client（接続プール）を使い回す。スレッド間で共有してよい
+    - bucket（fetch_all.TokenBucket）を渡すとリクエストごとに予算を消費する
+    """
+
+    def __init__(
+        self,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        user_agent: str | None = None,
+        bucket=None,
+        timeout: float = 30.0,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        load_dotenv()
+        self.client_id = client_id or os.getenv("REDDIT_CLIENT_ID")
+        self.client_secret = client_secret or os.getenv("REDDIT_CLIENT_SECRET")
+        if not self.client_id or not self.client_secret:
+            raise RuntimeError("REDDIT_CLIENT_ID / REDDIT_CLIENT_SECRET が未設定です")
+        self.bucket = bucket
+        self.requests = 0
+        self._token: str | None = None
+        self._token_expires = 0.0
+        self._http = httpx.Client(
+            headers={
+                "User-Agent": user_agent or os.getenv("REDDIT_USER_AGENT", "PokePokeScraper/2.0"),
+                "Accept-Encoding": "gzip",
+            },
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=16),
+            transport=transport,
+        )
+
+    def close(self) -> None:
+        self._http.close()
+
+    def __enter__(self) -> "RedditJSONClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _access_token(self) -> str:
+        if self._token is None or time.time() >= self._token_expires:
+            resp = self._http.post(TOKEN_URL, auth=(self.client_id, self.client_secret),
+                                   data={"grant_type": "client_credentials"})
+            resp.raise_for_status()
+            body = resp.json()
+            self._token = body["access_token"]
+            self._token_expires = time.time() + float(body.get("expires_in", 3600)) - 60
+        return self._token
+
+    def get(self, path: str, params: Dict[str, Any] | None = None) -> Any:
+        """GET して JSON を返す。401 ならトークンを取り直し、429 なら Retry-After だけ待って1回だけ再試行"""
+        params = {"raw_json": 1, **(params or {})}
+        for attempt in range(2):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self.requests += 1
+            resp = self._http.get(API_BASE + path, params=params,
+                                  headers={"Authorization": f"bearer {self._access_token()}"})
+            if attempt == 0 and resp.status_code == 401:
+                self._token = None
+                continue
+            if attempt == 0 and resp.status_code == 429:
+                wait = float(resp.headers.get("retry-after", 2))
+                print(f"[!] Reddit API rate limit: {wait:.0f}s 待って再試行")
+                time.sleep(wait)
+                continue
+            resp.raise_for_status()
+            return resp.json()
+
+    def comments(self, submission_id: str, sort: str = "top", limit: int = 500) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """投稿本体とコメントツリー（Listing の children）"""
+        listing = self.get(f"/comments/{submission_id}", {"sort": sort, "limit": limit})
+        return listing[0]["data"]["children"][0]["data"], listing[1]["data"]["children"]
+
+    def continue_thread(self, submission_id: str, comment_id: str, sort: str = "top") -> List[Dict[str, Any]]:
+        """「続きを読む」（深いスレッド）: comment_id 以下のツリー"""
+        listing = self.get(f"/comments/{submission_id}/_/{comment_id}", {"sort": sort, "limit": 500})
+        return listing[1]["data"]["children"]
+
+    def morechildren(self, submission_id: str, children: List[str], sort: str = "top") -> List[Dict[str, Any]]:
+        """"load more" の ID（最大 MORECHILDREN_MAX 件）をまとめて展開する。戻り値は平らな things"""
+        body = self.get("/api/morechildren", {
+            "api_type": "json",
+            "link_id": f"t3_{submission_id}",
+            "children": ",".join(children),
+            "sort": sort,
+            "limit_children": "false",
+        })
+        return body.get("json", {}).get("data", {}).get("things", [])
+
+def _collect(things: Iterable[Dict[str, Any]], comments: Dict[str, Dict[str, Any]], mores: List[Dict[str, Any]]) -> None:
+    """ツリー（または morechildren の平らな things）を comments（ID → data）と未展開の more に振り分ける"""
+    stack = list(things)
+    while stack:
+        thing = stack.pop()
+        data = thing.get("data", {})
+        if thing.get("kind") == "t1":
+            comments[data["id"]] = data
+            replies = data.get("replies")
+            if replies:
+                stack.extend(replies["data"]["children"])
+        elif thing.get("kind") == "more":
+            mores.append(data)
+
+def expand_all(
+    client: RedditJSONClient,
+    submission_id: str,
+    things: List[Dict[str, Any]],
+    max_requests: int | None = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+    """
+    コメントツリーの "load more" を展開しきって、全コメントを ID → data で返す。
+    - 浅い（トップレベルに近い）もの・件数の多いものから、ID を MORECHILDREN_MAX 件ずつまとめて問い合わせる
+    - max_requests を超えたら残りは展開しない（戻り値の統計に skipped として残る）
+    """
+    comments: Dict[str, Dict[str, Any]] = {}
+    mores: List[Dict[str, Any]] = []
+    _collect(things, comments, mores)
+    used = 0
+    while mores and (max_requests is None or used < max_requests):
+        mores.sort(key=lambda m: (m.get("depth", 0), -(m.get("count") or 0)))
+        pending, mores = mores, []
+        ids: List[str] = []
+        for m in pending:
+            if m.get("children"):
+                ids.extend(m["children"])
+            elif m.get("parent_id", "").startswith("t1_"):
+                # children が空の more は「続きを読む」（深すぎて省略されたスレッド）
+                if max_requests is not None and used >= max_requests:
+                    mores.append(m)
+                    continue
+                _collect(client.continue_thread(submission_id, m["parent_id"][3:]), comments, mores)
+                used += 1
+        ids = [i for i in dict.fromkeys(ids) if i not in comments]
+        for k in range(0, len(ids), MORECHILDREN_MAX):
+            if max_requests is not None and used >= max_requests:
+                rest = ids[k:]
+                mores.append({"children": rest, "count": len(rest), "depth": 0})
+                break
+            _collect(client.morechildren(submission_id, ids[k:k + MORECHILDREN_MAX]), comments, mores)
+            used += 1
+    skipped = sum(len(m.get("children") or []) for m in mores)
+    return comments, {"requests": used, "skipped": len(mores), "skipped_comments": skipped}
+
+def _author(data: Dict[str, Any]) -> str | None:
+    # praw と同じく、削除済みアカウントは author なし扱い
+    author = data.get("author")
+    return None if author in (None, "[deleted]") else author
+
+def _to_obj(data: Dict[str, Any]) -> Dict[str, Any]:
+    """fetch_all._to_obj と同じ形"""
+    return {
+        "id": data["id"],
+        "author": _author(data) or "[deleted]",
+        "body": (data.get("body") or "").strip(),
+        "score": data.get("score", 0),
+        "created_utc": data.get("created_utc"),
+        "permalink": f"https://www.reddit.com{data.get('permalink', '')}",
+    }
+
+def build_threads(
+    submission_id: str,
+    comments: Dict[str, Dict[str, Any]],
+    comment_filter,
+    max_threads: int = 50,
+    max_replies_per_thread: int = 50,
+    filter_stats=None,
+) -> List[Dict[str, Any]]:
+    """
+    ID → data のコメントを fetch_post_threads と同じスレッド構造にする（iter_post_threads と同じ選び方）。
+    返信はトップコメント配下の全子孫から、除外ルールを通ったものを score 上位 max_replies_per_thread 件。
+    """
+    link = f"t3_{submission_id}"
+    root: Dict[str, str | None] = {}
+
+    def root_of(cid: str) -> str | None:
+        path = []
+        while cid not in root:
+            data = comments.get(cid)
+            if data is None:
+                root[cid] = None  # 親が取れていない（展開しきれなかった）
+                break
+            parent = data.get("parent_id", "")
+            if parent == link:
+                root[cid] = cid
+                break
+            path.append(cid)
+            cid = parent[3:]
+        r = root[cid]
+        for p in path:
+            root[p] = r
+        return r
+
+    kept = {cid: d for cid, d in comments.items() if comment_filter.reject_reason(_author(d), d.get("body"), filter_stats) is None}
+    by_root: Dict[str, List[Dict[str, Any]]] = {}
+    tops: List[Dict[str, Any]] = []
+    for cid, d in kept.items():
+        r = root_of(cid)
+        if r is None:
+            continue
+        if r == cid:
+            tops.append(d)
+        else:
+            by_root.setdefault(r, []).append(d)
+
+    from fetch_all import _thread_score
+    score = lambda d: d.get("score", 0)
+    threads = []
+    for top in heapq.nlargest(max_threads, tops, key=score):
+        top_obj = _to_obj(top)
+        replies_obj = [_to_obj(r) for r in heapq.nlargest(max_replies_per_thread, by_root.get(top["id"], []), key=score)]
+        threads.append({"top": top_obj, "replies": replies_obj, "score": _thread_score(top_obj, replies_obj)})
+    return threads
+
+def fetch_post_threads_json(
+    post_url: str,
+    max_threads: int = 50,
+    max_replies_per_thread: int = 50,
+    client: RedditJSONClient | None = None,
+    more_budget: int | None = None,
+) -> Dict[str, Any]:
+    """
+    fetch_post_threads(backend="json") の本体。戻り値の形は fetch_post_threads と同じ。
+    more_budget を指定すると "load more" の問い合わせ回数を抑え、展開状況を "expansion" に入れる。
+    """
+    from fetch_all import get_comment_filter, get_thread_ranker, submission_id_from
+
+    sid = submission_id_from(post_url)
+    own = client is None
+    client = client or RedditJSONClient()
+    try:
+        t0 = time.perf_counter()
+        post, things = client.comments(sid)
+        comments, expansion = expand_all(client, sid, things, max_requests=more_budget)
+        dt = time.perf_counter() - t0
+    finally:
+        if own:
+            client.close()
+    print(f"[i] json backend: {len(comments)} comments, {client.requests} requests, {dt:.2f}s")
+
+    comment_filter = get_comment_filter()
+    filter_stats = comment_filter.new_stats()
+    threads = build_threads(sid, comments, comment_filter, max_threads, max_replies_per_thread, filter_stats)
+    threads = get_thread_ranker().rank(threads)
+    print("[i] filter rejects:", filter_stats.summary())
+
+    result = {
+        "title": post.get("title", ""),
+        "permalink": f"https://www.reddit.com{post.get('permalink', '')}",
+        "threads": threads,
+        "filter_stats": filter_stats.to_dict(),
+    }
+    if more_budget is not None:
+        result["expansion"] = expansion
+    return result
@@ -0,0 +1,163 @@
+# reddit_replay.py
+# - praw の HTTP 通信を記録／再生する requests.Session
+# - 記録: REDDIT_RECORD=fixtures/post.json.gz  … 実行中の通信をすべて保存（終了時に書き出し）
+# - 再生: REDDIT_REPLAY=fixtures/post.json.gz  … ネットワーク無しで記録したレスポンスを返す
+#         REDDIT_REPLAY_LATENCY_MS=120 のように指定すると1リクエストごとに待つ（実環境の遅延を模擬）
+# fetch_all / fetch_data はどちらも session_from_env() を見るので、コード側の変更なしで切り替わる。
+# fixture は共有・コミットする前提なので、トークン取得（/api/v1/access_token）のトークンは伏せて記録し、
+# 送った認証情報（password grant の username/password など）もキーに入れない。再生時はダミーのトークンを返す。
+from __future__ import annotations
+import atexit
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+FIXTURE_VERSION = 2  # 2: トークン取得の応答を伏せるようにした（1 の fixture は本物のトークンを含むので録り直す）
+# 再生に必要なヘッダだけ残す（x-ratelimit-* を残すと再生時に prawcore が待ってしまう）
+_KEEP_HEADERS = ("content-type",)
+_TOKEN_PATH = "/api/v1/access_token"
+_SECRET_FIELDS = ("access_token", "refresh_token")
+REPLAY_TOKEN = "replay-token"
+
+def _normalize_pairs(value: Any) -> List[List[str]]:
+    if not value:
+        return []
+    items = value.items() if isinstance(value, dict) else value
+    return sorted([str(k), str(v)] for k, v in items)
+
+def _request_key(method: str, url: str, params: Any = None, data: Any = None, json_body: Any = None) -> str:
+    parts = urlsplit(url)
+    if parts.path.endswith(_TOKEN_PATH):
+        data = json_body = None  # 認証情報は記録しない（トークン取得はどれも同じ応答でよい）
+    return json.dumps([
+        method.upper(),
+        f"{parts.netloc}{parts.path}",
+        _normalize_pairs(params),
+        _normalize_pairs(data),
+        json_body,
+    ], ensure_ascii=False, sort_keys=True)
+
+def _redact(url: str, body: str) -> str:
+    """トークン取得の応答からトークンを伏せる（それ以外はそのまま）"""
+    if not urlsplit(url).path.endswith(_TOKEN_PATH):
+        return body
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return ""
+    if isinstance(payload, dict):
+        for k in _SECRET_FIELDS:
+            if k in payload:
+                payload[k] = REPLAY_TOKEN
+    return json.dumps(payload)
+
+class RecordingSession(requests.Session):
+    """通常どおり通信しつつ、リクエストとレスポンスを記録する"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.exchanges: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        atexit.register(self.save)
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        resp = super().request(method, url, params=params, data=data, json=json, **kwargs)
+        entry = {
+            "key": _request_key(method, url, params, data, json),
+            "status": resp.status_code,
+            "headers": {k: v for k, v in resp.headers.items() if k.lower() in _KEEP_HEADERS},
+            "body": _redact(url, resp.text),
+        }
+        with self._lock:
+            self.exchanges.append(entry)
+        return resp
+
+    def save(self) -> None:
+        with self._lock:
+            exchanges = list(self.exchanges)
+        if not exchanges:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump({"version": FIXTURE_VERSION, "exchanges": exchanges}, f, ensure_ascii=False, separators=(",", ":"))
+        print(f"[i] Reddit 通信を記録: {self.path} ({len(exchanges)} requests)")
+
+class ReplaySession(requests.Session):
+    """
+    記録済みのレスポンスを返す（ネットワークには出ない）。
+    同じリクエストが複数回記録されていれば記録順に返し、尽きたら最後のものを返し続ける。
+    """
+
+    def __init__(self, path: str, latency_sec: float = 0.0, jitter_sec: float = 0.0):
+        super().__init__()
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            fixture = json.load(f)
+        if fixture.get("version") != FIXTURE_VERSION:
+            raise ValueError(f"未対応の fixture バージョンです: {fixture.get('version')} ({path})")
+        self.path = path
+        self.latency_sec = latency_sec
+        self.jitter_sec = jitter_sec
+        self._responses: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        for ex in fixture["exchanges"]:
+            self._responses[ex["key"]].append(ex)
+        self._lock = threading.Lock()
+        self.served = 0
+
+    def request(self, method, url, params=None, data=None, json=None, **kwargs):
+        key = _request_key(method, url, params, data, json)
+        with self._lock:
+            queue = self._responses.get(key)
+            if not queue:
+                raise LookupError(f"記録にないリクエストです: {method.upper()} {url} params={params}")
+            ex = queue.popleft() if len(queue) > 1 else queue[0]
+            self.served += 1
+        if self.latency_sec or self.jitter_sec:
+            time.sleep(self.latency_sec + random.uniform(0, self.jitter_sec))
+
+        resp = requests.Response()
+        resp.status_code = ex["status"]
+        resp.headers = CaseInsensitiveDict(ex["headers"])
+        resp._content = ex["body"].encode("utf-8")
+        resp.encoding = "utf-8"
+        resp.url = url
+        resp.request = requests.Request(method, url, params=params).prepare()
+        return resp
+
+_ENV_SESSION: requests.Session | None = None
+_ENV_LOCK = threading.Lock()
+
+def session_from_env() -> requests.Session | None:
+    """
+    環境変数 REDDIT_RECORD / REDDIT_REPLAY に応じた Session を返す（どちらも無ければ None）。
+    プロセス内で1つだけ作り、fetch_all / fetch_data で共有する。
+    """
+    global _ENV_SESSION
+    with _ENV_LOCK:
+        if _ENV_SESSION is None:
+            replay = os.getenv("REDDIT_REPLAY", "").strip()
+            record = os.getenv("REDDIT_RECORD", "").strip()
+            if replay:
+                latency = float(os.getenv("REDDIT_REPLAY_LATENCY_MS", "0") or 0) / 1000.0
+                _ENV_SESSION = ReplaySession(replay, latency_sec=latency, jitter_sec=latency * 0.2)
+            elif record:
+                _ENV_SESSION = RecordingSession(record)
+        return _ENV_SESSION
+
+def replay_credentials() -> Dict[str, str]:
+    """再生時は本物の認証情報が無くても praw.Reddit を作れるようダミー値を返す"""
+    if os.getenv("REDDIT_REPLAY", "").strip():
+        return {"client_id": os.getenv("REDDIT_CLIENT_ID") or "replay",
+                "client_secret": os.getenv("REDDIT_CLIENT_SECRET") or "replay"}
+    return {}
+
+__all__ = ["RecordingSession", "ReplaySession", "session_from_env", "replay_credentials"]
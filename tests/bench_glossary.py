@@ -0,0 +1,162 @@
+# tests/bench_glossary.py
+# glossary.py / glossary_translator.py のオフライン・ベンチマーク（ネットワーク・APIキー不要）
+# - 計測項目: CSV読込, コンパイル, マスク/復元のスループット(comments/sec), ピークメモリ
+# - 入力: data/render_plan.json の quote_en + 合成コメント (1k/10k/100k件)
+#         glossary は実CSV(約1k語) + 合成語で水増しした 10k語
+# 実行例:
+#   python tests/bench_glossary.py --out bench_glossary.json
+#   python tests/bench_glossary.py --sizes 1000 --terms 1000 --legacy   # 旧regex版とも比較
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from glossary import Term, load_glossary, compile_glossary_matcher, compile_glossary_patterns, term_aliases
+from glossary_translator import mask_terms_batch, unmask_batch
+
+GLOSSARY_CSV = os.path.join(ROOT_DIR, "glossary_normalized.csv")
+RENDER_PLAN = os.path.join(ROOT_DIR, "data", "render_plan.json")
+
+FILLER = (
+    "i the a deck meta run this card is so good lol honestly pull rate energy retreat cost "
+    "damage attack wonder pick pack event tier list nerf buff every time draw turn ex"
+).split()
+KATAKANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン"
+
+MEASURE_MEMORY = True
+
+def _measure(fn: Callable[[], Any]) -> Tuple[Any, float, int | None]:
+    """
+    (戻り値, 経過秒, ピークメモリ[byte]) を返す。
+    tracemalloc は処理自体を大きく遅くするので、時間とメモリは別々の実行で測る。
+    """
+    t0 = time.perf_counter()
+    out = fn()
+    sec = time.perf_counter() - t0
+    if not MEASURE_MEMORY:
+        return out, sec, None
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, sec, peak
+
+def recorded_comments() -> List[str]:
+    if not os.path.exists(RENDER_PLAN):
+        return []
+    with open(RENDER_PLAN, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    return [it["quote_en"] for sc in plan.get("scenes", []) for it in sc.get("items", []) if it.get("quote_en")]
+
+def synthetic_terms(base: List[Term], n: int, rng: random.Random) -> List[Term]:
+    """実 glossary に架空のカード名/ワザ名を足して n 語にする"""
+    terms = list(base[:n])
+    while len(terms) < n:
+        name = "".join(rng.choice("bcdfghklmnprstvz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4))).capitalize()
+        if rng.random() < 0.3:
+            name += rng.choice([" EX", " ex", "-GX", " Strike", " Beam"])
+        ja = "".join(rng.choice(KATAKANA) for _ in range(rng.randint(3, 6)))
+        terms.append(Term(en=name, ja=ja, aliases=[], typ="synthetic"))
+    return terms
+
+def synthetic_comments(terms: List[Term], recorded: List[str], n: int, rng: random.Random) -> List[str]:
+    """録画コメントを混ぜつつ、語彙と用語をランダムに並べたコメントを n 件作る"""
+    out: List[str] = []
+    for i in range(n):
+        if recorded and i % 10 == 0:
+            out.append(recorded[(i // 10) % len(recorded)])
+            continue
+        words = [rng.choice(FILLER) for _ in range(rng.randint(6, 30))]
+        for _ in range(rng.randint(0, 3)):
+            t = rng.choice(terms)
+            words.insert(rng.randrange(len(words) + 1), rng.choice(term_aliases(t)))
+        out.append(" ".join(words))
+    return out
+
+def write_csv(terms: List[Term], path: str) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["en", "ja", "type", "aliases"])
+        for t in terms:
+            w.writerow([t.en, t.ja, t.typ, ";".join(t.aliases)])
+
+def run(sizes: List[int], term_counts: List[int], legacy: bool, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    base = load_glossary(GLOSSARY_CSV)
+    recorded = recorded_comments()
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_terms in term_counts:
+            terms = synthetic_terms(base, n_terms, rng)
+            csv_path = os.path.join(tmp, f"glossary_{n_terms}.csv")
+            write_csv(terms, csv_path)
+
+            loaded, sec, peak = _measure(lambda: load_glossary(csv_path))
+            results.append({"bench": "load", "terms": len(loaded), "sec": sec, "peak_bytes": peak})
+
+            matcher, sec, peak = _measure(lambda: compile_glossary_matcher(loaded))
+            results.append({"bench": "compile", "impl": "matcher", "terms": len(loaded), "sec": sec, "peak_bytes": peak})
+            impls = [("matcher", matcher)]
+            if legacy:
+                patterns, sec, peak = _measure(lambda: compile_glossary_patterns(loaded))
+                results.append({"bench": "compile", "impl": "regex", "terms": len(loaded), "sec": sec, "peak_bytes": peak})
+                impls.append(("regex", patterns))
+
+            for n in sizes:
+                comments = synthetic_comments(terms, recorded, n, rng)
+                for impl, pats in impls:
+                    (masked, maps), sec, peak = _measure(lambda: mask_terms_batch(comments, pats))
+                    results.append({
+                        "bench": "mask", "impl": impl, "terms": len(loaded), "comments": n,
+                        "sec": sec, "comments_per_sec": n / sec if sec else None, "peak_bytes": peak,
+                        "placeholders": sum(len(m) for m in maps),
+                    })
+                    _, sec, peak = _measure(lambda: unmask_batch(masked, maps))
+                    results.append({
+                        "bench": "unmask", "impl": impl, "terms": len(loaded), "comments": n,
+                        "sec": sec, "comments_per_sec": n / sec if sec else None, "peak_bytes": peak,
+                    })
+                    print(f"[i] terms={len(loaded)} comments={n} impl={impl} done", file=sys.stderr)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "recorded_comments": len(recorded),
+        },
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="コメント件数")
+    ap.add_argument("--terms", type=int, nargs="+", default=[1000, 10000], help="glossary の語数")
+    ap.add_argument("--legacy", action="store_true", help="旧 regex 版（compile_glossary_patterns）も計測する")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-memory", action="store_true", help="ピークメモリの計測（2回目の実行）を省く")
+    ap.add_argument("--out", help="結果JSONの出力先（省略時は標準出力）")
+    args = ap.parse_args()
+    MEASURE_MEMORY = not args.no_memory
+    report = run(args.sizes, args.terms, args.legacy, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[OK] -> {args.out}", file=sys.stderr)
+    else:
+        print(text)
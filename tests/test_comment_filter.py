@@ -0,0 +1,34 @@
+# tests/test_comment_filter.py
+import sys, os
+
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from comment_filter import CommentFilter, FilterRule, default_rules
+
+@pytest.mark.parametrize("pattern", [r"(spam)\s+\1", r"(?i)buy now", r"foo|(?s)bar"])
+def test_rules_that_break_when_combined_are_rejected_by_name(pattern):
+    """後方参照や全体フラグは1本にまとめると意味が変わる／コンパイルできないので、ルール名つきで弾く"""
+    with pytest.raises(ValueError, match="'bad'"):
+        CommentFilter(default_rules() + [FilterRule("bad", pattern)])
+
+def test_combined_compile_error_names_the_rule():
+    # 単体では正しいが、まとめた正規表現の内部グループ名と衝突する
+    with pytest.raises(ValueError, match="'clash'"):
+        CommentFilter(default_rules() + [FilterRule("clash", r"(?P<r0>x)")])
+
+def test_scoped_flags_escapes_and_named_backreferences_still_work():
+    f = CommentFilter(default_rules() + [
+        FilterRule("echo", r"(?P<w>\w+) (?P=w)"),
+        FilterRule("case", r"(?-i:SALE)", ignore_case=True),
+        FilterRule("literal", r"[\1]x|\\1"),
+    ])
+    assert f.reject_reason("u", "hey hey") == "echo"
+    assert f.reject_reason("u", "big SALE") == "case"
+    assert f.reject_reason("u", "big sale") is None
+    assert f.reject_reason("u", "\x01x") == "literal"
+    assert f.reject_reason("AutoModerator", "hello") is not None
+    assert f.reject_reason("u", "nice pull") is None
@@ -0,0 +1,50 @@
+# tests/test_comment_index.py
+import sys, os, time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from comment_index import CommentIndex
+from glossary import Term, compile_glossary_matcher
+
+def _post(sid, comments, title="T"):
+    top, *replies = comments
+    return {"submission_id": sid, "title": title, "permalink": f"/r/x/comments/{sid}/t/",
+            "threads": [{"top": top, "replies": replies}]}
+
+def _c(cid, body, score, age_days=0.0):
+    return {"id": cid, "author": "u", "body": body, "score": score,
+            "created_utc": time.time() - age_days * 86400, "permalink": f"/c/{cid}"}
+
+def test_ingest_upserts_and_keeps_fts_in_sync(tmp_path):
+    idx = CommentIndex(str(tmp_path / "comments.sqlite"))
+    idx.ingest(_post("p1", [_c("a", "Zero retreat is broken", 10), _c("b", "agreed, zero retreat", 3)]))
+    assert [h["id"] for h in idx.search("zero retreat")] == ["a", "b"]
+
+    # 再取得で score と本文が変わったら、行は増やさずに更新し、全文検索も新しい本文で引ける
+    assert idx.ingest(_post("p1", [_c("a", "Edited: misty is broken", 50), _c("b", "agreed, zero retreat", 3)])) == 2
+    assert idx.conn.execute("SELECT COUNT(*) FROM comments").fetchone()[0] == 2
+    assert [h["id"] for h in idx.search("zero retreat")] == ["b"]
+    hits = idx.search("misty")
+    assert [(h["id"], h["score"], h["submission_title"]) for h in hits] == [("a", 50, "T")]
+    idx.close()
+
+def test_search_filters_and_order(tmp_path):
+    idx = CommentIndex(str(tmp_path / "comments.sqlite"))
+    idx.ingest(_post("p1", [_c("old", "pikachu deck", 90, age_days=40), _c("new", "pikachu again", 5)]))
+    idx.ingest(_post("p2", [_c("other", "pikachu ex tips", 20, age_days=1)]))
+    assert [h["id"] for h in idx.search("pikachu")] == ["old", "other", "new"]
+    assert [h["id"] for h in idx.search("pikachu", order="new")] == ["new", "other", "old"]
+    assert [h["id"] for h in idx.search("pikachu", since_days=30)] == ["other", "new"]
+    assert [h["id"] for h in idx.search("pikachu", submission_id="p2")] == ["other"]
+    assert [h["id"] for h in idx.search("pikachu", limit=1)] == ["old"]
+    idx.close()
+
+def test_search_term_includes_aliases(tmp_path):
+    matcher = compile_glossary_matcher([Term(en="Starmie EX", ja="スターミーEX", aliases=["Starmie ex", "StarmieEX"])])
+    idx = CommentIndex(str(tmp_path / "comments.sqlite"))
+    idx.ingest(_post("p1", [_c("a", "Starmie EX is great", 9), _c("b", "starmieex spam", 4), _c("c", "starmie alone", 1)]))
+    assert [h["id"] for h in idx.search_term("スターミーEX", matcher=matcher)] == ["a", "b"]
+    assert [h["id"] for h in idx.search_term("starmie ex", matcher=matcher)] == ["a", "b"]
+    idx.close()
@@ -0,0 +1,82 @@
+# tests/test_comment_store.py
+import sys, os, json
+
+import msgpack
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from comment_store import CommentTable, load_post, save_post
+import fetch_all
+
+BASE = "https://www.reddit.com/r/PTCGP/comments/abc123/title/"
+
+POST = {
+    "submission_id": "abc123",
+    "title": "Favorite oldest meta?",
+    "permalink": BASE,
+    "fetched_at": 1700000000.5,
+    "params": {"max_threads": 50, "max_replies_per_thread": 50},
+    "threads": [
+        {
+            "top": {"id": "t1", "author": "ash", "body": "Mewtwo EX 🔥 is still fine", "score": 120,
+                    "created_utc": 1699990000.0, "permalink": f"{BASE}t1/"},
+            "replies": [
+                {"id": "r1", "author": "[deleted]", "body": "", "score": -3, "created_utc": None,
+                 "permalink": f"{BASE}r1/"},
+                {"id": "r2", "author": "ash", "body": "ミュウツー\nと\tカスミ", "score": 7,
+                 "created_utc": 1699990100.0, "permalink": "https://www.reddit.com/r/other/comments/zz/x/r2/"},
+            ],
+            "score": 123.6,
+        },
+        {
+            "top": {"id": "t2", "author": "misty", "body": "Starmie", "score": 0,
+                    "created_utc": 1699990200.0, "permalink": f"{BASE}t2/"},
+            "replies": [],
+            "score": 0.0,
+        },
+    ],
+}
+
+def test_msgpack_round_trip(tmp_path):
+    path = str(tmp_path / "raw" / "abc123.msgpack")
+    save_post(POST, path)
+    assert load_post(path) == POST
+    assert os.listdir(tmp_path / "raw") == ["abc123.msgpack"]
+
+    # 著者名は辞書で1回だけ、permalink は作れないものだけ保存する
+    table = CommentTable.from_post(POST)
+    assert table.author_names == ["ash", "[deleted]", "misty"]
+    assert table.permalink_overrides == {"r2": POST["threads"][0]["replies"][1]["permalink"]}
+    assert table.body(table.find("r2")) == "ミュウツー\nと\tカスミ"
+
+def test_reads_data_written_on_the_other_byte_order():
+    table = CommentTable.from_post(POST)
+    d = msgpack.unpackb(table.to_bytes(), raw=False)
+    other = "big" if sys.byteorder == "little" else "little"
+    swapped = {"byteorder": other}
+    for name in ("author_idx", "scores", "created", "body_offsets", "thread_starts", "thread_scores"):
+        arr = getattr(table, name)[:]
+        arr.byteswap()
+        swapped[name] = arr.tobytes()
+    data = msgpack.packb({**d, **swapped}, use_bin_type=True)
+    assert CommentTable.from_bytes(data).to_post() == POST
+
+def test_raw_cache_reads_legacy_json(tmp_path):
+    raw_dir = str(tmp_path)
+    with open(os.path.join(raw_dir, "abc123.json"), "w", encoding="utf-8") as f:
+        json.dump(POST, f, ensure_ascii=False)
+    assert fetch_all._load_raw("abc123", raw_dir).to_post() == POST
+
+    # msgpack があればそちらを優先する
+    save_post({**POST, "title": "new"}, os.path.join(raw_dir, "abc123.msgpack"))
+    assert fetch_all._load_raw("abc123", raw_dir).meta["title"] == "new"
+    assert fetch_all._load_raw("zzz999", raw_dir) is None
+
+def test_fresh_cache_is_returned_without_fetching(tmp_path):
+    raw_dir = str(tmp_path)
+    post = {**POST, "fetched_at": fetch_all.time.time()}
+    save_post(post, os.path.join(raw_dir, "abc123.msgpack"))
+    # 取得条件が同じで新しければ Reddit に触れずに dict で返す
+    assert fetch_all.fetch_post_threads_cached(BASE, raw_dir=raw_dir, max_age_sec=600, reddit=object()) == post
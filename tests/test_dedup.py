@@ -0,0 +1,57 @@
+# tests/test_dedup.py
+import pytest
+import sys, os
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from dedup import MAX_DISTANCE, collapse_comments, collapse_near_duplicates, normalize_body, simhash
+
+LONG = "honestly this card is the best pull in the whole set for sure"
+
+def _c(cid, body, score):
+    return {"id": cid, "author": "u", "body": body, "score": score}
+
+def _th(top, replies=()):
+    return {"top": top, "replies": list(replies), "score": top["score"]}
+
+def test_near_identical_long_bodies_share_a_band():
+    """句読点・大文字・URL だけ違う本文は同じ SimHash になり、score の高い方にまとまる"""
+    a = _c("a", LONG, 5)
+    b = _c("b", LONG.upper() + "!!! https://example.com/x", 9)
+    c = _c("c", "a completely different comment about energy acceleration decks", 1)
+    assert simhash(normalize_body(a["body"]).split()) == simhash(normalize_body(b["body"]).split())
+    out = collapse_comments([a, b, c])
+    assert [x["id"] for x in out] == ["b", "c"]
+    assert out[0]["dup_count"] == 2 and out[0]["dup_ids"] == ["a"]
+    assert "dup_count" not in out[1]
+
+def test_short_bodies_use_exact_match_and_empty_bodies_stay_apart():
+    comments = [_c("a", "this", 1), _c("b", "This!", 3), _c("c", "same", 2), _c("d", "", 4), _c("e", "🔥🔥", 5)]
+    out = collapse_comments(comments)
+    assert [(x["id"], x.get("dup_count", 1)) for x in out] == [("b", 2), ("c", 1), ("d", 1), ("e", 1)]
+
+def test_duplicate_threads_merge_into_the_higher_scored_one():
+    threads = [
+        _th(_c("t1", "first thread about mewtwo decks", 50), [_c("r1", "agreed", 4)]),
+        _th(_c("t2", LONG, 10), [_c("r2", "nice", 7), _c("r3", "lol same", 2)]),
+        _th(_c("t3", "an unrelated thread about trading", 30)),
+        _th(_c("t4", LONG + ".", 40), [_c("r4", "Nice!", 3), _c("r5", "congrats on the pull", 8)]),
+    ]
+    out = collapse_near_duplicates(threads)
+    # 残ったスレッドの並び順は保つ
+    assert [th["top"]["id"] for th in out] == ["t1", "t3", "t4"]
+    merged = out[2]
+    assert merged["top"]["dup_count"] == 2 and merged["top"]["dup_ids"] == ["t2"]
+    # 落ちたスレッドの返信は代表に移り、score 順に並べ直してからまとめ直す（"nice" と "Nice!" は1件に）
+    assert [(r["id"], r.get("dup_count", 1)) for r in merged["replies"]] == [("r5", 1), ("r2", 2), ("r3", 1)]
+    # 入力は書き換えない
+    assert [r["id"] for r in threads[3]["replies"]] == ["r4", "r5"]
+
+def test_max_distance_bounds():
+    collapse_comments([_c("a", LONG, 1)], max_distance=MAX_DISTANCE)
+    with pytest.raises(ValueError):
+        collapse_comments([_c("a", LONG, 1), _c("b", LONG, 2)], max_distance=MAX_DISTANCE + 1)
+    with pytest.raises(ValueError):
+        collapse_near_duplicates([_th(_c("a", LONG, 1))], max_distance=-1)
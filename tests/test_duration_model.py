@@ -0,0 +1,46 @@
+# tests/test_duration_model.py
+import sys, os, json
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import duration_model as dm
+
+# MPEG1 Layer III 128kbps 44.1kHz のフレーム（417 バイト、約 26ms）
+FRAME = bytes([0xFF, 0xFB, 0x90, 0x00]) + b"\0" * 413
+
+def _write_run(tmp_path, lengths, tag):
+    """render_plan.json と line_NNN.mp3 を1回分書く（前回の mp3 は main_b と同じく消す）"""
+    tts = tmp_path / "tts"
+    tts.mkdir(exist_ok=True)
+    for p in tts.glob("line_*.mp3"):
+        p.unlink()
+    items = []
+    for i, n in enumerate(lengths, 1):
+        (tts / f"line_{i:03d}.mp3").write_bytes(FRAME * (10 * n))
+        items.append({"text_ja": f"{tag}" + "あ" * n, "voice": "v"})
+    (tmp_path / "render_plan.json").write_text(json.dumps({"scenes": [{"items": items}]}), encoding="utf-8")
+
+def _load(tmp_path):
+    return dm.load_duration_model(str(tmp_path / "model.json"), str(tmp_path / "render_plan.json"),
+                                  str(tmp_path / "tts"), str(tmp_path / "samples.jsonl"))
+
+def test_samples_accumulate_across_runs(tmp_path):
+    _write_run(tmp_path, [5, 8, 12, 20, 30, 40], "a")
+    assert _load(tmp_path).samples == 6
+    # 同じ実行をもう一度読んでも増えない
+    assert _load(tmp_path).samples == 6
+    # 短い実行のあとも当てはめ直し、前回のサンプルも残る
+    _write_run(tmp_path, [6, 9, 15], "b")
+    model = _load(tmp_path)
+    assert model.samples == 9
+    assert len(dm.load_samples(str(tmp_path / "samples.jsonl"))) == 9
+    assert abs(model.predict("あ" * 20) - dm.mp3_duration(str(tmp_path / "tts" / "line_003.mp3")) * 20 / 15) < 0.5
+
+def test_mismatched_run_keeps_the_saved_model(tmp_path):
+    _write_run(tmp_path, [5, 8, 12, 20], "a")
+    before = _load(tmp_path)
+    (tmp_path / "tts" / "line_004.mp3").unlink()
+    after = _load(tmp_path)
+    assert after.samples == before.samples and after.coef == before.coef
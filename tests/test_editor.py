@@ -0,0 +1,80 @@
+# tests/test_editor.py
+import sys, os, json, threading, time
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import editor
+
+MAP_DELAY_SEC = 0.2
+
+def _threads(n):
+    body = "This deck is really strong because the energy curve works out every single game. " * 3
+    return [{
+        "top": {"id": f"t{i}", "body": body, "score": 1000 - i},
+        "replies": [{"id": f"t{i}r{j}", "body": body, "score": 100 - j} for j in range(3)],
+    } for i in range(n)]
+
+class FakeClient:
+    """chat.completions.create だけを持つ偽クライアント。候補出しは MAP_DELAY_SEC 待ち、同時実行数を記録する"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.map_calls = 0
+        self.reduce_users = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _reply(self, body):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(body)))])
+
+    def create(self, model, messages, **kwargs):
+        user = json.loads(messages[1]["content"])
+        if messages[0]["content"] == editor.MAP_SYSTEM_PROMPT:
+            with self.lock:
+                self.map_calls += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            time.sleep(MAP_DELAY_SEC)
+            with self.lock:
+                self.active -= 1
+            ids = [row["top"]["id"] for row in user["threads"]]
+            # 入力に無い ID と重複を混ぜる（捨てられるべきもの）
+            items = [{"id": "bogus", "score": 10}] + [{"id": i, "score": 5, "summary": "angle"} for i in ids[:2]]
+            return self._reply({"shortlist": items + items[1:2]})
+        self.reduce_users.append(user)
+        top = user["threads"][0]["top"]["id"]
+        return self._reply({"scenes": [
+            {"scene_title": "見出し", "comment_order": [top, "bogus", f"{top}r0"]},
+            {"scene_title": "空", "comment_order": ["nope"]},
+        ]})
+
+def test_map_reduce_runs_shortlists_in_parallel_and_validates_ids(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(editor, "_get_openai_client", lambda: client)
+    threads = _threads(40)
+
+    t0 = time.perf_counter()
+    plan = editor.plan_script_with_llm("Title", threads, input_token_budget=1500, cache="off", max_workers=16)
+    elapsed = time.perf_counter() - t0
+
+    assert client.map_calls > 2
+    assert client.max_active > 1
+    assert elapsed < client.map_calls * MAP_DELAY_SEC
+    # まとめのプロンプトには候補に残った実在のスレッドだけが入る
+    assert len(client.reduce_users) == 1
+    reduce_ids = [row["top"]["id"] for row in client.reduce_users[0]["threads"]]
+    assert reduce_ids and "bogus" not in reduce_ids and len(reduce_ids) == len(set(reduce_ids))
+    assert set(reduce_ids) <= {th["top"]["id"] for th in threads}
+    # 知らない ID は落とされ、空になったシーンは消える
+    assert plan == {"scenes": [{"scene_title": "見出し", "comment_order": [reduce_ids[0], f"{reduce_ids[0]}r0"]}]}
+
+def test_shard_threads_skips_a_thread_that_does_not_fit():
+    threads = [{"top": {"id": f"t{i}", "body": "great card", "score": 100}, "replies": []} for i in range(4)]
+    threads[1] = {"top": {"id": "huge", "body": "word " * 4000, "score": 100}, "replies": []}
+    shards = editor._shard_threads(threads, 100, "gpt-4o-mini")
+    ids = [th["top"]["id"] for sh, _ in shards for th in sh]
+    assert ids == ["t0", "t2", "t3"]
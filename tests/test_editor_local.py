@@ -0,0 +1,97 @@
+# tests/test_editor_local.py
+import sys, os, itertools, math, random
+from types import SimpleNamespace
+
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import editor
+
+NO_GLOSSARY = SimpleNamespace(finditer=lambda text: iter(()), ja=[])
+
+def _body(tag, n_words):
+    # スレッド・コメントごとに語彙が重ならない本文（重複による割り引きが入らないように）
+    return " ".join(f"{tag}x{k}" for k in range(n_words))
+
+def _threads(seed, n=5):
+    rnd = random.Random(seed)
+    return [{
+        "top": {"id": f"t{t}", "body": _body(f"t{t}", rnd.randint(3, 30)), "score": rnd.randint(0, 500)},
+        "replies": [{"id": f"t{t}r{r}", "body": _body(f"t{t}r{r}", rnd.randint(2, 25)), "score": rnd.randint(0, 200)}
+                    for r in range(rnd.randint(0, 3))],
+    } for t in range(n)]
+
+def _brute_force_best(threads, capacity):
+    groups = [[(None, 0.0)] + [(math.ceil(cost / editor._KNAPSACK_UNIT), value)
+                               for cost, value, _ in editor._thread_options(th, 4, 0.4)] for th in threads]
+    best = 0.0
+    for combo in itertools.product(*groups):
+        weight = sum(w for w, _ in combo if w is not None)
+        if weight <= capacity:
+            best = max(best, sum(v for _, v in combo))
+    return best
+
+def _plan_value(plan, threads):
+    total = 0.0
+    for sc in plan["scenes"]:
+        th = next(th for th in threads if th["top"]["id"] == sc["comment_order"][0])
+        total += next(v for _, v, ids in editor._thread_options(th, 4, 0.4) if ids == sc["comment_order"])
+    return total
+
+@pytest.mark.parametrize("seed", range(8))
+def test_local_planner_matches_brute_force(seed):
+    """各スレッドの選択肢（なし／トップのみ／返信を1件ずつ追加）の全組み合わせと同じ最適値になること"""
+    threads = _threads(seed)
+    target_sec, rate = 40, 5.0
+    plan = editor.plan_script_locally("T", threads, target_duration_sec=target_sec, reading_chars_per_sec=rate,
+                                      matcher=NO_GLOSSARY)
+    capacity = int(max(60, target_sec * rate)) // editor._KNAPSACK_UNIT
+    assert _plan_value(plan, threads) == pytest.approx(_brute_force_best(threads, capacity))
+    # シーンは入力（score）順のまま
+    order = [int(sc["comment_order"][0][1:]) for sc in plan["scenes"]]
+    assert order == sorted(order)
+
+def test_local_planner_keeps_best_top_when_nothing_fits():
+    threads = [{"top": {"id": "t0", "body": _body("t0", 200), "score": 10}, "replies": []}]
+    plan = editor.plan_script_locally("T", threads, target_duration_sec=1, matcher=NO_GLOSSARY)
+    assert plan == {"scenes": [{"scene_title": "みんなの声", "comment_order": ["t0"]}]}
+
+def test_plan_script_falls_back_to_local_plan(monkeypatch):
+    def broken_client():
+        raise RuntimeError("API down")
+
+    monkeypatch.setattr(editor, "_get_openai_client", broken_client)
+    monkeypatch.setattr("glossary.load_compiled_glossary", lambda *a, **k: NO_GLOSSARY)
+    threads = _threads(0)
+    plan = editor.plan_script("T", threads, target_duration_sec=30, mode="llm", cache="off")
+    assert plan == editor.plan_script_locally("T", threads, target_duration_sec=30, matcher=NO_GLOSSARY)
+
+def test_plan_script_does_not_fall_back_on_cache_only_miss(monkeypatch, tmp_path):
+    monkeypatch.setattr(editor, "_get_openai_client", lambda: pytest.fail("cache-only must not call the model"))
+    with pytest.raises(FileNotFoundError):
+        editor.plan_script("T", _threads(0), mode="llm", cache="only", cache_dir=str(tmp_path))
+
+def test_budget_ignores_small_reading_speed_drift():
+    """校正した読み上げ速度が実行ごとに少しずれても、プランのキャッシュキー（budget_chars）は変わらない"""
+    budgets = {editor._budget_chars(180, 4.6 * f) for f in (0.97, 0.99, 1.0, 1.01, 1.03)}
+    assert budgets == {810}
+
+@pytest.mark.parametrize("kwargs", [{"cache": "sometimes"}, {"input_token_budget": 100},
+                                    {"input_token_budget": 8000, "model": "gpt-4"}])
+def test_plan_script_does_not_hide_bad_settings(monkeypatch, kwargs):
+    monkeypatch.setattr(editor, "_get_openai_client", lambda: pytest.fail("bad settings must not call the model"))
+    with pytest.raises(editor.PlanConfigError):
+        editor.plan_script("T", _threads(0), mode="llm", **{"cache": "off", **kwargs})
+
+def test_count_tokens_falls_back_when_tiktoken_cannot_load(monkeypatch):
+    """tiktoken の BPE ファイルが取れない（オフライン等）ときは文字数からの見積もりに切り替える"""
+    def offline(*args, **kwargs):
+        raise OSError("network is unreachable")
+
+    monkeypatch.setitem(sys.modules, "tiktoken", SimpleNamespace(encoding_for_model=offline, get_encoding=offline))
+    monkeypatch.setattr(editor, "_ENCODINGS", {})
+    assert editor.count_tokens("abcdefgh", "some-model") == 2
+    assert editor.count_tokens("あいう", "some-model") == 3
@@ -0,0 +1,77 @@
+# tests/test_fetch_all.py
+import sys, os
+
+import praw
+import pytest
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import fetch_all
+
+def _comment(cid, parent, score, depth, replies=None):
+    return {"kind": "t1", "data": {
+        "id": cid, "name": f"t1_{cid}", "parent_id": parent, "link_id": "t3_abc", "score": score,
+        "depth": depth, "body": f"comment {cid}", "author": f"user_{cid}", "created_utc": 100,
+        "permalink": f"/r/x/comments/abc/t/{cid}/", "replies": replies or "",
+    }}
+
+def _more(mid, parent, depth, children):
+    return {"kind": "more", "data": {
+        "id": mid, "name": f"t1_{mid}", "parent_id": parent, "depth": depth,
+        "count": len(children), "children": children,
+    }}
+
+def _listing(children):
+    return {"kind": "Listing", "data": {"children": children, "after": None, "before": None}}
+
+# a(50) と b(40) の下に返信の塊、トップレベルにも塊がひとつ
+TREE = [
+    _listing([{"kind": "t3", "data": {"id": "abc", "name": "t3_abc", "title": "T", "subreddit": "x",
+                                      "permalink": "/r/x/comments/abc/t/", "num_comments": 9}}]),
+    _listing([
+        _comment("b", "t3_abc", 40, 0, _listing([_more("mb", "t1_b", 1, ["b1"])])),
+        _comment("a", "t3_abc", 50, 0, _listing([_comment("a1", "t1_a", 5, 1), _more("ma", "t1_a", 1, ["a2", "a3"])])),
+        _more("mtop", "t3_abc", 0, ["d", "e"]),
+    ]),
+]
+MORE = {
+    "d,e": [_comment("d", "t3_abc", 3, 0), _comment("e", "t3_abc", 2, 0)],
+    "a2,a3": [_comment("a2", "t1_a", 9, 1), _comment("a3", "t1_a", 1, 1)],
+    "b1": [_comment("b1", "t1_b", 7, 1)],
+}
+
+@pytest.fixture
+def submission():
+    """ネットワークを使わない praw の submission。展開した塊の順番を calls に記録する"""
+    reddit = praw.Reddit(client_id="x", client_secret="y", user_agent="test", check_for_updates=False)
+    calls = []
+
+    def request(method, path, params=None, data=None, **kwargs):
+        if "morechildren" in path:
+            calls.append(data["children"])
+            return {"json": {"data": {"things": MORE[data["children"]]}}}
+        return TREE
+
+    reddit._core.request = request
+    sub = reddit.submission(id="abc")
+    sub.comment_sort = "top"
+    sub.comments  # ツリーを読み込む
+    return sub, calls
+
+def test_expand_more_comments_follows_stub_priority(submission):
+    """トップレベルの塊 → 親の score が高い塊の順に展開し、予算を超えた分は読まない"""
+    sub, calls = submission
+    stats = fetch_all.expand_more_comments(sub, max_threads=10, max_requests=2)
+    assert calls == ["d,e", "a2,a3"]
+    assert stats["requests"] == 2 and stats["skipped"] == 1 and stats["skipped_comments"] == 1
+    ids = {c.id for c in sub.comments.list()}
+    assert {"d", "e", "a2", "a3"} <= ids and "b1" not in ids
+
+def test_expand_more_comments_skips_stubs_outside_top_threads(submission):
+    """有効なトップレベルが max_threads 件そろっていれば、トップレベルの塊と圏外スレッドの塊は読まない"""
+    sub, calls = submission
+    stats = fetch_all.expand_more_comments(sub, max_threads=1)
+    assert calls == ["a2,a3"]
+    assert stats["skipped"] == 2 and stats["skipped_comments"] == 3
@@ -0,0 +1,42 @@
+# tests/test_glossary.py
+import sys, os
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from glossary import Term, compile_glossary_patterns, compile_glossary_matcher
+
+TERMS = [
+    Term(en="Mew", ja="ミュウ", aliases=[]),
+    Term(en="Mewtwo EX", ja="ミュウツーEX", aliases=[]),
+    Term(en="Mr. Mime", ja="バリヤード", aliases=[]),
+    Term(en="Farfetch’d", ja="カモネギ", aliases=[]),
+    Term(en="Starmie EX", ja="スターミーEX", aliases=["Starmie ex"]),
+]
+
+def _regex_sub(text, patterns):
+    for pat, ja in patterns:
+        text = pat.sub(ja, text)
+    return text
+
+def test_matcher_agrees_with_regex_patterns():
+    """1パス照合の結果が従来の regex ループと一致すること"""
+    patterns = compile_glossary_patterns(TERMS)
+    matcher = compile_glossary_matcher(TERMS)
+    samples = [
+        "Mewtwo EX and Mew are both good",
+        "MEWTWOEX is fine but mewtwo   ex is better",
+        "Mr Mime, mr. mime and MrMime",
+        "Farfetch'd / Farfetchd / farfetch’d",
+        "Starmie\nEX or starmieex?",
+        "Mewx and xMew and Mew_ are not terms",
+        "",
+    ]
+    for text in samples:
+        assert matcher.sub(text) == _regex_sub(text, patterns), text
+
+def test_matcher_longest_match_and_boundaries():
+    matcher = compile_glossary_matcher(TERMS)
+    hits = [(text_span, matcher.en[idx]) for *text_span, idx in matcher.finditer("Mewtwo EX, Mew ex?")]
+    assert hits == [([0, 9], "Mewtwo EX"), ([11, 14], "Mew")]
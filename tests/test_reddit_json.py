@@ -0,0 +1,61 @@
+# tests/test_reddit_json.py
+import sys, os
+
+import httpx
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from reddit_json import MORECHILDREN_MAX, RedditJSONClient, expand_all, fetch_post_threads_json
+
+SID = "abc123"
+N_TOPS = 250
+INLINE = 10  # 投稿本体のレスポンスに含まれるトップレベル。残りは "load more" の塊
+
+def _comment(i):
+    return {"kind": "t1", "data": {
+        "id": f"c{i}", "parent_id": f"t3_{SID}", "author": f"user{i}", "body": f"comment {i}",
+        "score": N_TOPS - i, "created_utc": 100, "permalink": f"/r/x/comments/{SID}/t/c{i}/", "replies": "",
+    }}
+
+def _mock_client():
+    """MockTransport で応答する RedditJSONClient と、/api/morechildren に渡された ID のリスト"""
+    batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("access_token"):
+            return httpx.Response(200, json={"access_token": "t", "expires_in": 3600})
+        if request.url.path == f"/comments/{SID}":
+            more = {"kind": "more", "data": {"children": [f"c{i}" for i in range(INLINE, N_TOPS)],
+                                             "count": N_TOPS - INLINE, "parent_id": f"t3_{SID}", "depth": 0}}
+            return httpx.Response(200, json=[
+                {"data": {"children": [{"data": {"title": "T", "permalink": f"/r/x/comments/{SID}/t/"}}]}},
+                {"data": {"children": [_comment(i) for i in range(INLINE)] + [more]}},
+            ])
+        if request.url.path == "/api/morechildren":
+            ids = request.url.params["children"].split(",")
+            batches.append(ids)
+            return httpx.Response(200, json={"json": {"data": {"things": [_comment(int(i[1:])) for i in ids]}}})
+        return httpx.Response(404)
+
+    return RedditJSONClient("id", "secret", transport=httpx.MockTransport(handler)), batches
+
+def test_morechildren_is_batched():
+    """"load more" の ID は MORECHILDREN_MAX 件ずつまとめて問い合わせる"""
+    client, batches = _mock_client()
+    _, things = client.comments(SID)
+    comments, stats = expand_all(client, SID, things)
+    assert [len(b) for b in batches] == [100, 100, 40]
+    assert all(len(b) <= MORECHILDREN_MAX for b in batches)
+    assert len(comments) == N_TOPS
+    assert stats == {"requests": 3, "skipped": 0, "skipped_comments": 0}
+    assert client.requests == 4  # 投稿本体 + morechildren 3回
+
+def test_more_budget_stops_expansion_and_reports_the_rest():
+    client, batches = _mock_client()
+    res = fetch_post_threads_json(SID, max_threads=5, client=client, more_budget=1)
+    assert len(batches) == 1
+    assert res["expansion"] == {"requests": 1, "skipped": 1, "skipped_comments": N_TOPS - INLINE - 100}
+    assert [th["top"]["id"] for th in res["threads"]] == [f"c{i}" for i in range(5)]
+    assert res["filter_stats"]["checked"] == INLINE + 100
@@ -0,0 +1,44 @@
+# tests/test_reddit_replay.py
+import sys, os, gzip
+from json import dumps
+
+import requests
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from reddit_replay import REPLAY_TOKEN, RecordingSession, ReplaySession
+
+TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+LISTING_URL = "https://oauth.reddit.com/comments/abc"
+
+def _fake_network(self, method, url, params=None, data=None, json=None, **kwargs):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers["content-type"] = "application/json"
+    resp.encoding = "utf-8"
+    if url == TOKEN_URL:
+        body = {"access_token": "REAL-SECRET", "refresh_token": "REAL-REFRESH", "expires_in": 3600}
+    else:
+        body = [{"kind": "Listing", "data": {"children": []}}]
+    resp._content = dumps(body).encode("utf-8")
+    return resp
+
+def test_recording_redacts_tokens_and_credentials(tmp_path, monkeypatch):
+    monkeypatch.setattr(requests.Session, "request", _fake_network)
+    path = str(tmp_path / "post.json.gz")
+    rec = RecordingSession(path)
+    rec.request("POST", TOKEN_URL, data={"grant_type": "password", "username": "me", "password": "hunter2"})
+    rec.request("GET", LISTING_URL, params={"limit": 5})
+    rec.save()
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        raw = f.read()
+    for secret in ("REAL-SECRET", "REAL-REFRESH", "hunter2", '"me"'):
+        assert secret not in raw
+
+    replay = ReplaySession(path)
+    token = replay.request("POST", TOKEN_URL, data={"grant_type": "password", "username": "x", "password": "y"})
+    assert token.json()["access_token"] == REPLAY_TOKEN and token.json()["expires_in"] == 3600
+    assert replay.request("GET", LISTING_URL, params={"limit": 5}).json()[0]["kind"] == "Listing"
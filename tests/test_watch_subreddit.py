@@ -0,0 +1,41 @@
+# tests/test_watch_subreddit.py
+import sys, os, threading
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from watch_subreddit import enqueue_candidates, pop_next_candidate
+
+def test_pop_takes_highest_rank_then_oldest(tmp_path):
+    q = str(tmp_path / "queue.jsonl")
+    assert pop_next_candidate(q) is None
+    enqueue_candidates([{"id": "a", "rank": 5}, {"id": "b", "rank": 9}], 1, q)
+    enqueue_candidates([{"id": "c", "rank": 9}, {"id": "d", "rank": 50}], 2, q)
+    assert [pop_next_candidate(q)["id"] for _ in range(4)] == ["d", "b", "c", "a"]
+    assert pop_next_candidate(q) is None
+
+def test_concurrent_enqueue_and_pop_lose_nothing(tmp_path):
+    """巡回の追加と取り出しが同時に走っても、候補が消えたり二重に取り出されたりしない"""
+    q = str(tmp_path / "queue.jsonl")
+    got = []
+
+    def producer(tag):
+        for i in range(100):
+            enqueue_candidates([{"id": f"{tag}{i}", "rank": i}], 0, q)
+
+    def consumer():
+        for _ in range(150):
+            c = pop_next_candidate(q)
+            if c:
+                got.append(c["id"])
+
+    threads = [threading.Thread(target=producer, args=("a",)), threading.Thread(target=producer, args=("b",)),
+               threading.Thread(target=consumer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    while (c := pop_next_candidate(q)) is not None:
+        got.append(c["id"])
+    assert sorted(got) == sorted([f"a{i}" for i in range(100)] + [f"b{i}" for i in range(100)])
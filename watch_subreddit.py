@@ -0,0 +1,237 @@
+# watch_subreddit.py
+# r/PTCGP を定期的に巡回し、動画にできそうな投稿の候補キューを作る常駐スクリプト。
+# - hot / rising / top(day) を一定間隔で取得
+# - 一度キューに入れた投稿は data/watch/seen.bin（base36 ID を整数にした配列）で除外
+# - 追跡中の候補はコメント増加速度(件/時)とスコアで順位付けし、閾値を超えたものだけ
+#   data/watch/queue.jsonl に追加（--fetch で fetch_post_threads_cached の事前取得も行う）
+# - キューの読み書きは queue.jsonl.lock の排他ロック（Linux/macOS は fcntl、Windows は msvcrt）の中で行う
+#   （巡回中の追加と main_b の取り出しが競合しないように）
+# main_b.py は REDDIT_POST_URL が未設定なら、このキューで順位が最も高い候補を使う。
+# 実行: python watch_subreddit.py --interval 300
+import argparse
+import heapq
+import json
+import math
+import os
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from fetch_all import TokenBucket, fetch_post_threads_cached, make_reddit
+
+WATCH_DIR = os.path.join("data", "watch")
+SEEN_PATH = os.path.join(WATCH_DIR, "seen.bin")
+CANDIDATES_PATH = os.path.join(WATCH_DIR, "candidates.json")
+QUEUE_PATH = os.path.join(WATCH_DIR, "queue.jsonl")
+
+class SeenSet:
+    """キュー投入済みの submission ID。base36 の ID を整数にし、8バイト/件で保存する"""
+
+    def __init__(self, path: str = SEEN_PATH):
+        self.path = path
+        self._ids: set[int] = set()
+        if os.path.exists(path):
+            arr = array("Q")
+            with open(path, "rb") as f:
+                arr.frombytes(f.read())
+            self._ids = set(arr)
+
+    def __contains__(self, sid: str) -> bool:
+        return int(sid, 36) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, sid: str) -> None:
+        self._ids.add(int(sid, 36))
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            array("Q", sorted(self._ids)).tofile(f)
+        os.replace(tmp, self.path)
+
+def _rank(c: Dict[str, Any]) -> float:
+    # コメント増加速度を主に、スコアは平方根で効かせる（大型投稿ばかりにならないように）
+    return c["velocity"] + 2.0 * math.sqrt(max(0, c["score"]))
+
+class CandidateTracker:
+    """
+    追跡中の候補投稿。巡回のたびに num_comments の差分から増加速度（件/時）を更新する。
+    初回は投稿からの経過時間で割った平均速度を使う。
+    """
+
+    def __init__(self, path: str = CANDIDATES_PATH):
+        self.path = path
+        self.items: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.items = json.load(f)
+
+    def observe(self, s: Any, now: float) -> Dict[str, Any]:
+        prev = self.items.get(s.id)
+        n = int(getattr(s, "num_comments", 0) or 0)
+        if prev is None:
+            age_h = max((now - float(s.created_utc)) / 3600.0, 0.25)
+            velocity = n / age_h
+            first_seen = now
+        else:
+            dt_h = max((now - prev["last_seen"]) / 3600.0, 1e-6)
+            # 直近の差分と前回の値をならす（1回の巡回のぶれを抑える）
+            velocity = 0.5 * prev["velocity"] + 0.5 * max(0, n - prev["num_comments"]) / dt_h
+            first_seen = prev["first_seen"]
+        item = {
+            "id": s.id,
+            "title": s.title,
+            "url": f"https://www.reddit.com{s.permalink}",
+            "created_utc": float(s.created_utc),
+            "score": int(getattr(s, "score", 0) or 0),
+            "num_comments": n,
+            "velocity": velocity,
+            "first_seen": first_seen,
+            "last_seen": now,
+        }
+        item["rank"] = _rank(item)
+        self.items[s.id] = item
+        return item
+
+    def expire(self, now: float, max_age_hours: float) -> int:
+        old = [sid for sid, c in self.items.items() if now - c["created_utc"] > max_age_hours * 3600]
+        for sid in old:
+            del self.items[sid]
+        return len(old)
+
+    def pop_ready(self, min_comments: int, min_rank: float, limit: int) -> List[Dict[str, Any]]:
+        """閾値を超えた候補を順位の高い順に最大 limit 件取り出す"""
+        ready = [c for c in self.items.values() if c["num_comments"] >= min_comments and c["rank"] >= min_rank]
+        picked = heapq.nlargest(limit, ready, key=lambda c: c["rank"])
+        for c in picked:
+            del self.items[c["id"]]
+        return picked
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+@contextmanager
+def _queue_lock(queue_path: str = QUEUE_PATH) -> Iterator[None]:
+    """
+    キューの排他ロック。追加（poll_once）と取り出し（pop_next_candidate）の両方がこの中で読み書きする。
+    queue.jsonl 自体は os.replace で置き換わるので、ロックは別ファイル（queue.jsonl.lock）に掛ける
+    """
+    os.makedirs(os.path.dirname(queue_path) or ".", exist_ok=True)
+    with open(f"{queue_path}.lock", "a+") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            # msvcrt.locking は現在位置から1バイトを固定する。LK_LOCK は10回で諦めるので自前で待つ
+            lock.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+def enqueue_candidates(picked: List[Dict[str, Any]], now: float, queue_path: str = QUEUE_PATH) -> None:
+    """候補をキューの末尾に追加する"""
+    with _queue_lock(queue_path):
+        with open(queue_path, "a", encoding="utf-8") as f:
+            for c in picked:
+                f.write(json.dumps({**c, "enqueued_at": now}, ensure_ascii=False) + "\n")
+
+def pop_next_candidate(queue_path: str = QUEUE_PATH) -> Dict[str, Any] | None:
+    """
+    キューで順位（rank）が最も高い候補を取り出す。同順位なら先に投入されたもの。空なら None。
+    巡回をまたいでも順位で選ぶ（投入順の FIFO ではない）
+    """
+    with _queue_lock(queue_path):
+        if not os.path.exists(queue_path):
+            return None
+        with open(queue_path, "r", encoding="utf-8") as f:
+            lines = [ln for ln in f if ln.strip()]
+        if not lines:
+            return None
+        items = [json.loads(ln) for ln in lines]
+        best = max(range(len(items)), key=lambda i: (items[i].get("rank", 0.0), -i))
+        tmp = f"{queue_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines[:best] + lines[best + 1:])
+        os.replace(tmp, queue_path)
+        return items[best]
+
+def poll_once(reddit, subreddit: str, tracker: CandidateTracker, seen: SeenSet, args) -> List[Dict[str, Any]]:
+    now = time.time()
+    sub = reddit.subreddit(subreddit)
+    listings = [sub.hot(limit=args.limit), sub.rising(limit=args.limit), sub.top(time_filter="day", limit=args.limit)]
+    observed = set()
+    for listing in listings:
+        for s in listing:
+            if s.id in observed or s.id in seen or getattr(s, "stickied", False):
+                continue
+            observed.add(s.id)
+            tracker.observe(s, now)
+    expired = tracker.expire(now, args.max_age_hours)
+
+    picked = tracker.pop_ready(args.min_comments, args.min_rank, args.max_enqueue)
+    if picked:
+        enqueue_candidates(picked, now)
+        for c in picked:
+            seen.add(c["id"])
+    tracker.save()
+    seen.save()
+    print(f"[i] observed={len(observed)} tracking={len(tracker.items)} expired={expired} enqueued={len(picked)}")
+    for c in picked:
+        print(f"    + {c['rank']:.1f}  {c['title'][:70]}  {c['url']}")
+    return picked
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--subreddit", default="PTCGP")
+    ap.add_argument("--interval", type=float, default=300, help="巡回間隔（秒）")
+    ap.add_argument("--limit", type=int, default=50, help="各一覧から取得する件数")
+    ap.add_argument("--min-comments", type=int, default=80, help="キューに入れる最低コメント数")
+    ap.add_argument("--min-rank", type=float, default=40.0, help="キューに入れる最低順位スコア")
+    ap.add_argument("--max-enqueue", type=int, default=5, help="1回の巡回でキューに入れる最大件数")
+    ap.add_argument("--max-age-hours", type=float, default=48, help="これより古い投稿は追跡をやめる")
+    ap.add_argument("--fetch", action="store_true", help="キューに入れた投稿を data/raw/ に事前取得する")
+    ap.add_argument("--once", action="store_true", help="1回だけ巡回して終了")
+    args = ap.parse_args()
+
+    reddit = make_reddit(TokenBucket(30))  # 巡回は控えめな予算で
+    tracker = CandidateTracker()
+    seen = SeenSet()
+    while True:
+        try:
+            picked = poll_once(reddit, args.subreddit, tracker, seen, args)
+            if args.fetch:
+                for c in picked:
+                    fetch_post_threads_cached(c["url"], reddit=reddit)
+        except Exception as e:
+            print(f"[!] 巡回に失敗: {e}")
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()